@@ -7,6 +7,7 @@ import logging
 from config import settings, apply_flask_config, load_dotenv_if_present
 from src.logs.config import setup_logging
 from src.bot.api import init_bot
+from src.routers.dms.services import init_http_client
 
 load_dotenv_if_present()
 
@@ -53,8 +54,12 @@ def create_app() -> Flask:
     app.register_blueprint(dms_bp)
     app.register_blueprint(export_bp)
 
+    init_http_client(app)
     init_bot(app)
 
+    from src.jobs.catalog import init_catalog_crawl
+    init_catalog_crawl()
+
     @app.get("/health")
     def health():
         log.debug("health ping")
@@ -0,0 +1,15 @@
+# asgi.py
+"""
+ASGI-точка входа (опциональный режим, см. server.sh: SERVER_MODE=asgi).
+
+/api/* прокси DMS обслуживаются асинхронно (httpx.AsyncClient на event loop),
+всё остальное — auth/admin/export/bot — тем же Flask-приложением через WsgiToAsgi.
+
+Запуск: gunicorn -w 1 -k uvicorn.workers.UvicornWorker asgi:app
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from src.routers.dms.asgi import AsyncDmsProxy
+
+app = AsyncDmsProxy(WsgiToAsgi(flask_app))
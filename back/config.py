@@ -43,6 +43,12 @@ def env_int(key: str, default: int = 0) -> int:
     except ValueError:
         return default
 
+def env_float(key: str, default: float = 0.0) -> float:
+    try:
+        return float(os.environ.get(key, str(default)))
+    except ValueError:
+        return default
+
 def env_list(key: str, default: Optional[List[str]] = None, sep: str = ",") -> List[str]:
     raw = os.environ.get(key)
     if not raw:
@@ -72,11 +78,26 @@ class BaseConfig:
     SQLALCHEMY_POOL_SIZE: int = env_int("SQLALCHEMY_POOL_SIZE", 10)
     SQLALCHEMY_MAX_OVERFLOW: int = env_int("SQLALCHEMY_MAX_OVERFLOW", 20)
 
+    # Redis (общий кэш/блокировки между воркерами; пусто — отключено)
+    REDIS_URL: str = env_str("REDIS_URL", "")
+    REDIS_SOCKET_TIMEOUT: float = env_float("REDIS_SOCKET_TIMEOUT", 0.5)
+    REDIS_RETRY_SEC: int = env_int("REDIS_RETRY_SEC", 30)
+
     # Auth / JWT
     JWT_SECRET: str = env_str("JWT_SECRET", "change_me_in_prod")
     JWT_ALG: str = env_str("JWT_ALG", "HS256")
     JWT_ACCESS_EXPIRES_MIN: int = env_int("JWT_ACCESS_EXPIRES_MIN", 60)     # 60 минут
     JWT_REFRESH_EXPIRES_DAYS: int = env_int("JWT_REFRESH_EXPIRES_DAYS", 30) # 30 дней
+    # Кэш пользователя (is_active/is_admin) для login_required/admin_required
+    AUTH_USER_CACHE_TTL_SEC: int = env_int("AUTH_USER_CACHE_TTL_SEC", 60)
+    # bcrypt: cost (при смене хэши обновляются при входе) и отдельный ограниченный пул.
+    # workers + queue всегда меньше потоков gthread (не больше половины GUNICORN_THREADS):
+    # ждущие bcrypt запросы держат поток, остальные потоки остаются прокси /api/*
+    AUTH_BCRYPT_ROUNDS: int = env_int("AUTH_BCRYPT_ROUNDS", 12)
+    AUTH_BCRYPT_WORKERS: int = env_int("AUTH_BCRYPT_WORKERS", 2)
+    AUTH_BCRYPT_QUEUE: int = env_int("AUTH_BCRYPT_QUEUE", 2)       # сверх этого — сразу 429
+    AUTH_BCRYPT_WAIT_SEC: float = env_float("AUTH_BCRYPT_WAIT_SEC", 3.0)
+    GUNICORN_THREADS: int = env_int("GUNICORN_THREADS", 8)         # --threads из server.sh
 
     # CORS
     CORS_ALLOW_ORIGINS: List[str] = field(default_factory=lambda: env_list("CORS_ALLOW_ORIGINS", ["http://localhost:5173","http://127.0.0.1:5173","http://localhost:3000"]))
@@ -84,13 +105,96 @@ class BaseConfig:
 
     # Бот (Playwright) — если нужен
     BOT_HEADLESS: bool = env_bool("BOT_HEADLESS", False)
+    BOT_AUTOSTART: bool = env_bool("BOT_AUTOSTART", True)
     BOT_PROFILE_DIR: str = env_str("BOT_PROFILE_DIR", ".pw_profile")
     BOT_START_URL: str = env_str("BOT_START_URL")
     BOT_REPAIR_LIST_URL: str = env_str("BOT_REPAIR_LIST_URL")
     BOT_SSO_TOKEN: str = env_str("BOT_SSO_TOKEN", "")  # если есть
+    # Chromium запускает только один процесс — владелец out/bot.lock; остальные берут токен из брокера
+    BOT_LEADER_RETRY_SEC: int = env_int("BOT_LEADER_RETRY_SEC", 30)
+    # Сессий Chromium в пуле бота (профили BOT_PROFILE_DIR, BOT_PROFILE_DIR-1, …)
+    BOT_POOL_SIZE: int = env_int("BOT_POOL_SIZE", 1)
+    # Очередь команд сессии бота: сверх лимита — сразу отказ «bot busy»
+    BOT_CMD_QUEUE_MAX: int = env_int("BOT_CMD_QUEUE_MAX", 64)
+    # Планировщик обновления токена по exp: reload за LEAD сек до истечения (± JITTER),
+    # при неудаче — повтор с экспоненциальной паузой до BACKOFF_MAX; без exp — раз в MAX_SEC
+    BOT_REFRESH_LEAD_SEC: float = env_float("BOT_REFRESH_LEAD_SEC", 120.0)
+    BOT_REFRESH_JITTER_SEC: float = env_float("BOT_REFRESH_JITTER_SEC", 20.0)
+    BOT_REFRESH_MIN_SEC: float = env_float("BOT_REFRESH_MIN_SEC", 15.0)
+    BOT_REFRESH_MAX_SEC: float = env_float("BOT_REFRESH_MAX_SEC", 1800.0)
+    BOT_REFRESH_BACKOFF_MAX_SEC: float = env_float("BOT_REFRESH_BACKOFF_MAX_SEC", 300.0)
+    # Прямое обновление токена у IdP по HTTP (без Chromium); Playwright — запасной путь.
+    # refresh_token берётся из access_token_json, для silent authorize — cookie sso_token + id_token_hint
+    BOT_OIDC_ENABLED: bool = env_bool("BOT_OIDC_ENABLED", False)
+    BOT_OIDC_AUTHORIZE_URL: str = env_str("BOT_OIDC_AUTHORIZE_URL", "")
+    BOT_OIDC_TOKEN_URL: str = env_str("BOT_OIDC_TOKEN_URL", "")
+    BOT_OIDC_CLIENT_ID: str = env_str("BOT_OIDC_CLIENT_ID", "")        # пусто → из ключа access_token в LS
+    BOT_OIDC_REDIRECT_URI: str = env_str("BOT_OIDC_REDIRECT_URI", "")  # пусто → BOT_START_URL
+    BOT_OIDC_SCOPE: str = env_str("BOT_OIDC_SCOPE", "openid profile")
+    BOT_OIDC_TIMEOUT_SEC: float = env_float("BOT_OIDC_TIMEOUT_SEC", 10.0)
 
     # DMS API
     DMS_API_BASE: str = env_str("DMS_API_BASE")
+    # Пул соединений к апстриму DMS (общий httpx.Client на процесс)
+    DMS_HTTP2: bool = env_bool("DMS_HTTP2", False)  # нужен пакет h2, иначе HTTP/1.1
+    DMS_HTTP_MAX_CONNECTIONS: int = env_int("DMS_HTTP_MAX_CONNECTIONS", 32)
+    DMS_HTTP_MAX_KEEPALIVE: int = env_int("DMS_HTTP_MAX_KEEPALIVE", 16)
+    DMS_HTTP_KEEPALIVE_EXPIRY: float = env_float("DMS_HTTP_KEEPALIVE_EXPIRY", 60.0)
+    DMS_HTTP_CONNECT_TIMEOUT: float = env_float("DMS_HTTP_CONNECT_TIMEOUT", 5.0)
+    DMS_ASGI_MAX_CONNECTIONS: int = env_int("DMS_ASGI_MAX_CONNECTIONS", 256)  # пул AsyncClient (asgi.py)
+    # Кэш ответов справочных эндпоинтов (LRU в памяти + Redis)
+    DMS_CACHE_ENABLED: bool = env_bool("DMS_CACHE_ENABLED", True)
+    DMS_CACHE_MAX_ITEMS: int = env_int("DMS_CACHE_MAX_ITEMS", 2000)
+    DMS_CACHE_MAX_MB: int = env_int("DMS_CACHE_MAX_MB", 128)
+    DMS_CACHE_TTL_SEC: int = env_int("DMS_CACHE_TTL_SEC", 600)            # structure_get/explosive/…
+    DMS_CACHE_TTL_MODELS_SEC: int = env_int("DMS_CACHE_TTL_MODELS_SEC", 3600)  # /api/models
+    # Склейка одинаковых одновременных вызовов апстрима (single-flight)
+    DMS_SINGLEFLIGHT_ENABLED: bool = env_bool("DMS_SINGLEFLIGHT_ENABLED", True)
+    DMS_SINGLEFLIGHT_REDIS: bool = env_bool("DMS_SINGLEFLIGHT_REDIS", False)   # и между воркерами (нужен REDIS_URL)
+    DMS_SINGLEFLIGHT_RESULT_TTL_SEC: float = env_float("DMS_SINGLEFLIGHT_RESULT_TTL_SEC", 5.0)
+    # Потоковая отдача тяжёлых ответов (байты апстрима как есть, включая gzip) — без буфера и кэша.
+    # По умолчанию — только некэшируемые, которые редко запрашивают одинаково одновременно;
+    # запрос, для которого такой же уже идёт в апстрим, присоединяется к нему (single-flight).
+    # circuit/destuffing/procedure — главный случай для склейки, их не стримим
+    DMS_STREAM_ENABLED: bool = env_bool("DMS_STREAM_ENABLED", True)
+    DMS_STREAM_ENDPOINTS: List[str] = field(default_factory=lambda: env_list("DMS_STREAM_ENDPOINTS", ["material_list", "destuffing_by_id"]))
+    DMS_STREAM_CHUNK_KB: int = env_int("DMS_STREAM_CHUNK_KB", 64)
+    DMS_STREAM_TEE_MAX_MB: int = env_int("DMS_STREAM_TEE_MAX_MB", 16)  # до этого размера тело копируется в снимок
+    # DEBUG-логи вызовов апстрима: доля логируемых вызовов и сколько байт тела показывать
+    DMS_LOG_SAMPLE_RATE: float = env_float("DMS_LOG_SAMPLE_RATE", 1.0)
+    DMS_LOG_BODY_BYTES: int = env_int("DMS_LOG_BODY_BYTES", 1500)
+    # /api/node_bundle: сколько вызовов апстрима параллельно на процесс
+    DMS_BUNDLE_WORKERS: int = env_int("DMS_BUNDLE_WORKERS", 16)
+    # Локальный индекс деревьев каталога (/api/children) и фоновый обход
+    DMS_CATALOG_ENABLED: bool = env_bool("DMS_CATALOG_ENABLED", True)
+    DMS_CATALOG_MAX_AGE_SEC: int = env_int("DMS_CATALOG_MAX_AGE_SEC", 7 * 86400)   # старше — идём в апстрим
+    DMS_CATALOG_REFRESH_SEC: int = env_int("DMS_CATALOG_REFRESH_SEC", 6 * 3600)    # как часто сверять дерево
+    DMS_CATALOG_CRAWL_EVERY_SEC: int = env_int("DMS_CATALOG_CRAWL_EVERY_SEC", 3600)
+    DMS_CATALOG_CRAWL_PAUSE_SEC: float = env_float("DMS_CATALOG_CRAWL_PAUSE_SEC", 1.0)
+    # Снимки ответов на диске (SNAPSHOT_DIR + таблица snapshots) — запасной источник
+    DMS_SNAPSHOT_ENABLED: bool = env_bool("DMS_SNAPSHOT_ENABLED", True)
+    DMS_SNAPSHOT_KEEP: int = env_int("DMS_SNAPSHOT_KEEP", 3)  # сколько версий хранить на ключ
+    # Полнотекстовый поиск (/api/search) по ответам деталей/процедур/техданных
+    DMS_SEARCH_ENABLED: bool = env_bool("DMS_SEARCH_ENABLED", True)
+
+    # Экспорт DOCX: картинки качаются параллельно (общий httpx-пул) с общим дедлайном на документ
+    EXPORT_IMAGE_WORKERS: int = env_int("EXPORT_IMAGE_WORKERS", 8)
+    EXPORT_IMAGE_TIMEOUT_SEC: float = env_float("EXPORT_IMAGE_TIMEOUT_SEC", 20.0)
+    EXPORT_IMAGES_DEADLINE_SEC: float = env_float("EXPORT_IMAGES_DEADLINE_SEC", 40.0)
+    EXPORT_IMAGES_PER_SECTION: int = env_int("EXPORT_IMAGES_PER_SECTION", 6)
+    # Кэш картинок экспорта (память + OUT_DIR/image_cache): по URL (+ETag) и растр SVG по хэшу содержимого
+    EXPORT_IMAGE_CACHE_ENABLED: bool = env_bool("EXPORT_IMAGE_CACHE_ENABLED", True)
+    EXPORT_IMAGE_CACHE_MEM_MB: int = env_int("EXPORT_IMAGE_CACHE_MEM_MB", 64)
+    EXPORT_IMAGE_CACHE_DISK_MB: int = env_int("EXPORT_IMAGE_CACHE_DISK_MB", 512)
+    EXPORT_IMAGE_CACHE_TTL_SEC: int = env_int("EXPORT_IMAGE_CACHE_TTL_SEC", 3600)  # дольше — условный GET по ETag
+    # Фоновые задачи экспорта (rq-очередь «export»; готовые файлы — OUT_DIR/exports)
+    EXPORT_JOB_TIMEOUT_SEC: int = env_int("EXPORT_JOB_TIMEOUT_SEC", 900)
+    EXPORT_RESULT_TTL_SEC: int = env_int("EXPORT_RESULT_TTL_SEC", 24 * 3600)
+    # Массовый экспорт (/export/bulk): сколько узлов за запрос и сколько собирается одновременно
+    EXPORT_BULK_MAX_CODES: int = env_int("EXPORT_BULK_MAX_CODES", 200)
+    EXPORT_BULK_WORKERS: int = env_int("EXPORT_BULK_WORKERS", 3)
+    # общий DOCX держится в памяти целиком до сохранения — предел ниже, чем у ZIP
+    EXPORT_BULK_DOCX_MAX_CODES: int = env_int("EXPORT_BULK_DOCX_MAX_CODES", 40)
 
 @dataclass
 class DevConfig(BaseConfig):
@@ -146,6 +250,9 @@ def apply_flask_config(app, cfg: BaseConfig = settings) -> None:
         "max_overflow": cfg.SQLALCHEMY_MAX_OVERFLOW,
     }
 
+    # Redis
+    app.config["REDIS_URL"] = cfg.REDIS_URL
+
     # JWT
     app.config["JWT_SECRET"] = cfg.JWT_SECRET
     app.config["JWT_ALG"] = cfg.JWT_ALG
@@ -165,3 +272,7 @@ def apply_flask_config(app, cfg: BaseConfig = settings) -> None:
 
     # DMS API
     app.config["DMS_API_BASE"] = cfg.DMS_API_BASE
+    app.config["DMS_HTTP2"] = cfg.DMS_HTTP2
+    app.config["DMS_HTTP_MAX_CONNECTIONS"] = cfg.DMS_HTTP_MAX_CONNECTIONS
+    app.config["DMS_HTTP_MAX_KEEPALIVE"] = cfg.DMS_HTTP_MAX_KEEPALIVE
+    app.config["DMS_CACHE_ENABLED"] = cfg.DMS_CACHE_ENABLED
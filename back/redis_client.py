@@ -0,0 +1,49 @@
+# redis_client.py
+import logging
+import threading
+import time
+from typing import Optional
+
+from config import settings
+
+log = logging.getLogger("api")
+
+_redis = None
+_lock = threading.Lock()
+_down_until: float = 0.0
+
+
+def get_redis():
+    """
+    Общий клиент Redis или None, если REDIS_URL не задан / redis недоступен.
+    После ошибки соединения Redis пропускается REDIS_RETRY_SEC секунд,
+    чтобы запросы не висели на таймаутах.
+    """
+    global _redis
+    url = settings.REDIS_URL
+    if not url or time.time() < _down_until:
+        return None
+    if _redis is not None:
+        return _redis
+    with _lock:
+        if _redis is None:
+            try:
+                import redis
+                _redis = redis.Redis.from_url(
+                    url,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    health_check_interval=30,
+                )
+            except Exception as e:
+                log.warning("redis init error: %r", e)
+                return None
+    return _redis
+
+
+def redis_failed(exc: Optional[BaseException] = None) -> None:
+    """Отметить Redis как недоступный на REDIS_RETRY_SEC секунд."""
+    global _down_until
+    if time.time() >= _down_until:
+        log.warning("redis unavailable (%r) — skip for %ss", exc, settings.REDIS_RETRY_SEC)
+    _down_until = time.time() + settings.REDIS_RETRY_SEC
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Замер бота: латентность команд (_ask) и CPU в простое (python-процесс + Chromium).
+
+Бот поднимается в этом же процессе на пустой странице, без DMS:
+  BOT_START_URL=about:blank BOT_HEADLESS=1 python scripts/bench_bot.py -n 200 --idle 30
+
+До/после: запустить на коммите до перехода на asyncio-цикл и на текущем —
+скрипт пользуется только публичным API бота (start/eval/stop; eval_many и cmd_stats —
+с появления очереди команд, для старых коммитов --batch 0).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Bot command latency / idle CPU benchmark")
+    p.add_argument("-n", "--commands", type=int, default=200, help="Сколько eval-команд отправить")
+    p.add_argument("--idle", type=float, default=30.0, help="Сколько секунд мерить CPU в простое")
+    p.add_argument("--batch", type=int, default=10, help="Скриптов в одной eval_many (0 — не мерить)")
+    return p.parse_args()
+
+
+def _cpu_sec(pid: int) -> float:
+    """utime+stime процесса из /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            parts = f.read().rsplit(")", 1)[1].split()
+        return (int(parts[11]) + int(parts[12])) / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return 0.0
+
+
+def _descendants(pid: int) -> list:
+    """pid и все его потомки (Chromium и его renderer'ы)."""
+    children = {}
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except Exception:
+            continue
+        children.setdefault(ppid, []).append(int(d))
+    out, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        out.append(p)
+        stack.extend(children.get(p, []))
+    return out
+
+
+def _tree_cpu() -> float:
+    return sum(_cpu_sec(p) for p in _descendants(os.getpid()))
+
+
+def main() -> int:
+    args = parse_args()
+    os.environ.setdefault("BOT_START_URL", "about:blank")
+    from src.bot.chehejia_bot import ChehejiaBot
+
+    bot = ChehejiaBot()
+    bot.start()
+    try:
+        # латентность команд
+        lat = []
+        for _ in range(args.commands):
+            t0 = time.perf_counter()
+            res = bot.eval("1+1", timeout=10.0)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+            if not res.get("ok"):
+                print("eval error:", res, file=sys.stderr)
+                return 1
+        lat.sort()
+
+        # та же работа пачками eval_many: одна команда на --batch скриптов
+        batch_ms = None
+        if args.batch > 0:
+            t0 = time.perf_counter()
+            for _ in range(max(1, args.commands // args.batch)):
+                res = bot.eval_many(["1+1"] * args.batch, timeout=10.0)
+                if not res.get("ok"):
+                    print("eval_many error:", res, file=sys.stderr)
+                    return 1
+            batch_ms = (time.perf_counter() - t0) * 1000.0 / (max(1, args.commands // args.batch) * args.batch)
+        cmd_stats = bot.cmd_stats.snapshot() if hasattr(bot, "cmd_stats") else {}
+
+        # CPU в простое
+        py0, tree0, t0 = _cpu_sec(os.getpid()), _tree_cpu(), time.monotonic()
+        time.sleep(args.idle)
+        wall = time.monotonic() - t0
+        py_cpu, tree_cpu = _cpu_sec(os.getpid()) - py0, _tree_cpu() - tree0
+    finally:
+        bot.stop()
+
+    print(json.dumps({
+        "commands": args.commands,
+        "cmd_p50_ms": round(lat[len(lat) // 2], 2),
+        "cmd_p99_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.99))], 2),
+        "cmd_mean_ms": round(statistics.mean(lat), 2),
+        "batched_per_script_ms": round(batch_ms, 2) if batch_ms is not None else None,
+        "queue": {k: cmd_stats.get(k) for k in ("peak", "rejected")},
+        "idle_sec": round(wall, 1),
+        "idle_cpu_python_pct": round(100.0 * py_cpu / wall, 2),
+        "idle_cpu_total_pct": round(100.0 * tree_cpu / wall, 2),
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк разбора HTML секций экспорта: прежний путь (7 регулярок + unescape + цикл по строкам
+и отдельный проход за <img>), плоский текст для поиска (html_to_text, регулярки) и блоки для DOCX
+одним проходом lxml (parse_html) — src/routers/export/html_blocks.py.
+
+  python scripts/bench_export_html.py --steps 400 -n 50
+
+HTML генерируется в форме «шагов разборки» (как секция steps в экспорте): абзацы, списки,
+таблицы, картинки, сущности, <style>/<script>. --docx — ещё и время вставки блоков в DOCX.
+"""
+
+import argparse
+import html
+import json
+import re
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Export HTML → text/blocks benchmark")
+    p.add_argument("--steps", type=int, default=400, help="Сколько шагов в сгенерированной процедуре")
+    p.add_argument("-n", "--rounds", type=int, default=50, help="Повторов на каждый вариант")
+    p.add_argument("--docx", action="store_true", help="Мерить и вставку блоков в документ")
+    return p.parse_args()
+
+
+def make_html(steps: int) -> str:
+    parts = ["<style>.x{color:red}</style><p>Схема расположения</p><img src=\"https://dms/loc.svg\"/>",
+             "<p>Внимание</p><ul>" + "".join(f"<li>Пункт &laquo;{i}&raquo; &mdash; затянуть</li>" for i in range(20)) + "</ul>"]
+    for i in range(1, steps + 1):
+        parts.append(
+            f"<h3>Шаг {i}</h3><div><p>Отсоедините разъём <b>X{i}</b> и снимите крышку&nbsp;блока.<br/>"
+            f"Момент затяжки: 8&plusmn;1 Н&middot;м</p><ul><li>болт M6</li><li>шайба</li></ul>"
+            f"<table><tr><th>Параметр</th><th>Значение</th></tr><tr><td>Момент</td><td>{i % 10 + 5} Н·м</td></tr>"
+            f"<tr><td>Инструмент</td><td>Торкс T{20 + i % 10}</td></tr></table>"
+            f"<img src=\"https://dms/steps/{i}.png\" alt=\"\"/><script>track({i})</script></div><hr/>"
+        )
+    return "".join(parts)
+
+
+# ---------- прежняя реализация (для сравнения) ----------
+_SCRIPT_TAG_RE = re.compile(r"<\s*script\b[^>]*>(.*?)<\s*/\s*script\s*>", re.I | re.S)
+_STYLE_TAG_RE  = re.compile(r"<\s*style\b[^>]*>(.*?)<\s*/\s*style\s*>", re.I | re.S)
+_TAG_RE        = re.compile(r"<[^>]+>")
+_BR_RE         = re.compile(r"<\s*br\s*/?\s*>", re.I)
+_LI_RE         = re.compile(r"<\s*li\b[^>]*>", re.I)
+_ENDLI_RE      = re.compile(r"</\s*li\s*>", re.I)
+_P_RE          = re.compile(r"</\s*p\s*>", re.I)
+_IMG_RE        = re.compile(r"<img[^>]+src=['\"]([^'\" >]+)['\"][^>]*>", re.I)
+
+
+def legacy(s: str):
+    urls = _IMG_RE.findall(s)
+    s = _SCRIPT_TAG_RE.sub("", s)
+    s = _STYLE_TAG_RE.sub("", s)
+    s = _BR_RE.sub("\n", s)
+    s = _P_RE.sub("\n\n", s)
+    s = _LI_RE.sub("• ", s)
+    s = _ENDLI_RE.sub("\n", s)
+    s = _TAG_RE.sub("", s)
+    s = html.unescape(s)
+    out, last_empty = [], False
+    for ln in (ln.rstrip() for ln in s.splitlines()):
+        if ln.strip():
+            out.append(ln)
+            last_empty = False
+        elif not last_empty:
+            out.append("")
+            last_empty = True
+    return "\n".join(out).strip(), urls
+
+
+def _timeit(fn, arg, rounds: int) -> dict:
+    lat = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn(arg)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+    return {"p50_ms": round(statistics.median(lat), 2), "min_ms": round(min(lat), 2)}
+
+
+def main() -> int:
+    args = parse_args()
+    from src.routers.export.html_blocks import html_to_text, parse_html
+
+    raw_parse = parse_html.__wrapped__   # без lru_cache — мерим сам разбор
+    doc_html = make_html(args.steps)
+    mb = len(doc_html.encode("utf-8")) / 1e6
+
+    out = {"html_mb": round(mb, 2), "steps": args.steps}
+    out["legacy_regex"] = _timeit(legacy, doc_html, args.rounds)
+    out["search_text_regex"] = _timeit(html_to_text, doc_html, args.rounds)
+    out["lxml_single_pass"] = _timeit(raw_parse, doc_html, args.rounds)
+    for k in ("legacy_regex", "search_text_regex", "lxml_single_pass"):
+        out[k]["mb_per_sec"] = round(mb / (out[k]["p50_ms"] / 1000.0), 1)
+    out["speedup"] = round(out["legacy_regex"]["p50_ms"] / out["lxml_single_pass"]["p50_ms"], 2)
+
+    blocks = raw_parse(doc_html)
+    kinds = {}
+    for b in blocks:
+        kinds[b.kind] = kinds.get(b.kind, 0) + 1
+    out["blocks"] = kinds
+    out["images_same"] = legacy(doc_html)[1] == [b.url for b in blocks if b.kind == "img"]
+
+    if args.docx:
+        from docx import Document
+        from src.routers.export.routes import _apply_base_styles, _add_section
+
+        def render_legacy(h):
+            d = Document()
+            _apply_base_styles(d)
+            for part in legacy(h)[0].split("\n"):
+                d.add_paragraph(part)
+
+        def render(h):
+            d = Document()
+            _apply_base_styles(d)
+            parse_html.cache_clear()
+            _add_section(d, "Шаги разборки и сборки", h, {})
+        # прежний DOCX — плоский текст; новый — таблицы Word и стиль списка, они и стоят основное время
+        out["docx_section_legacy"] = _timeit(render_legacy, doc_html, max(1, args.rounds // 10))
+        out["docx_section"] = _timeit(render, doc_html, max(1, args.rounds // 10))
+
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк входа: пропускная способность /auth/login (bcrypt) и как всплеск входов
+влияет на латентность прокси /api/* в это же время.
+
+1) Тестовый пользователь (один раз; регистрация должна быть открыта):
+  python scripts/bench_login.py register --url http://127.0.0.1:5015 --login bench --password 'BenchPass123'
+
+2) Залп входов + параллельный фон на прокси:
+  python scripts/bench_login.py run --url http://127.0.0.1:5015 --login bench --password 'BenchPass123' \\
+      -c 50 -n 500 --proxy-path "/api/part_detail?code=X" --proxy-c 20
+
+Сравнить до/после: AUTH_BCRYPT_WORKERS / AUTH_BCRYPT_QUEUE / AUTH_BCRYPT_ROUNDS.
+Счётчики пула — GET /admin/auth/status.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Login throughput vs proxy latency benchmark")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    reg = sub.add_parser("register", help="Создать тестового пользователя")
+    reg.add_argument("--url", default="http://127.0.0.1:5015")
+    reg.add_argument("--login", default="bench")
+    reg.add_argument("--password", default="BenchPass123")
+
+    r = sub.add_parser("run", help="Залп входов и замер прокси")
+    r.add_argument("--url", default="http://127.0.0.1:5015")
+    r.add_argument("--login", default="bench")
+    r.add_argument("--password", default="BenchPass123")
+    r.add_argument("-c", "--concurrency", type=int, default=50, help="Одновременных входов")
+    r.add_argument("-n", "--requests", type=int, default=500, help="Всего входов")
+    r.add_argument("--proxy-path", default="/api/ping_enums", help="Путь прокси для фоновой нагрузки")
+    r.add_argument("--proxy-c", type=int, default=10, help="Параллельных фоновых запросов к прокси")
+    return p.parse_args()
+
+
+def _pct(lat, p):
+    return round(lat[min(len(lat) - 1, int(len(lat) * p))], 1) if lat else None
+
+
+async def _register(args) -> int:
+    import httpx
+    async with httpx.AsyncClient(base_url=args.url, timeout=30.0) as cl:
+        r = await cl.post("/auth/register", json={
+            "username": args.login, "email": f"{args.login}@bench.local", "password": args.password})
+        print(r.status_code, r.text[:300])
+    return 0 if r.status_code in (200, 409) else 1
+
+
+async def _run(args) -> int:
+    import httpx
+
+    login_lat, proxy_lat = [], []
+    login_st, proxy_st = {}, {}
+    sem = asyncio.Semaphore(args.concurrency)
+    done = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.concurrency + args.proxy_c)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60.0) as cl:
+        async def one_login():
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await cl.post("/auth/login", json={"login": args.login, "password": args.password})
+                    login_st[r.status_code] = login_st.get(r.status_code, 0) + 1
+                except Exception:
+                    login_st["error"] = login_st.get("error", 0) + 1
+                    return
+                login_lat.append((time.perf_counter() - t0) * 1000.0)
+
+        async def proxy_loop():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                try:
+                    r = await cl.get(args.proxy_path)
+                    proxy_st[r.status_code] = proxy_st.get(r.status_code, 0) + 1
+                except Exception:
+                    proxy_st["error"] = proxy_st.get("error", 0) + 1
+                    continue
+                proxy_lat.append((time.perf_counter() - t0) * 1000.0)
+
+        bg = [asyncio.create_task(proxy_loop()) for _ in range(args.proxy_c)]
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(args.requests)))
+        wall = time.perf_counter() - t0
+        done.set()
+        await asyncio.gather(*bg)
+
+    if not login_lat:
+        print("нет ответов на /auth/login", file=sys.stderr)
+        return 1
+    login_lat.sort()
+    proxy_lat.sort()
+    print(json.dumps({
+        "logins": args.requests,
+        "concurrency": args.concurrency,
+        "wall_sec": round(wall, 2),
+        "logins_ok_per_sec": round(login_st.get(200, 0) / wall, 1),
+        "login_p50_ms": _pct(login_lat, 0.50),
+        "login_p99_ms": _pct(login_lat, 0.99),
+        "login_statuses": login_st,
+        "proxy_requests": len(proxy_lat),
+        "proxy_p50_ms": _pct(proxy_lat, 0.50),
+        "proxy_p99_ms": _pct(proxy_lat, 0.99),
+        "proxy_statuses": proxy_st,
+    }, ensure_ascii=False, indent=2, default=str))
+    return 0
+
+
+def main() -> int:
+    args = parse_args()
+    if args.cmd == "register":
+        return asyncio.run(_register(args))
+    return asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
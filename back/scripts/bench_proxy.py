@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк прокси /api/* — сравнение режимов wsgi (gthread) и asgi.
+
+1) Поднять заглушку апстрима с задержкой (имитация медленного DMS):
+  python scripts/bench_proxy.py stub --port 9009 --delay 0.5
+
+2) Запустить бэкенд против заглушки (в каждом режиме по очереди):
+  DMS_API_BASE=http://127.0.0.1:9009 DMS_CACHE_ENABLED=0 BOT_AUTOSTART=0 SERVER_MODE=wsgi ./server.sh start
+  DMS_API_BASE=http://127.0.0.1:9009 DMS_CACHE_ENABLED=0 BOT_AUTOSTART=0 SERVER_MODE=asgi ./server.sh start
+  (bearer для прокси: python scripts/bench_proxy.py token — пишет фиктивный out/token.json)
+
+3) Нагрузка:
+  python scripts/bench_proxy.py run --url http://127.0.0.1:5015 --path "/api/part_detail?code=X" -c 200 -n 2000
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="DMS proxy load benchmark")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="Нагрузить прокси и вывести латентность/RPS")
+    r.add_argument("--url", default="http://127.0.0.1:5015", help="База бэкенда")
+    r.add_argument("--path", default="/api/part_detail?code=BENCH", help="Путь запроса")
+    r.add_argument("-c", "--concurrency", type=int, default=100, help="Одновременных запросов")
+    r.add_argument("-n", "--requests", type=int, default=1000, help="Всего запросов")
+    r.add_argument("--label", default="", help="Подпись режима в выводе (wsgi/asgi)")
+
+    s = sub.add_parser("stub", help="Заглушка апстрима DMS с задержкой")
+    s.add_argument("--port", type=int, default=9009)
+    s.add_argument("--delay", type=float, default=0.5, help="Задержка ответа, сек")
+    s.add_argument("--size", type=int, default=2048, help="Размер JSON-ответа, байт")
+
+    sub.add_parser("token", help="Записать фиктивный bearer в out/token.json")
+    return p.parse_args()
+
+
+# ---------- нагрузка ----------
+async def _run(args) -> int:
+    import httpx
+
+    lat = []
+    errors = 0
+    statuses = {}
+    sem = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120.0) as cl:
+        async def one():
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await cl.get(args.path)
+                    statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                except Exception:
+                    errors += 1
+                    return
+                lat.append((time.perf_counter() - t0) * 1000.0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        wall = time.perf_counter() - t0
+
+    if not lat:
+        print("нет успешных ответов", file=sys.stderr)
+        return 1
+    lat.sort()
+    q = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))]
+    print(json.dumps({
+        "mode": args.label or args.url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_sec": round(wall, 2),
+        "rps": round(len(lat) / wall, 1),
+        "p50_ms": round(q(0.50), 1),
+        "p95_ms": round(q(0.95), 1),
+        "p99_ms": round(q(0.99), 1),
+        "mean_ms": round(statistics.mean(lat), 1),
+        "errors": errors,
+        "statuses": statuses,
+    }, ensure_ascii=False, indent=2))
+    return 0
+
+
+# ---------- заглушка апстрима ----------
+async def _stub(args) -> int:
+    body = json.dumps({"code": 0, "success": True, "data": {"pad": "x" * max(0, args.size - 60)}}).encode()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                await asyncio.sleep(args.delay)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", args.port, backlog=4096)
+    print(f"stub upstream on http://127.0.0.1:{args.port} (delay={args.delay}s)")
+    async with server:
+        await server.serve_forever()
+    return 0
+
+
+def _write_token() -> int:
+    enc = lambda d: base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip("=")
+    tok = f"Bearer {enc({'alg': 'none'})}.{enc({'exp': int(time.time()) + 30 * 86400})}.sig"
+    out = Path(ROOT) / "out"
+    out.mkdir(exist_ok=True)
+    (out / "token.json").write_text(json.dumps({"bearer": tok}), encoding="utf-8")
+    print(f"записан {out / 'token.json'}")
+    return 0
+
+
+def main() -> int:
+    args = parse_args()
+    if args.cmd == "run":
+        return asyncio.run(_run(args))
+    if args.cmd == "stub":
+        return asyncio.run(_stub(args))
+    return _write_token()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
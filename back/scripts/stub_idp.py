@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Заглушка IdP для проверки прямого обновления токена (src/bot/oidc.py) без Chromium и без сети.
+
+1) Поднять заглушку:
+  python scripts/stub_idp.py serve --port 9011 --ttl 300
+
+2) Прогнать DirectRefresher против неё (оба пути: refresh_token и silent authorize по sso_token):
+  python scripts/stub_idp.py check --url http://127.0.0.1:9011
+
+3) Бот целиком против заглушки:
+  BOT_OIDC_ENABLED=1 BOT_OIDC_TOKEN_URL=http://127.0.0.1:9011/token \\
+  BOT_OIDC_AUTHORIZE_URL=http://127.0.0.1:9011/authorize ./server.sh start
+  (refresh_token — в access_token_json, либо sso_token — в /admin/bot/config;
+   счётчики — /admin/bot/status → direct_refresh)
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import secrets
+import sys
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+SSO = "stub-sso-token"
+REFRESH = "stub-refresh-0"
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Stub OIDC identity provider")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="Поднять заглушку IdP")
+    s.add_argument("--port", type=int, default=9011)
+    s.add_argument("--ttl", type=int, default=300, help="Срок жизни выдаваемых access_token, сек")
+
+    c = sub.add_parser("check", help="Прогнать DirectRefresher против заглушки")
+    c.add_argument("--url", default="http://127.0.0.1:9011")
+    c.add_argument("-n", "--rounds", type=int, default=20, help="Сколько обновлений на каждый путь")
+    return p.parse_args()
+
+
+def _jwt(ttl: int) -> str:
+    enc = lambda d: base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip("=")
+    return f"{enc({'alg': 'none'})}.{enc({'exp': int(time.time()) + ttl, 'jti': secrets.token_hex(4)})}.sig"
+
+
+# ---------- заглушка ----------
+def _serve(args) -> int:
+    from flask import Flask, request, jsonify, redirect
+
+    app = Flask("stub_idp")
+    codes = {}                   # code → code_challenge
+    refresh_tokens = {REFRESH}   # ротация: каждый refresh_token одноразовый
+
+    def _tokens():
+        rt = f"stub-refresh-{secrets.token_hex(6)}"
+        refresh_tokens.add(rt)
+        return {"access_token": _jwt(args.ttl), "token_type": "Bearer", "expires_in": args.ttl,
+                "refresh_token": rt, "id_token": _jwt(args.ttl)}
+
+    @app.get("/authorize")
+    def authorize():
+        q = request.args
+        back = q.get("redirect_uri", "http://localhost/")
+        if q.get("prompt") == "none" and request.cookies.get("sso_token") != SSO:
+            return redirect(f"{back}?{urlencode({'error': 'login_required', 'state': q.get('state', '')})}")
+        code = secrets.token_urlsafe(16)
+        codes[code] = q.get("code_challenge", "")
+        return redirect(f"{back}?{urlencode({'code': code, 'state': q.get('state', '')})}")
+
+    @app.post("/token")
+    def token():
+        f = request.form
+        if f.get("grant_type") == "refresh_token":
+            rt = f.get("refresh_token")
+            if rt not in refresh_tokens:
+                return jsonify({"error": "invalid_grant"}), 400
+            if rt != REFRESH:  # затравочный — многоразовый, чтобы check можно было гонять повторно
+                refresh_tokens.discard(rt)
+            return jsonify(_tokens())
+        if f.get("grant_type") == "authorization_code":
+            challenge = codes.pop(f.get("code", ""), None)
+            verifier = (f.get("code_verifier") or "").encode("ascii")
+            expect = base64.urlsafe_b64encode(hashlib.sha256(verifier).digest()).rstrip(b"=").decode()
+            if challenge is None or challenge != expect:
+                return jsonify({"error": "invalid_grant"}), 400
+            return jsonify(_tokens())
+        return jsonify({"error": "unsupported_grant_type"}), 400
+
+    print(f"stub IdP on http://127.0.0.1:{args.port} (sso_token={SSO}, refresh_token={REFRESH})")
+    app.run("127.0.0.1", args.port, threaded=True)
+    return 0
+
+
+# ---------- проверка ----------
+async def _check(args) -> int:
+    from config import settings
+    settings.BOT_OIDC_ENABLED = True
+    settings.BOT_OIDC_TOKEN_URL = f"{args.url}/token"
+    settings.BOT_OIDC_AUTHORIZE_URL = f"{args.url}/authorize"
+    settings.BOT_OIDC_REDIRECT_URI = "http://localhost/callback"
+    from src.bot.oidc import DirectRefresher
+
+    out = {}
+    cases = {
+        "refresh_token": {"access_token_key": "@@idaasjs@@::stub::access_token",
+                          "access_token_json": json.dumps({"body": {"refresh_token": REFRESH}})},
+        "silent_authorize": {"access_token_key": "@@idaasjs@@::stub::access_token", "sso_token": SSO},
+        "bad_sso": {"access_token_key": "@@idaasjs@@::stub::access_token", "sso_token": "wrong"},
+    }
+    for name, cfg in cases.items():
+        r = DirectRefresher()
+        lat, ok = [], 0
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            tok = await r.refresh(cfg)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+            ok += bool(tok and tok.get("access_token"))
+        lat.sort()
+        out[name] = {"ok": ok, "rounds": args.rounds, "p50_ms": round(lat[len(lat) // 2], 1),
+                     "max_ms": round(lat[-1], 1), "stats": r.stats()}
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+    good = out["refresh_token"]["ok"] == args.rounds and out["silent_authorize"]["ok"] == args.rounds
+    return 0 if good and out["bad_sso"]["ok"] == 0 else 1
+
+
+def main() -> int:
+    args = parse_args()
+    if args.cmd == "serve":
+        return _serve(args)
+    return asyncio.run(_check(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -14,11 +14,30 @@ export DEBUG=false
 export HOST=0.0.0.0
 export PORT=5015
 
+# Режим: wsgi (Flask, gthread) | asgi (/api/* на asyncio + httpx.AsyncClient, остальное — Flask)
+SERVER_MODE="${SERVER_MODE:-wsgi}"
+# Потоки gthread; экспортируется — по нему ограничивается пул bcrypt (AUTH_BCRYPT_*)
+export GUNICORN_THREADS="${GUNICORN_THREADS:-8}"
+
 # Команда gunicorn (правьте по вкусу)
-GUNICORN_CMD="gunicorn -w 1 -k gthread --threads 8 \
-  --timeout 120 --graceful-timeout 30 \
-  --access-logfile - --error-logfile - \
-  -b 0.0.0.0:5015 app:app"
+if [[ "$SERVER_MODE" == "asgi" ]]; then
+  GUNICORN_CMD="gunicorn -w 1 -k uvicorn.workers.UvicornWorker \
+    --timeout 120 --graceful-timeout 30 \
+    --access-logfile - --error-logfile - \
+    -b 0.0.0.0:5015 asgi:app"
+else
+  GUNICORN_CMD="gunicorn -w 1 -k gthread --threads $GUNICORN_THREADS \
+    --timeout 120 --graceful-timeout 30 \
+    --access-logfile - --error-logfile - \
+    -b 0.0.0.0:5015 app:app"
+fi
+
+# Фоновые задачи rq (нужен REDIS_URL): обход каталога, экспорт DOCX и т.п.
+# RQ_WORKERS процессов в одном screen — экспорты собираются параллельно
+WORKER_SCREEN="dms_worker"
+RQ_QUEUES="${RQ_QUEUES:-export catalog}"
+RQ_WORKERS="${RQ_WORKERS:-2}"
+WORKER_CMD="rq worker --with-scheduler --url \"\${REDIS_URL:-redis://localhost:6379/0}\" $RQ_QUEUES"
 
 # ==== Функции ====
 ensure_screen() {
@@ -102,6 +121,30 @@ attach() {
   exec screen -r "$SCREEN_NAME"
 }
 
+worker() {
+  ensure_screen
+  ensure_logs
+  if screen -list | grep -q "[.]${WORKER_SCREEN}[[:space:]]"; then
+    echo "Воркер уже запущен (screen: $WORKER_SCREEN)"
+    exit 0
+  fi
+  local run_cmd="cd \"$APP_DIR\";"
+  if [[ -n "${VENV:-}" && -f "$VENV/bin/activate" ]]; then
+    run_cmd+=" source \"$VENV/bin/activate\";"
+  fi
+  run_cmd+=" for i in \$(seq $RQ_WORKERS); do $WORKER_CMD >>\"$LOG_DIR/worker.log\" 2>&1 & done;"
+  run_cmd+=" trap 'kill \$(jobs -p)' INT TERM; wait"
+  screen -S "$WORKER_SCREEN" -dm bash -lc "$run_cmd"
+  echo "Воркеры rq запущены (screen: $WORKER_SCREEN, процессов: $RQ_WORKERS, очереди: $RQ_QUEUES)"
+}
+
+worker_stop() {
+  screen -S "$WORKER_SCREEN" -X stuff $'\003' || true
+  sleep 1
+  screen -S "$WORKER_SCREEN" -X quit || true
+  echo "Воркер остановлен."
+}
+
 tail_logs() {
   ensure_logs
   exec tail -n 200 -F "$LOG_FILE"
@@ -116,8 +159,10 @@ case "$CMD" in
   status)  status ;;
   attach)  attach ;;
   tail)    tail_logs ;;
+  worker)  worker ;;
+  worker-stop) worker_stop ;;
   *)
-    echo "Использование: $0 {start|stop|restart|status|attach|tail}"
+    echo "Использование: $0 {start|stop|restart|status|attach|tail|worker|worker-stop}"
     exit 1
     ;;
 esac
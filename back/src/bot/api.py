@@ -2,13 +2,13 @@
 from __future__ import annotations
 
 import atexit
-import base64
-import json
+import fcntl
 import logging
 import os
 import threading
 import time
-from typing import Optional
+from pathlib import Path
+from typing import IO, Optional
 
 from flask import Flask
 
@@ -17,30 +17,41 @@ from .chehejia_bot import bot
 
 log = logging.getLogger("bot")  # отдельный логгер для бота
 
-# Периодичность проверки и «ранняя» перезагрузка за SKEW_SEC до exp
+# Периодичность проверки сторожем; обновление токена планирует сам бот по exp
 SLEEP_SEC = int(getattr(settings, "BOT_CHECK_INTERVAL_SEC", 15))
-SKEW_SEC  = int(getattr(settings, "BOT_SKEW_SEC", 60))
 
 
-def _b64url_decode(s: str) -> bytes:
-    s += "=" * ((4 - len(s) % 4) % 4)
-    return base64.urlsafe_b64decode(s.encode("utf-8"))
+# ---------- один бот на машину ----------
+LOCK_FILE = Path(settings.OUT_DIR) / "bot.lock"
+_lock_fd: Optional[IO[str]] = None
 
 
-def _jwt_exp(bearer: Optional[str]) -> Optional[int]:
-    """Достаём число exp из Bearer JWT без внешних зависимостей."""
-    if not bearer:
-        return None
-    tok = bearer.strip()
-    if tok.lower().startswith("bearer "):
-        tok = tok[7:].strip()
+def acquire_leader() -> bool:
+    """
+    Неблокирующий flock на out/bot.lock: кто взял — тот и запускает Chromium
+    и публикует токен. Лок держится до конца процесса (fd не закрываем),
+    ОС снимет его сама, если процесс упадёт.
+    """
+    global _lock_fd
+    if _lock_fd is not None:
+        return True
+    LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    fd = open(LOCK_FILE, "a+")
     try:
-        _h, p, _sig = tok.split(".")
-        payload = json.loads(_b64url_decode(p) or b"{}")
-        exp = payload.get("exp")
-        return int(exp) if exp is not None else None
-    except Exception:
-        return None
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fd.close()
+        return False
+    fd.seek(0)
+    fd.truncate()
+    fd.write(str(os.getpid()))
+    fd.flush()
+    _lock_fd = fd
+    return True
+
+
+def is_leader() -> bool:
+    return _lock_fd is not None
 
 
 class BotManager:
@@ -74,26 +85,9 @@ class BotManager:
                     except Exception as e:
                         log.exception("bot start error: %r", e)
 
-                # 2) Следим за bearer и при необходимости обновляем страницу
-                b = bot.get_bearer()
-                exp = _jwt_exp(b)
-                now = time.time()
-                if exp is None:
-                    if bot.is_running():
-                        log.info("no bearer → goto START_URL")
-                        try:
-                            bot.goto(settings.BOT_START_URL)
-                        except Exception as e:
-                            log.exception("goto start error: %r", e)
-                else:
-                    ttl = exp - now
-                    log.debug("bearer ttl = %.1fs", ttl)
-                    if ttl <= SKEW_SEC and bot.is_running():
-                        log.warning("bearer expiring (<= %ss) → reload()", SKEW_SEC)
-                        try:
-                            bot.reload(timeout=50.0)
-                        except Exception as e:
-                            log.exception("reload error: %r", e)
+                # 1a) Нездоровые сессии пула — перезапускаем
+                if bot.is_running():
+                    bot.check()
 
             except Exception as e:
                 log.exception("watchdog loop error: %r", e)
@@ -126,21 +120,38 @@ def init_bot(app: Flask):
         # В дев-режиме нужно стартовать только в «дочернем» процессе reloader’а.
         return os.environ.get("WERKZEUG_RUN_MAIN") == "true"
 
+    def _start_bot():
+        try:
+            log.info("init_bot: starting bot (immediate, pid=%s)", os.getpid())
+            bot.start()
+            log.info("init_bot: bot started")
+        except Exception as e:
+            log.exception("init_bot: bot.start error: %r", e)
+        manager.start_watchdog()
+        log.info("init_bot: bot watchdog started")
+
+    def _wait_leadership():
+        # лидер может умереть — тогда лок освободится и бота поднимет этот процесс
+        while not acquire_leader():
+            time.sleep(settings.BOT_LEADER_RETRY_SEC)
+        log.info("init_bot: became bot leader (pid=%s)", os.getpid())
+        _start_bot()
+
     def _ensure_started():
         if started["flag"]:
             return
         started["flag"] = True
 
-        if bool(getattr(settings, "BOT_AUTOSTART", True)):
-            try:
-                log.info("init_bot: starting bot (immediate)")
-                bot.start()
-                log.info("init_bot: bot started")
-            except Exception as e:
-                log.exception("init_bot: bot.start error: %r", e)
-
-        manager.start_watchdog()
-        log.info("init_bot: bot watchdog started")
+        if not bool(getattr(settings, "BOT_AUTOSTART", True)):
+            manager.start_watchdog()
+            log.info("init_bot: autostart off, watchdog only")
+            return
+        if acquire_leader():
+            _start_bot()
+        else:
+            # другой воркер уже держит Chromium: здесь токен приходит через брокер
+            log.info("init_bot: bot runs in another process, pid=%s is a token consumer", os.getpid())
+            threading.Thread(target=_wait_leadership, daemon=True, name="bot-leader-wait").start()
 
     # 1) Пытаемся стартовать сразу
     if _should_start_now():
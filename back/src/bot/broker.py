@@ -0,0 +1,161 @@
+# src/bot/broker.py
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import settings
+from redis_client import get_redis, redis_failed
+
+log = logging.getLogger("bot")
+
+
+def atomic_write_json(path: Path, obj: Dict[str, Any]) -> None:
+    """Запись через временный файл + rename: читатель никогда не увидит половину JSON."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class TokenBroker:
+    """
+    Раздача bearer между процессами. Бот (один на машину, см. api.acquire_leader)
+    публикует токен; воркеры API держат его в памяти и обновляют по уведомлению:
+      - с Redis: ключ KEY + канал CHANNEL (подписка в фоновом потоке);
+      - без Redis: файл out/token.json — тот же фоновый поток делает stat() раз в
+        FILE_CHECK_SEC и перечитывает файл только при смене mtime.
+    На пути запроса — только чтение снимка в памяти; диск/Redis трогаются синхронно
+    один раз, при первом обращении процесса (холодный старт).
+    """
+    KEY = "dms:bearer"
+    CHANNEL = "dms:bearer:changed"
+    FILE_CHECK_SEC = 2.0
+
+    def __init__(self, token_file: Path):
+        self.token_file = token_file
+        self._state: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._sub_th: Optional[threading.Thread] = None
+        self._file_mtime = 0.0
+        self._stats = {"published": 0, "updates": 0, "redis_reads": 0, "file_reads": 0}
+
+    # ---------- публикация (процесс бота) ----------
+    def publish(self, bearer: str, *, source: str, exp: Optional[int], extra: Optional[Dict[str, Any]] = None) -> None:
+        st = {"bearer": bearer, "exp": exp, "source": source, "ts": time.time(), **(extra or {})}
+        self._set(st)
+        self._stats["published"] += 1
+        payload = json.dumps(st, ensure_ascii=False)
+        r = get_redis()
+        if r is not None:
+            try:
+                pipe = r.pipeline()
+                pipe.set(self.KEY, payload)
+                pipe.publish(self.CHANNEL, payload)
+                pipe.execute()
+            except Exception as e:
+                redis_failed(e)
+        # файл — для воркеров без Redis и как «последний известный» после рестарта
+        try:
+            atomic_write_json(self.token_file, st)
+        except Exception as e:
+            log.warning("token file write error: %r", e)
+
+    # ---------- чтение (любой процесс) ----------
+    def get(self) -> Optional[str]:
+        st = self.current()
+        return st.get("bearer") if st else None
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        return self._state
+
+    def _set(self, st: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._state and self._state.get("bearer") == st.get("bearer"):
+                return
+            self._state = st
+            self._stats["updates"] += 1
+
+    def _refresh(self) -> None:
+        self._ensure_subscriber()
+        if not self._loaded:
+            self._loaded = True
+            r = get_redis()
+            if r is None or not self._load_redis(r):
+                self._refresh_from_file()
+
+    def _load_redis(self, r) -> bool:
+        try:
+            raw = r.get(self.KEY)
+        except Exception as e:
+            redis_failed(e)
+            return False
+        self._stats["redis_reads"] += 1
+        if raw:
+            self._set(json.loads(raw))
+        return bool(raw)
+
+    def _refresh_from_file(self) -> None:
+        try:
+            mtime = self.token_file.stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        try:
+            js = json.loads(self.token_file.read_text("utf-8"))
+        except Exception:
+            return
+        self._file_mtime = mtime
+        self._stats["file_reads"] += 1
+        b = js.get("bearer") or js.get("token")
+        if b:
+            self._set({**js, "bearer": b})
+
+    # ---------- подписка на изменения ----------
+    def _ensure_subscriber(self) -> None:
+        if self._sub_th is not None:
+            return
+        with self._lock:
+            if self._sub_th is None:
+                self._sub_th = threading.Thread(target=self._listen, daemon=True, name="bearer-subscriber")
+                self._sub_th.start()
+
+    def _listen(self) -> None:
+        while True:
+            r = get_redis()
+            if r is None:
+                # без Redis следим за файлом (его пишет бот через atomic_write_json)
+                self._refresh_from_file()
+                time.sleep(self.FILE_CHECK_SEC)
+                continue
+            try:
+                ps = r.pubsub(ignore_subscribe_messages=True)
+                ps.subscribe(self.CHANNEL)
+                # пока не были подписаны, публикации могли пройти мимо — перечитаем ключ
+                self._load_redis(r)
+                while True:
+                    msg = ps.get_message(timeout=1.0)
+                    if msg and msg.get("type") == "message":
+                        try:
+                            self._set(json.loads(msg["data"]))
+                        except Exception:
+                            self._load_redis(r)
+            except Exception as e:
+                log.warning("bearer subscriber error: %r", e)
+                time.sleep(1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        st = self._state or {}
+        return {**self._stats, "source": st.get("source"), "published_ts": st.get("ts"),
+                "redis": get_redis() is not None}
+
+
+broker = TokenBroker(Path(settings.OUT_DIR) / "token.json")
@@ -1,21 +1,27 @@
 # src/bot/chehejia_bot.py
 from __future__ import annotations
 
+import asyncio
 import base64
+import concurrent.futures
 import datetime
 import hashlib
 import json
+import random
 import time
 import threading
 import logging
+from collections import deque
 from pathlib import Path
-from typing import Optional, Dict, Any
-from queue import Queue, Empty
+from urllib.parse import urlsplit
+from typing import Optional, Dict, Any, Callable, List, Union
 
-from playwright.sync_api import sync_playwright, Page
+from playwright.async_api import async_playwright, Page
 from sqlalchemy import create_engine, text
 
 from config import settings
+from .broker import broker, atomic_write_json
+from .oidc import refresher, with_refresh_token
 
 botlog = logging.getLogger("bot")
 
@@ -23,8 +29,9 @@ botlog = logging.getLogger("bot")
 OUT = Path("out"); OUT.mkdir(exist_ok=True)
 QUEUE = OUT / "queue";  QUEUE.mkdir(exist_ok=True)
 RESULTS = OUT / "results"; RESULTS.mkdir(exist_ok=True)
-TOKEN_FILE = OUT / "token.json"
 STATUS_FILE = OUT / "status.json"
+# состояние сессии копится в памяти и сбрасывается (файл + bot_status) не чаще раза в N сек
+STATUS_FLUSH_SEC = 2.0
 
 # --------- Настройки поведения ---------
 USER_DATA_DIR   = settings.BOT_PROFILE_DIR
@@ -35,7 +42,7 @@ REPAIR_LIST_URL = getattr(settings, "BOT_REPAIR_LIST_URL", START_URL)
 LS_POLL_SEC          = float(getattr(settings, "BOT_LS_POLL_SEC", 2.5))
 # «тихий» лимит логов: если токен в LS не меняется — писать не чаще, чем раз в N сек
 LS_UNCHANGED_LOG_SEC = float(getattr(settings, "BOT_LS_UNCHANGED_LOG_SEC", 60.0))
-# плановое обновление токена — принудительный reload страницы раз в N сек
+# прежний фиксированный период reload — теперь только база для метрики reloads_avoided
 REFRESH_EVERY_SEC    = float(getattr(settings, "BOT_REFRESH_EVERY_SEC", 60.0))
 # сколько секунд после reload принимать «новый» токен (окно приёма)
 ROTATE_WINDOW_SEC    = float(getattr(settings, "BOT_ROTATE_WINDOW_SEC", 30.0))
@@ -44,7 +51,30 @@ ROTATE_WINDOW_SEC    = float(getattr(settings, "BOT_ROTATE_WINDOW_SEC", 30.0))
 DEFAULT_ACCESS_TOKEN_KEY  = "@@idaasjs@@::1pVr4hOFvSwvPUfCyJ6FiT::access_token"
 DEFAULT_ID_TOKEN_KEY      = "@@idaasjs@@::default::id_token"
 
+# --------- Перехват запросов (умолчания; переопределяются из bot_config) ---------
+# боту нужен только токен: картинки/шрифты/медиа не грузим вовсе, скрипты — только с «своих» хостов
+DEFAULT_BLOCK_TYPES = "image,font,media"
+# суффиксы хостов: idaas (id.lixiang.com) и api-boss (*.chehejia.com); хост START_URL — всегда свой
+DEFAULT_ALLOW_HOSTS = "lixiang.com,chehejia.com"
+REFRESH_SAMPLES = 20  # сколько последних refresh держать для статистики трафика
+
+# --------- Очередь команд ---------
+# меньше — раньше: операции с токеном/конфигом вперёд «тяжёлых» отладочных (скриншоты)
+OP_PRIORITY = {
+    "apply_config": 0,
+    "localstorage": 1, "cookies": 1, "clear_cookies": 1, "reload": 1, "goto": 1,
+    "eval": 2, "eval_batch": 2, "click": 2, "wait_response": 2,
+    "screenshot": 3,
+}
+LAT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
 # ============= Вспомогательные утилиты =============
+def _csv(s: Optional[str]) -> List[str]:
+    return [x.strip().lower() for x in (s or "").split(",") if x.strip()]
+
+def _host_allowed(host: str, allow: List[str]) -> bool:
+    return any(host == h or host.endswith("." + h) for h in allow)
+
 def _mask(tok: str, left: int = 6, right: int = 6) -> str:
     if not tok:
         return ""
@@ -75,24 +105,127 @@ def _short_sha(tok: str) -> str:
     t = tok.strip()
     return hashlib.sha256(t.encode("utf-8")).hexdigest()[:10]
 
-def _save_json(path: Path, obj: Dict[str, Any]) -> None:
-    try:
-        path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
-    except Exception:
-        pass
+_engine = None
+_engine_lock = threading.Lock()
+
+def _db():
+    """Один engine на процесс бота (конфиг сессий + bot_status), а не по engine на сессию."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, future=True, pool_size=2)
+    return _engine
+
+class CommandStats:
+    """Метрики очереди команд сессии: глубина, гистограммы латентности по op, таймауты/отказы."""
+
+    def __init__(self, max_depth: int):
+        self._lock = threading.Lock()
+        self.limit = max_depth
+        self.depth = 0
+        self.peak = 0
+        self.rejected = 0
+        self._ops: Dict[str, Dict[str, Any]] = {}
+
+    def _op(self, op: str) -> Dict[str, Any]:
+        st = self._ops.get(op)
+        if st is None:
+            st = self._ops[op] = {"count": 0, "errors": 0, "timeouts": 0, "expired": 0,
+                                  "sum_ms": 0.0, "wait_sum_ms": 0.0, "buckets": [0] * (len(LAT_BUCKETS_MS) + 1)}
+        return st
+
+    def enqueue(self) -> bool:
+        with self._lock:
+            if self.depth >= self.limit:
+                self.rejected += 1
+                return False
+            self.depth += 1
+            self.peak = max(self.peak, self.depth)
+            return True
+
+    def dequeue(self) -> None:
+        with self._lock:
+            self.depth -= 1
+
+    def observe(self, op: str, total_ms: float, wait_ms: float, ok: bool) -> None:
+        i = next((i for i, b in enumerate(LAT_BUCKETS_MS) if total_ms <= b), len(LAT_BUCKETS_MS))
+        with self._lock:
+            st = self._op(op)
+            st["count"] += 1
+            st["errors"] += 0 if ok else 1
+            st["sum_ms"] += total_ms
+            st["wait_sum_ms"] += wait_ms
+            st["buckets"][i] += 1
+
+    def count(self, op: str, what: str) -> None:
+        """what: timeouts (вызывающий не дождался) / expired (отменена до выполнения)."""
+        with self._lock:
+            self._op(op)[what] += 1
+
+    @staticmethod
+    def _quantile(buckets: List[int], q: float) -> Union[float, str, None]:
+        """Верхняя граница корзины квантиля; за последней корзиной — строка «>N» (Infinity — не JSON)."""
+        n = sum(buckets)
+        if not n:
+            return None
+        acc = 0
+        for i, c in enumerate(buckets):
+            acc += c
+            if acc >= q * n:
+                return float(LAT_BUCKETS_MS[i]) if i < len(LAT_BUCKETS_MS) else f">{LAT_BUCKETS_MS[-1]}"
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ops = {}
+            for op, st in self._ops.items():
+                n = st["count"]
+                ops[op] = {
+                    **{k: st[k] for k in ("count", "errors", "timeouts", "expired")},
+                    "mean_ms": round(st["sum_ms"] / n, 1) if n else None,
+                    "mean_wait_ms": round(st["wait_sum_ms"] / n, 1) if n else None,
+                    "p50_le_ms": self._quantile(st["buckets"], 0.5),
+                    "p99_le_ms": self._quantile(st["buckets"], 0.99),
+                    "histogram": {f"le_{b}": c for b, c in zip(LAT_BUCKETS_MS, st["buckets"])}
+                                 | {"inf": st["buckets"][-1]},
+                }
+            return {"depth": self.depth, "peak": self.peak, "limit": self.limit,
+                    "rejected": self.rejected, "ops": ops}
+
 
 # ============= Класс бота =============
 class ChehejiaBot:
     """
-    Фоновый Playwright-бот, все действия с page/context — строго в бот-потоке.
-    Внешний мир общается через очередь команд ._ask(…).
+    Фоновый Playwright-бот: свой поток с event loop asyncio, все действия
+    с page/context — строго в нём. Команды (._ask) — корутины, поставленные
+    в этот loop: выполняются сразу, без опроса очереди; refresh и опрос LS — таймеры.
+    index/size — место сессии в пуле (BotPool): свой профиль Chromium
+    и сдвиг планового refresh, чтобы сессии не обновлялись одновременно.
     """
-    def __init__(self):
+    def __init__(self, index: int = 0, size: int = 1,
+                 on_bearer: Optional[Callable[["ChehejiaBot", str, str, Optional[int]], None]] = None):
+        self.index = index
+        self.profile_dir = USER_DATA_DIR if index == 0 else f"{USER_DATA_DIR}-{index}"
+        # сессии пула обновляются не одновременно: каждая — чуть раньше предыдущей
+        self._refresh_offset = settings.BOT_REFRESH_LEAD_SEC * index / max(1, size)
+        self._on_bearer = on_bearer
         self._th: Optional[threading.Thread] = None
         self._stop = threading.Event()
         self._ready = threading.Event()
-        self._cmd_q: "Queue[Dict[str, Any]]" = Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_ev: Optional[asyncio.Event] = None
+        self._page_lock: Optional[asyncio.Lock] = None  # команды и refresh не идут параллельно
         self._page: Optional[Page] = None
+        self._cmdq: Optional[asyncio.PriorityQueue] = None
+        self._cmd_seq = 0
+        self.cmd_stats = CommandStats(settings.BOT_CMD_QUEUE_MAX)
+
+        # состояние для out/status*.json и bot_status (строка id = index + 1)
+        self.status_file = STATUS_FILE if index == 0 else OUT / f"status-{index}.json"
+        self._state: Dict[str, Any] = {}
+        self._state_dirty = False
+        self.state_stats = {"flushes": 0, "errors": 0, "last_error": ""}
 
         self._bearer: Optional[str] = None
         self._bearer_ts: float = 0.0
@@ -102,6 +235,16 @@ class ChehejiaBot:
         # окно приёма токена после планового reload
         self._rotate_window_until: float = 0.0
         self._last_refresh_ts: float = 0.0
+        self._next_refresh_ts: float = 0.0
+        self._fail_streak: int = 0
+        self._bearer_changed: Optional[asyncio.Event] = None
+        self.refresh_stats = {"reloads": 0, "rotated": 0, "failed": 0, "direct": 0}
+
+        # перехват запросов и учёт трафика (по Content-Length ответов)
+        self._routed = False
+        self._traffic = {"requests": 0, "bytes": 0, "blocked": 0}
+        self._blocked_by_type: Dict[str, int] = {}
+        self._refresh_samples: deque = deque(maxlen=REFRESH_SAMPLES)
 
         # антиспам по LS
         self._last_ls_hash: str = ""
@@ -114,19 +257,28 @@ class ChehejiaBot:
 
         self._lock = threading.RLock()
 
+        # здоровье сессии (см. BotPool.score)
+        self.started_ts: float = 0.0
+        self.errors: int = 0          # подряд неудачных goto/reload
+        self.timeouts: int = 0        # подряд команд без ответа
+        self.replaced: int = 0
+
         # Конфиг (могут прийти из БД)
         self._access_token_key = DEFAULT_ACCESS_TOKEN_KEY
         self._id_token_key     = DEFAULT_ID_TOKEN_KEY
         self._access_token_json = ""  # строка JSON или ""
         self._id_token_json     = ""  # строка JSON или ""
         self._sso_token         = ""  # значение cookie
+        self._block_enabled     = True
+        self._block_types       = DEFAULT_BLOCK_TYPES
+        self._allow_hosts       = DEFAULT_ALLOW_HOSTS
 
         # Попробуем загрузить из БД
         try:
-            engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, future=True)
-            with engine.begin() as conn:
+            with _db().begin() as conn:
                 row = conn.execute(text("""
-                    SELECT access_token_key, id_token_key, access_token_json, id_token_json, sso_token
+                    SELECT access_token_key, id_token_key, access_token_json, id_token_json, sso_token,
+                           block_enabled, block_resource_types, allow_hosts
                     FROM bot_config WHERE id=1
                 """)).mappings().first()
             if row:
@@ -135,6 +287,9 @@ class ChehejiaBot:
                 self._access_token_json = row["access_token_json"] or ""
                 self._id_token_json     = row["id_token_json"] or ""
                 self._sso_token         = row["sso_token"] or ""
+                self._block_enabled     = bool(row["block_enabled"])
+                self._block_types       = row["block_resource_types"] or DEFAULT_BLOCK_TYPES
+                self._allow_hosts       = row["allow_hosts"] or DEFAULT_ALLOW_HOSTS
         except Exception:
             pass
 
@@ -145,7 +300,10 @@ class ChehejiaBot:
             botlog.debug("start(): thread already alive")
             return
         self._stop.clear()
-        self._th = threading.Thread(target=self._run, daemon=True, name="ChehejiaBot")
+        self._ready.clear()
+        self.started_ts = time.time()
+        self.errors = self.timeouts = 0
+        self._th = threading.Thread(target=self._run, daemon=True, name=f"ChehejiaBot-{self.index}")
         self._th.start()
         ok = self._ready.wait(timeout=20.0)
         if not ok:
@@ -153,6 +311,12 @@ class ChehejiaBot:
 
     def stop(self):
         self._stop.set()
+        loop, ev = self._loop, self._stop_ev
+        if loop is not None and ev is not None:
+            try:
+                loop.call_soon_threadsafe(ev.set)
+            except RuntimeError:
+                pass  # loop уже закрыт
         if self._th:
             self._th.join(timeout=5.0)
             botlog.info("bot thread joined")
@@ -164,10 +328,20 @@ class ChehejiaBot:
         with self._lock:
             return {
                 "ok": True,
+                "index": self.index,
                 "running": self.is_running(),
                 "have_bearer": bool(self._bearer),
                 "bearer_source": self._bearer_source,
                 "bearer_updated_ts": self._bearer_ts,
+                "bearer_exp": _jwt_exp_unix(self._bearer),
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "replaced": self.replaced,
+                "refresh": self.refresh_info(),
+                "traffic": self.traffic_info(),
+                "direct_refresh": refresher.stats(),
+                "commands": self.cmd_stats.snapshot(),
+                "state": {**self.state_stats, "dirty": self._state_dirty},
             }
 
     def screenshot(self, path: str = "out/last.png") -> str:
@@ -189,6 +363,10 @@ class ChehejiaBot:
     def eval(self, script: str, timeout: float = 30.0) -> Dict[str, Any]:
         return self._ask({"op": "eval", "script": script}, timeout)
 
+    def eval_many(self, scripts: List[str], timeout: float = 30.0) -> Dict[str, Any]:
+        """Несколько скриптов одной командой: одна очередь/блокировка страницы на всю пачку."""
+        return self._ask({"op": "eval_batch", "scripts": list(scripts)}, timeout)
+
     def wait_response(self, url_substr: str, timeout_ms: int = 15000) -> Dict[str, Any]:
         if not url_substr:
             return {"ok": False, "error": "url_substr is required"}
@@ -224,6 +402,9 @@ class ChehejiaBot:
         access_token_json: str | None = None,  # "" → очистить; None → не менять
         id_token_json: str | None = None,      # "" → очистить; None → не менять
         sso_token: str | None = None,          # "" → очистить; None → не менять
+        block_enabled: bool | None = None,
+        block_resource_types: str | None = None,  # "" → умолчание; None → не менять
+        allow_hosts: str | None = None,           # "" → умолчание; None → не менять
         apply_now: bool = True,
         reload_after: bool = False,
         persist: bool = True,                  # файловое persist нам не нужно — оставлено для совместимости
@@ -243,6 +424,12 @@ class ChehejiaBot:
                 self._id_token_json = id_token_json
             if sso_token is not None:
                 self._sso_token = sso_token
+            if block_enabled is not None:
+                self._block_enabled = bool(block_enabled)
+            if block_resource_types is not None:
+                self._block_types = block_resource_types or DEFAULT_BLOCK_TYPES
+            if allow_hosts is not None:
+                self._allow_hosts = allow_hosts or DEFAULT_ALLOW_HOSTS
 
         if apply_now:
             self._ask({
@@ -269,26 +456,110 @@ class ChehejiaBot:
                 "has_access_token_json": bool(self._access_token_json),
                 "has_id_token_json": bool(self._id_token_json),
                 "has_sso_token": bool(self._sso_token),
+                "block_enabled": self._block_enabled,
+                "block_resource_types": self._block_types,
+                "allow_hosts": self._allow_hosts,
             }
 
     # ==================== Внутренняя кухня ====================
 
     def _ask(self, cmd: Dict[str, Any], timeout: float) -> Dict[str, Any]:
-        done = threading.Event()
-        box: Dict[str, Any] = {}
-        self._cmd_q.put({"cmd": cmd, "done": done, "box": box})
-        ok = done.wait(timeout=timeout)
-        if not ok:
-            botlog.warning("cmd=%s timeout after %.1fs", cmd.get("op"), timeout)
+        """
+        Команда в очередь бот-потока (приоритет по OP_PRIORITY, FIFO внутри приоритета).
+        Очередь ограничена BOT_CMD_QUEUE_MAX; не дождавшиеся ответа команды отменяются
+        и не выполняются, если ещё не начались.
+        """
+        loop, q = self._loop, self._cmdq
+        op = cmd.get("op") or "?"
+        if loop is None or q is None or not self._ready.is_set() or self._stop.is_set():
+            return {"ok": False, "error": "bot not running"}
+        if not self.cmd_stats.enqueue():
+            botlog.warning("bot#%s cmd=%s rejected: queue full (%s)", self.index, op, self.cmd_stats.limit)
+            return {"ok": False, "error": "bot busy"}
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            self._cmd_seq += 1
+            item = (OP_PRIORITY.get(op, 2), self._cmd_seq, time.monotonic(), cmd, fut)
+        try:
+            loop.call_soon_threadsafe(q.put_nowait, item)
+        except RuntimeError:
+            self.cmd_stats.dequeue()
+            return {"ok": False, "error": "bot not running"}
+        try:
+            res = fut.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()  # ещё в очереди — воркер её пропустит
+            self.timeouts += 1
+            self.cmd_stats.count(op, "timeouts")
+            botlog.warning("bot#%s cmd=%s timeout after %.1fs", self.index, op, timeout)
             return {"ok": False, "error": "bot timeout"}
-        return box["res"]
+        except concurrent.futures.CancelledError:
+            return {"ok": False, "error": "bot stopped"}
+        self.timeouts = 0
+        return res
+
+    async def _cmd_worker(self) -> None:
+        """Единственный исполнитель команд: по одной, в порядке приоритета."""
+        while True:
+            _prio, _seq, ts, cmd, fut = await self._cmdq.get()
+            self.cmd_stats.dequeue()
+            op = cmd.get("op") or "?"
+            if not fut.set_running_or_notify_cancel():
+                self.cmd_stats.count(op, "expired")
+                continue
+            started = time.monotonic()
+            try:
+                res = await self._exec(cmd)
+            except asyncio.CancelledError:
+                fut.set_result({"ok": False, "error": "bot stopped"})
+                raise
+            now = time.monotonic()
+            self.cmd_stats.observe(op, (now - ts) * 1000.0, (started - ts) * 1000.0, bool(res.get("ok")))
+            fut.set_result(res)
+
+    def _drain_commands(self) -> None:
+        """Остановка: всё, что осталось в очереди, отменяем — вызывающие получат «bot stopped»."""
+        while self._cmdq is not None and not self._cmdq.empty():
+            *_rest, fut = self._cmdq.get_nowait()
+            self.cmd_stats.dequeue()
+            fut.cancel()
 
     def _save_status(self, extra: Dict[str, Any] | None = None):
+        """Только снимок в памяти; на диск/в БД его отнесёт _status_timer (debounce)."""
         with self._lock:
-            st = {"ts": time.time(), "have_bearer": bool(self._bearer)}
-        if extra:
-            st.update(extra)
-        _save_json(STATUS_FILE, st)
+            self._state = {"ts": time.time(), "index": self.index, "have_bearer": bool(self._bearer),
+                           "bearer_source": self._bearer_source, "bearer_exp": _jwt_exp_unix(self._bearer),
+                           **(extra or {})}
+            self._state_dirty = True
+
+    def _flush_status(self) -> None:
+        """Запись снимка: файл через write-rename + upsert в bot_status. Выполняется вне event loop."""
+        with self._lock:
+            if not self._state_dirty:
+                return
+            st, self._state_dirty = dict(self._state), False
+        try:
+            atomic_write_json(self.status_file, st)
+            with _db().begin() as conn:
+                conn.execute(text("""
+                    INSERT INTO bot_status (id, have_bearer, last_note, updated_at)
+                    VALUES (:id, :have_bearer, :note, now())
+                    ON CONFLICT (id) DO UPDATE
+                    SET have_bearer = excluded.have_bearer, last_note = excluded.last_note, updated_at = now()
+                """), {"id": self.index + 1, "have_bearer": st["have_bearer"],
+                       "note": json.dumps(st, ensure_ascii=False, separators=(",", ":"))})
+            self.state_stats["flushes"] += 1
+        except Exception as e:
+            self.state_stats["errors"] += 1
+            if self.state_stats["last_error"] != repr(e):
+                botlog.warning("bot#%s status flush error: %r", self.index, e)
+            self.state_stats["last_error"] = repr(e)
+
+    async def _status_timer(self):
+        while not self._stop_ev.is_set():
+            if self._state_dirty:
+                await asyncio.to_thread(self._flush_status)
+            await self._sleep(STATUS_FLUSH_SEC)
 
     def _accepting_rotation_now(self) -> bool:
         """Можно ли принимать новый токен сейчас?"""
@@ -313,6 +584,8 @@ class ChehejiaBot:
             self._bearer_ts = time.time()
             self._bearer_source = source
             self._have_initial_bearer = True  # первый принят — дальше только по окну ротации
+        if self._bearer_changed is not None:
+            self._bearer_changed.set()  # _set_bearer вызывается только из event loop бота
 
         exp_unix = _jwt_exp_unix(token)
         ttl = (exp_unix - time.time()) if exp_unix else None
@@ -328,15 +601,12 @@ class ChehejiaBot:
             _mask(token)
         )
 
-        _save_json(TOKEN_FILE, {
-            "bearer": token,
-            "hash": _short_sha(token),
-            "masked": _mask(token),
-            "len": len(token),
-            "source": source,
-            "ts": self._bearer_ts,
-            "exp": exp_unix,
-        })
+        # воркеры API получают токен через брокер (Redis pub/sub / out/token.json);
+        # в пуле публикует BotPool — только самый свежий из токенов сессий
+        if self._on_bearer is not None:
+            self._on_bearer(self, token, source, exp_unix)
+        else:
+            publish_bearer(token, source, exp_unix)
 
         self._save_status()
 
@@ -368,23 +638,82 @@ class ChehejiaBot:
         except Exception as e:
             botlog.debug("network_tap err: %r", e)
 
+    # --- перехват запросов: режем всё, что не нужно для получения токена ---
+    def _blocked_kind(self, req) -> Optional[str]:
+        rtype = req.resource_type
+        with self._lock:
+            types, allow = _csv(self._block_types), _csv(self._allow_hosts)
+        if rtype in types:
+            return rtype
+        if rtype == "script":
+            host = (urlsplit(req.url).hostname or "").lower()
+            if host != (urlsplit(START_URL).hostname or "").lower() and not _host_allowed(host, allow):
+                return "third_party_script"
+        return None
+
+    async def _route(self, route):
+        try:
+            kind = self._blocked_kind(route.request)
+            if kind is None:
+                await route.continue_()
+                return
+            self._traffic["blocked"] += 1
+            self._blocked_by_type[kind] = self._blocked_by_type.get(kind, 0) + 1
+            await route.abort("blockedbyclient")
+        except Exception as e:
+            botlog.debug("route err: %r", e)  # страница/контекст закрылись посреди запроса
+
+    async def _apply_request_policy(self, ctx) -> None:
+        """Включает/снимает перехват по текущему конфигу (перехват отключает HTTP-кэш — без него не держим)."""
+        with self._lock:
+            want = self._block_enabled
+        if want and not self._routed:
+            await ctx.route("**/*", self._route)
+        elif not want and self._routed:
+            await ctx.unroute("**/*", self._route)
+        self._routed = want
+
+    def _on_response(self, resp):
+        self._traffic["requests"] += 1
+        try:
+            self._traffic["bytes"] += int(resp.headers.get("content-length") or 0)
+        except ValueError:
+            pass
+
+    def traffic_info(self) -> Dict[str, Any]:
+        """Трафик сессии и средние на один refresh — отдельно с политикой и без: разница = экономия."""
+        out: Dict[str, Any] = {**self._traffic, "blocked_by_type": dict(self._blocked_by_type),
+                               "policy": self._routed}
+        samples = list(self._refresh_samples)
+        avg = {}
+        for mode, name in ((True, "with_policy"), (False, "without_policy")):
+            xs = [x for x in samples if x["policy"] is mode]
+            if xs:
+                avg[name] = {k: round(sum(x[k] for x in xs) / len(xs), 2)
+                             for k in ("requests", "bytes", "blocked", "sec")}
+                avg[name]["refreshes"] = len(xs)
+        if len(avg) == 2:
+            avg["saved_per_refresh"] = {k: round(avg["without_policy"][k] - avg["with_policy"][k], 2)
+                                        for k in ("bytes", "sec")}
+        out["per_refresh"] = avg
+        out["last_refresh"] = samples[-1] if samples else None
+        return out
+
     # --- периодический опрос LS, со сдерживанием логов ---
-    def _poll_localstorage_once(self):
+    async def _poll_localstorage_once(self):
         try:
             if self._page and not self._page.is_closed():
                 # читаем access_token.raw из LS
-                raw = self._page.evaluate(f"""
-                    (() => {{
-                      const s = localStorage.getItem("{self._access_token_key}");
+                raw = await self._page.evaluate("""(key) => {
+                      const s = localStorage.getItem(key);
                       if (!s) return null;
-                      try {{
+                      try {
                         const js = JSON.parse(s);
                         return js?.body?.raw || null;
-                      }} catch(_){{
+                      } catch(_){
                         return null;
-                      }}
-                    }})()
-                """)
+                      }
+                    }""", self._access_token_key)
                 if not isinstance(raw, str) or not raw:
                     return
 
@@ -408,28 +737,353 @@ class ChehejiaBot:
         except Exception as e:
             botlog.debug("poll_localstorage err: %r", e)
 
-    def _plan_refresh_if_needed(self):
-        """Раз в REFRESH_EVERY_SEC перезагружаем страницу и открываем окно приёма нового токена."""
+    async def _ls_poll_timer(self):
+        while not self._stop_ev.is_set():
+            async with self._page_lock:
+                await self._poll_localstorage_once()
+            await self._sleep(LS_POLL_SEC)
+
+    # --- планировщик обновления токена по exp ---
+    def _plan_next_refresh(self) -> float:
+        """
+        Когда делать следующий reload: за BOT_REFRESH_LEAD_SEC (+ сдвиг сессии в пуле,
+        − случайный jitter) до exp текущего токена; после неудачи — экспоненциальный backoff.
+        """
+        now = time.time()
+        if self._fail_streak:
+            delay = min(settings.BOT_REFRESH_MIN_SEC * (2 ** (self._fail_streak - 1)),
+                        settings.BOT_REFRESH_BACKOFF_MAX_SEC)
+            return now + delay * random.uniform(0.8, 1.2)
+        exp = _jwt_exp_unix(self._bearer)
+        if exp is None:
+            # токена нет — пробуем скоро; токен без exp — редкий плановый reload
+            return now + (settings.BOT_REFRESH_MIN_SEC if not self._bearer else settings.BOT_REFRESH_MAX_SEC)
+        at = exp - settings.BOT_REFRESH_LEAD_SEC - self._refresh_offset \
+            - random.uniform(0.0, settings.BOT_REFRESH_JITTER_SEC)
+        return min(max(at, now + settings.BOT_REFRESH_MIN_SEC), now + settings.BOT_REFRESH_MAX_SEC)
+
+    async def _refresh_direct(self) -> bool:
+        """Токен напрямую у IdP (см. oidc.DirectRefresher) — один HTTP-запрос вместо загрузки SPA."""
+        with self._lock:
+            cfg = {"access_token_key": self._access_token_key, "access_token_json": self._access_token_json,
+                   "id_token_json": self._id_token_json, "sso_token": self._sso_token}
+        before = self._bearer
+        tok = await refresher.refresh(cfg)
+        if not tok:
+            return False
+        if tok.get("refresh_token"):
+            # ротированный refresh_token — в bot_config: после рестарта не предъявим израсходованный
+            acc_json = with_refresh_token(cfg["access_token_json"], tok["refresh_token"])
+            with self._lock:
+                self._access_token_json = acc_json
+            await asyncio.to_thread(self._save_access_token_json, acc_json)
+        self._rotate_window_until = time.time() + ROTATE_WINDOW_SEC
+        self._set_bearer(tok["access_token"], "oidc")
+        if not self._bearer or self._bearer == before:
+            return False
+        self._last_refresh_ts = time.time()
+        self._fail_streak = 0
+        self.refresh_stats["direct"] += 1
+        self.refresh_stats["rotated"] += 1
+        return True
+
+    def _save_access_token_json(self, acc_json: str) -> None:
+        try:
+            with _db().begin() as conn:
+                conn.execute(text("UPDATE bot_config SET access_token_json = :v, updated_at = now() WHERE id = 1"),
+                             {"v": acc_json})
+        except Exception as e:
+            botlog.warning("bot#%s save refresh_token error: %r", self.index, e)
+
+    async def _refresh_once(self) -> None:
+        """Прямой refresh у IdP, иначе reload страницы и ожидание нового токена в окне ROTATE_WINDOW_SEC."""
+        if refresher.enabled() and await self._refresh_direct():
+            return
         if not self._page or self._page.is_closed():
             return
+        before = self._bearer
+        self._bearer_changed.clear()
         now = time.time()
-        if (now - self._last_refresh_ts) < REFRESH_EVERY_SEC:
-            return
         self._last_refresh_ts = now
+        self.refresh_stats["reloads"] += 1
+        traffic0, t0 = dict(self._traffic), time.monotonic()
+        async with self._page_lock:
+            try:
+                botlog.debug("bot#%s planned refresh → reload()", self.index)
+                self._rotate_window_until = now + ROTATE_WINDOW_SEC
+                await self._page.reload(wait_until="domcontentloaded")
+                self.errors = 0
+            except Exception as e:
+                self.errors += 1
+                botlog.warning("bot#%s planned reload error: %r", self.index, e)
+        took = time.monotonic() - t0
         try:
-            botlog.debug("planned refresh → reload()")
-            self._rotate_window_until = now + ROTATE_WINDOW_SEC
-            self._page.reload(wait_until="domcontentloaded")
-        except Exception as e:
-            botlog.warning("planned reload error: %r", e)
+            await asyncio.wait_for(self._bearer_changed.wait(),
+                                   timeout=max(0.0, self._rotate_window_until - time.time()))
+        except asyncio.TimeoutError:
+            pass
+        # запросы, догруженные страницей после domcontentloaded, тоже идут в счёт этого refresh
+        sample = {k: self._traffic[k] - traffic0[k] for k in traffic0}
+        sample.update(ts=now, sec=round(took, 3), policy=self._routed)
+        self._refresh_samples.append(sample)
+        botlog.debug("bot#%s refresh traffic: %s", self.index, sample)
+        if self._bearer and self._bearer != before:
+            self._fail_streak = 0
+            self.refresh_stats["rotated"] += 1
+        else:
+            self._fail_streak += 1
+            self.refresh_stats["failed"] += 1
+            botlog.info("bot#%s refresh gave no new token (streak=%s)", self.index, self._fail_streak)
+
+    async def _refresh_timer(self):
+        while not self._stop_ev.is_set():
+            self._next_refresh_ts = self._plan_next_refresh()
+            botlog.debug("bot#%s next refresh in %.0fs", self.index, self._next_refresh_ts - time.time())
+            # токен могут обновить и без нас (SPA сама, команда reload) — тогда пересчитываем
+            while not self._stop_ev.is_set():
+                left = self._next_refresh_ts - time.time()
+                if left <= 0:
+                    break
+                self._bearer_changed.clear()
+                try:
+                    await asyncio.wait_for(self._bearer_changed.wait(), timeout=left)
+                except asyncio.TimeoutError:
+                    break
+                self._fail_streak = 0
+                self._next_refresh_ts = self._plan_next_refresh()
+            if self._stop_ev.is_set():
+                return
+            await self._refresh_once()
+
+    def refresh_info(self) -> Dict[str, Any]:
+        """Метрики планировщика: сколько reload сделано и сколько сэкономлено против фиксированного периода."""
+        up = max(0.0, time.time() - self.started_ts) if self.started_ts else 0.0
+        legacy = int(up // REFRESH_EVERY_SEC) if REFRESH_EVERY_SEC > 0 else 0
+        return {
+            **self.refresh_stats,
+            "reloads_avoided": max(0, legacy - self.refresh_stats["reloads"]),
+            "next_refresh_in_sec": round(self._next_refresh_ts - time.time(), 1) if self._next_refresh_ts else None,
+            "fail_streak": self._fail_streak,
+        }
+
+    async def _sleep(self, sec: float) -> None:
+        """Пауза таймера, прерываемая stop()."""
+        try:
+            await asyncio.wait_for(self._stop_ev.wait(), timeout=sec)
+        except asyncio.TimeoutError:
+            pass
+
+    # ==================== Команды (в event loop бота) ====================
+    async def _exec(self, cmd: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._page_lock:
+            try:
+                return await self._do(cmd)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                botlog.exception("cmd error: %r", e)
+                return {"ok": False, "error": repr(e)}
+
+    async def _do(self, cmd: Dict[str, Any]) -> Dict[str, Any]:
+        page = self._page
+        op = cmd.get("op")
+        if page is None:
+            return {"ok": False, "error": "page not ready"}
+
+        if op == "goto":
+            url = (cmd.get("url") or "").strip()
+            if not url:
+                raise ValueError("url is required")
+            botlog.info("goto %s", url)
+            self._rotate_window_until = time.time() + ROTATE_WINDOW_SEC
+            await page.goto(url, wait_until="domcontentloaded")
+            return {"ok": True}
+
+        if op == "reload":
+            botlog.info("reload()")
+            self._rotate_window_until = time.time() + ROTATE_WINDOW_SEC
+            await page.reload(wait_until="domcontentloaded")
+            return {"ok": True}
+
+        if op == "click":
+            sel = cmd.get("selector")
+            nth = int(cmd.get("nth", 0))
+            if not sel:
+                raise ValueError("selector is required")
+            botlog.debug("click sel=%s nth=%s", sel, nth)
+            loc = page.locator(sel)
+            if nth:
+                loc = loc.nth(nth)
+            await loc.click(timeout=5000)
+            return {"ok": True}
+
+        if op == "eval":
+            script = cmd.get("script")
+            if not script:
+                raise ValueError("script is required")
+            botlog.debug("eval script len=%s", len(script))
+            return {"ok": True, "result": await page.evaluate(script)}
+
+        if op == "eval_batch":
+            scripts = cmd.get("scripts") or []
+            if not scripts:
+                raise ValueError("scripts is required")
+            results = []
+            for sc in scripts:
+                try:
+                    results.append({"ok": True, "result": await page.evaluate(sc)})
+                except Exception as e:
+                    results.append({"ok": False, "error": repr(e)})
+            return {"ok": all(r["ok"] for r in results), "results": results}
+
+        if op == "wait_response":
+            url_substr = (cmd.get("url_substr") or "").strip()
+            timeout_ms = int(cmd.get("timeout_ms") or 15000)
+            if not url_substr:
+                raise ValueError("url_substr is required")
+            botlog.debug("wait_response contains=%s timeout_ms=%s", url_substr, timeout_ms)
+
+            def _predicate(resp):
+                try:
+                    return url_substr in (resp.url or "")
+                except Exception:
+                    return False
+
+            resp = await page.wait_for_event("response", predicate=_predicate, timeout=timeout_ms)
+            info: Dict[str, Any] = {
+                "ok": True,
+                "url": resp.url,
+                "status": resp.status,
+                "headers": dict(resp.headers or {}),
+            }
+            try:
+                ctype = (resp.headers.get("content-type") or "").lower()
+                if "application/json" in ctype:
+                    try:
+                        info["json"] = await resp.json()
+                    except Exception:
+                        info["text"] = await resp.text()
+                else:
+                    txt = await resp.text()
+                    info["text"] = txt if len(txt) <= 200_000 else txt[:200_000]
+            except Exception as e:
+                info["body_error"] = repr(e)
+            return info
+
+        if op == "cookies":
+            try:
+                ck = await page.context.cookies()
+                safe = [{"name": c.get("name"), "domain": c.get("domain"), "path": c.get("path")} for c in ck]
+                return {"ok": True, "cookies": safe}
+            except Exception as e:
+                return {"ok": False, "error": repr(e)}
+
+        if op == "clear_cookies":
+            try:
+                await page.context.clear_cookies()
+                botlog.info("cookies cleared")
+                return {"ok": True}
+            except Exception as e:
+                return {"ok": False, "error": repr(e)}
+
+        if op == "localstorage":
+            try:
+                data = await page.evaluate(
+                    "(()=>{let o={};for(let i=0;i<localStorage.length;i++){const k=localStorage.key(i);o[k]=localStorage.getItem(k)};return o})()"
+                )
+                if bool(cmd.get("full")):
+                    # Полные значения, без маскирования
+                    items = [{"key": k, "value": (data or {}).get(k)} for k in sorted((data or {}).keys())]
+                else:
+                    # Маскирование длинных строк (как раньше)
+                    masked = {
+                        k: (v[:24] + "..." + v[-12:] if isinstance(v, str) and len(v) > 40 else v)
+                        for k, v in (data or {}).items()
+                    }
+                    items = [{"key": k, "value": masked[k]} for k in sorted(masked.keys())]
+                return {"ok": True, "items": items}
+            except Exception as e:
+                return {"ok": False, "error": repr(e)}
+
+        if op == "screenshot":
+            try:
+                path = cmd.get("path") or "out/last.png"
+                await page.screenshot(path=path, full_page=True)
+                return {"ok": True, "path": path}
+            except Exception as e:
+                return {"ok": False, "error": repr(e)}
+
+        if op == "apply_config":
+            # Применение конфига строго в бот-потоке
+            try:
+                accK = cmd.get("access_token_key")
+                idK  = cmd.get("id_token_key")
+                accProvided = bool(cmd.get("acc_json_provided"))
+                idProvided  = bool(cmd.get("id_json_provided"))
+                accVal = cmd.get("access_token_json")
+                idVal  = cmd.get("id_token_json")
+
+                # localStorage apply
+                await page.evaluate(
+                    """([accK, accProvided, accVal, idK, idProvided, idVal]) => {
+                      try {
+                        if (accK && accProvided) {
+                          if (accVal === "") localStorage.removeItem(accK);
+                          else localStorage.setItem(accK, accVal);
+                        }
+                        if (idK && idProvided) {
+                          if (idVal === "") localStorage.removeItem(idK);
+                          else localStorage.setItem(idK, idVal);
+                        }
+                      } catch(e){}
+                    }""",
+                    [accK, accProvided, accVal, idK, idProvided, idVal]
+                )
+
+                # SSO cookie apply (только установка; очистку лучше делать clear_cookies)
+                if bool(cmd.get("sso_provided")):
+                    sso = cmd.get("sso_token")
+                    if sso:
+                        await page.context.add_cookies([
+                            {"name": "sso_token", "value": sso, "domain": "id.lixiang.com", "path": "/", "httpOnly": True, "secure": True, "sameSite": "None"},
+                            {"name": "sso_token", "value": sso, "domain": "id.lixiang.com", "path": "/api", "httpOnly": True, "secure": True, "sameSite": "None"},
+                        ])
+
+                await self._apply_request_policy(page.context)
+
+                if bool(cmd.get("reload_after")):
+                    self._rotate_window_until = time.time() + ROTATE_WINDOW_SEC
+                    await page.reload(wait_until="domcontentloaded")
+
+                return {"ok": True}
+            except Exception as e:
+                return {"ok": False, "error": repr(e)}
+
+        return {"ok": False, "error": f"unknown op: {op}"}
 
     # ==================== Основной поток бота ====================
     def _run(self):
-        botlog.info("launching chromium (headless=%s) with profile %s",
-                    bool(settings.BOT_HEADLESS), USER_DATA_DIR)
-        with sync_playwright() as p:
-            ctx = p.chromium.launch_persistent_context(
-                USER_DATA_DIR,
+        try:
+            asyncio.run(self._main())
+        except Exception as e:
+            botlog.exception("bot#%s loop crashed: %r", self.index, e)
+        finally:
+            self._loop = None
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_ev = asyncio.Event()
+        self._page_lock = asyncio.Lock()
+        self._bearer_changed = asyncio.Event()
+        self._cmdq = asyncio.PriorityQueue()
+        if self._stop.is_set():
+            return
+
+        botlog.info("bot#%s launching chromium (headless=%s) with profile %s",
+                    self.index, bool(settings.BOT_HEADLESS), self.profile_dir)
+        async with async_playwright() as p:
+            ctx = await p.chromium.launch_persistent_context(
+                self.profile_dir,
                 headless=bool(settings.BOT_HEADLESS),
                 args=["--disable-blink-features=AutomationControlled"],
             )
@@ -450,11 +1104,11 @@ class ChehejiaBot:
                   }} catch(e){{ console.error('init LS error', e); }}
                 }})();
                 """
-                ctx.add_init_script(init_script)
+                await ctx.add_init_script(init_script)
 
             if self._sso_token:
                 try:
-                    ctx.add_cookies([
+                    await ctx.add_cookies([
                         {"name": "sso_token", "value": self._sso_token, "domain": "id.lixiang.com", "path": "/", "httpOnly": True, "secure": True, "sameSite": "None"},
                         {"name": "sso_token", "value": self._sso_token, "domain": "id.lixiang.com", "path": "/api", "httpOnly": True, "secure": True, "sameSite": "None"},
                     ])
@@ -462,223 +1116,189 @@ class ChehejiaBot:
                 except Exception as e:
                     botlog.warning("sso add cookie err: %r", e)
 
-            page = ctx.new_page()
+            self._routed = False
+            await self._apply_request_policy(ctx)
+
+            page = await ctx.new_page()
             self._page = page
             page.on("request", self._network_tap)
+            page.on("response", self._on_response)
 
             try:
-                botlog.info("goto START_URL %s", START_URL)
-                page.goto(START_URL, wait_until="domcontentloaded")
+                botlog.info("bot#%s goto START_URL %s", self.index, START_URL)
+                await page.goto(START_URL, wait_until="domcontentloaded")
             except Exception as e:
-                botlog.error("start goto err: %r", e)
+                self.errors += 1
+                botlog.error("bot#%s start goto err: %r", self.index, e)
+            self._last_refresh_ts = time.time()
 
             self._ready.set()
             self._save_status({"started": True})
 
-            last_poll = 0.0
-
+            timers = [asyncio.create_task(self._refresh_timer(), name="bot-refresh"),
+                      asyncio.create_task(self._ls_poll_timer(), name="bot-ls-poll"),
+                      asyncio.create_task(self._cmd_worker(), name="bot-commands"),
+                      asyncio.create_task(self._status_timer(), name="bot-status")]
             try:
-                while not self._stop.is_set():
-                    # плановый refresh
-                    self._plan_refresh_if_needed()
-
-                    # опрос LS
-                    if time.time() - last_poll > LS_POLL_SEC:
-                        self._poll_localstorage_once()
-                        last_poll = time.time()
-
-                    # обработка команд
-                    try:
-                        item = self._cmd_q.get(timeout=0.15)
-                    except Empty:
-                        continue
-
-                    cmd, done, box = item["cmd"], item["done"], item["box"]
-                    op = cmd.get("op")
-                    try:
-                        if op == "goto":
-                            url = (cmd.get("url") or "").strip()
-                            if not url:
-                                raise ValueError("url is required")
-                            botlog.info("goto %s", url)
-                            self._rotate_window_until = time.time() + ROTATE_WINDOW_SEC
-                            page.goto(url, wait_until="domcontentloaded")
-                            box["res"] = {"ok": True}
-
-                        elif op == "reload":
-                            botlog.info("reload()")
-                            self._rotate_window_until = time.time() + ROTATE_WINDOW_SEC
-                            page.reload(wait_until="domcontentloaded")
-                            box["res"] = {"ok": True}
-
-                        elif op == "click":
-                            sel = cmd.get("selector")
-                            nth = int(cmd.get("nth", 0))
-                            if not sel:
-                                raise ValueError("selector is required")
-                            botlog.debug("click sel=%s nth=%s", sel, nth)
-                            loc = page.locator(sel)
-                            if nth:
-                                loc = loc.nth(nth)
-                            loc.click(timeout=5000)
-                            box["res"] = {"ok": True}
-
-                        elif op == "eval":
-                            script = cmd.get("script")
-                            if not script:
-                                raise ValueError("script is required")
-                            botlog.debug("eval script len=%s", len(script))
-                            val = page.evaluate(script)
-                            box["res"] = {"ok": True, "result": val}
-
-                        elif op == "wait_response":
-                            url_substr = (cmd.get("url_substr") or "").strip()
-                            timeout_ms = int(cmd.get("timeout_ms") or 15000)
-                            if not url_substr:
-                                raise ValueError("url_substr is required")
-
-                            botlog.debug("wait_response contains=%s timeout_ms=%s", url_substr, timeout_ms)
-                            target = url_substr
-
-                            def _predicate(resp):
-                                try:
-                                    return target in (resp.url or "")
-                                except Exception:
-                                    return False
-
-                            try:
-                                resp = page.wait_for_event("response", predicate=_predicate, timeout=timeout_ms)
-                            except AttributeError:
-                                resp = page.context.wait_for_event("response", predicate=_predicate, timeout=timeout_ms)
-
-                            info: Dict[str, Any] = {
-                                "ok": True,
-                                "url": resp.url,
-                                "status": resp.status,
-                                "headers": dict(resp.headers or {}),
-                            }
-
-                            try:
-                                ctype = (resp.headers.get("content-type") or "").lower()
-                                if "application/json" in ctype:
-                                    try:
-                                        info["json"] = resp.json()
-                                    except Exception:
-                                        info["text"] = resp.text()
-                                else:
-                                    txt = resp.text()
-                                    info["text"] = txt if len(txt) <= 200_000 else txt[:200_000]
-                            except Exception as e:
-                                info["body_error"] = repr(e)
-
-                            box["res"] = info
-
-                        elif op == "cookies":
-                            try:
-                                ck = page.context.cookies()
-                                safe = [{"name": c.get("name"), "domain": c.get("domain"), "path": c.get("path")} for c in ck]
-                                box["res"] = {"ok": True, "cookies": safe}
-                            except Exception as e:
-                                box["res"] = {"ok": False, "error": repr(e)}
-
-                        elif op == "clear_cookies":
-                            try:
-                                page.context.clear_cookies()
-                                botlog.info("cookies cleared")
-                                box["res"] = {"ok": True}
-                            except Exception as e:
-                                box["res"] = {"ok": False, "error": repr(e)}
-
-                        elif op == "localstorage":
-                            try:
-                                data = page.evaluate(
-                                    "(()=>{let o={};for(let i=0;i<localStorage.length;i++){const k=localStorage.key(i);o[k]=localStorage.getItem(k)};return o})()"
-                                )
-
-                                if bool(cmd.get("full")):
-                                    # Полные значения, без маскирования
-                                    items = [{"key": k, "value": (data or {}).get(k)} for k in sorted((data or {}).keys())]
-                                else:
-                                    # Маскирование длинных строк (как раньше)
-                                    masked = {
-                                        k: (v[:24] + "..." + v[-12:] if isinstance(v, str) and len(v) > 40 else v)
-                                        for k, v in (data or {}).items()
-                                    }
-                                    items = [{"key": k, "value": masked[k]} for k in sorted(masked.keys())]
-
-                                box["res"] = {"ok": True, "items": items}
-                            except Exception as e:
-                                box["res"] = {"ok": False, "error": repr(e)}
-
-
-                        elif op == "screenshot":
-                            try:
-                                path = cmd.get("path") or "out/last.png"
-                                page.screenshot(path=path, full_page=True)
-                                box["res"] = {"ok": True, "path": path}
-                            except Exception as e:
-                                box["res"] = {"ok": False, "error": repr(e)}
-
-                        elif op == "apply_config":
-                            # Применение конфига строго в бот-потоке
-                            try:
-                                accK = cmd.get("access_token_key")
-                                idK  = cmd.get("id_token_key")
-                                accProvided = bool(cmd.get("acc_json_provided"))
-                                idProvided  = bool(cmd.get("id_json_provided"))
-                                accVal = cmd.get("access_token_json")
-                                idVal  = cmd.get("id_token_json")
-
-                                # localStorage apply
-                                page.evaluate(
-                                    """(accK, accProvided, accVal, idK, idProvided, idVal) => {
-                                      try {
-                                        if (accK && accProvided) {
-                                          if (accVal === "") localStorage.removeItem(accK);
-                                          else localStorage.setItem(accK, accVal);
-                                        }
-                                        if (idK && idProvided) {
-                                          if (idVal === "") localStorage.removeItem(idK);
-                                          else localStorage.setItem(idK, idVal);
-                                        }
-                                      } catch(e){}
-                                    }""",
-                                    accK, accProvided, accVal, idK, idProvided, idVal
-                                )
-
-                                # SSO cookie apply (только установка; очистку лучше делать clear_cookies)
-                                if bool(cmd.get("sso_provided")):
-                                    sso = cmd.get("sso_token")
-                                    if sso:
-                                        page.context.add_cookies([
-                                            {"name": "sso_token", "value": sso, "domain": "id.lixiang.com", "path": "/", "httpOnly": True, "secure": True, "sameSite": "None"},
-                                            {"name": "sso_token", "value": sso, "domain": "id.lixiang.com", "path": "/api", "httpOnly": True, "secure": True, "sameSite": "None"},
-                                        ])
-
-                                if bool(cmd.get("reload_after")):
-                                    self._rotate_window_until = time.time() + ROTATE_WINDOW_SEC
-                                    page.reload(wait_until="domcontentloaded")
-
-                                box["res"] = {"ok": True}
-                            except Exception as e:
-                                box["res"] = {"ok": False, "error": repr(e)}
-
-                        else:
-                            box["res"] = {"ok": False, "error": f"unknown op: {op}"}
-
-                    except Exception as e:
-                        botlog.exception("cmd error: %r", e)
-                        box["res"] = {"ok": False, "error": repr(e)}
-                    finally:
-                        done.set()
-
+                await self._stop_ev.wait()
             finally:
+                for t in timers:
+                    t.cancel()
+                await asyncio.gather(*timers, return_exceptions=True)
+                self._ready.clear()
+                self._drain_commands()
                 self._save_status({"stopped": True})
+                await asyncio.to_thread(self._flush_status)
                 try:
-                    ctx.close()
+                    await ctx.close()
                 except Exception:
                     pass
                 botlog.info("context closed")
 
-# Глобальный инстанс — импортируется сервером и админ-роутами
-bot = ChehejiaBot()
+def publish_bearer(token: str, source: str, exp_unix: Optional[int]) -> None:
+    broker.publish(token, source=source, exp=exp_unix,
+                   extra={"hash": _short_sha(token), "masked": _mask(token), "len": len(token)})
+
+
+class BotPool:
+    """
+    N независимых сессий Chromium (свои профили, сдвинутые по времени refresh).
+    Воркерам отдаётся самый «долгоживущий» из валидных токенов сессий;
+    сессии с плохим здоровьем (см. score) перезапускаются сторожем (api.BotManager).
+    Интерфейс — как у одиночного бота: команды уходят в самую здоровую сессию,
+    update_config применяется ко всем.
+    """
+    BOOT_GRACE_SEC = 120.0      # столько ждём первый токен после старта сессии
+    REPLACE_COOLDOWN_SEC = 300.0
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._published: tuple = (None, 0)  # (bearer, exp)
+        self._last_replace: Dict[int, float] = {}
+        self.bots: List[ChehejiaBot] = [ChehejiaBot(i, self.size, on_bearer=self._on_bearer)
+                                        for i in range(self.size)]
+
+    # ---------- токен ----------
+    def _on_bearer(self, b: ChehejiaBot, token: str, source: str, exp: Optional[int]) -> None:
+        with self._lock:
+            cur, cur_exp = self._published
+            if token == cur or (cur and exp is not None and cur_exp > time.time() and exp < cur_exp):
+                return  # у другой сессии токен живёт дольше
+            self._published = (token, exp or 0)
+        publish_bearer(token, f"{source}#{b.index}", exp)
+
+    def get_bearer(self) -> Optional[str]:
+        best, best_exp = None, -1
+        now = time.time()
+        for b in self.bots:
+            tok = b.get_bearer()
+            exp = _jwt_exp_unix(tok) or 0
+            if tok and (exp == 0 or exp > now) and exp > best_exp:
+                best, best_exp = tok, exp
+        return best
+
+    # ---------- здоровье ----------
+    def score(self, b: ChehejiaBot) -> float:
+        """0 — сессию пора заменить; больше — здоровее (свежий токен, нет ошибок/таймаутов)."""
+        if not b.is_running():
+            return 0.0
+        now = time.time()
+        tok = b.get_bearer()
+        if not tok:
+            return 0.0 if now - b.started_ts > self.BOOT_GRACE_SEC else 10.0
+        exp = _jwt_exp_unix(tok)
+        ttl = (exp - now) if exp else 600.0
+        if ttl <= 0 and b.refresh_info()["fail_streak"] >= 3:
+            return 0.0  # токен истёк, а несколько refresh подряд его не обновили
+        score = 50.0 + min(max(ttl, 0.0) / 60.0, 50.0) - 15.0 * b.errors - 10.0 * b.timeouts
+        return max(score, 0.0) if b.errors < 5 and b.timeouts < 3 else 0.0
+
+    def primary(self) -> ChehejiaBot:
+        running = [b for b in self.bots if b.is_running()]
+        return max(running, key=self.score) if running else self.bots[0]
+
+    def check(self) -> None:
+        """Перезапуск нездоровых сессий (не чаще REPLACE_COOLDOWN_SEC на сессию)."""
+        now = time.time()
+        for b in self.bots:
+            if self.score(b) > 0 or now - self._last_replace.get(b.index, 0.0) < self.REPLACE_COOLDOWN_SEC:
+                continue
+            self._last_replace[b.index] = now
+            botlog.warning("bot#%s unhealthy (errors=%s timeouts=%s) → replace", b.index, b.errors, b.timeouts)
+            try:
+                b.stop()
+                b.replaced += 1
+                b.start()
+            except Exception as e:
+                botlog.exception("bot#%s replace error: %r", b.index, e)
+
+    # ---------- жизненный цикл ----------
+    def start(self) -> None:
+        ths = [threading.Thread(target=b.start, daemon=True) for b in self.bots if not b.is_running()]
+        for t in ths:
+            t.start()
+        for t in ths:
+            t.join()
+
+    def stop(self) -> None:
+        for b in self.bots:
+            b.stop()
+
+    def is_running(self) -> bool:
+        return any(b.is_running() for b in self.bots)
+
+    def status(self) -> Dict[str, Any]:
+        sessions = [{**b.status(), "score": round(self.score(b), 1)} for b in self.bots]
+        return {
+            "ok": True,
+            "running": self.is_running(),
+            "have_bearer": bool(self.get_bearer()),
+            "pool_size": self.size,
+            "primary": self.primary().index,
+            "sessions": sessions,
+        }
+
+    # ---------- команды → основная сессия ----------
+    def screenshot(self, path: str = "out/last.png") -> str:
+        return self.primary().screenshot(path)
+
+    def goto(self, url: str, timeout: float = 50.0) -> Dict[str, Any]:
+        return self.primary().goto(url, timeout)
+
+    def reload(self, timeout: float = 50.0) -> Dict[str, Any]:
+        return self.primary().reload(timeout)
+
+    def click(self, selector: str, nth: int = 0, timeout: float = 30.0) -> Dict[str, Any]:
+        return self.primary().click(selector, nth, timeout)
+
+    def eval(self, script: str, timeout: float = 30.0) -> Dict[str, Any]:
+        return self.primary().eval(script, timeout)
+
+    def eval_many(self, scripts: List[str], timeout: float = 30.0) -> Dict[str, Any]:
+        return self.primary().eval_many(scripts, timeout)
+
+    def wait_response(self, url_substr: str, timeout_ms: int = 15000) -> Dict[str, Any]:
+        return self.primary().wait_response(url_substr, timeout_ms)
+
+    def cookies(self) -> Dict[str, Any]:
+        return self.primary().cookies()
+
+    def clear_cookies(self) -> Dict[str, Any]:
+        return self.primary().clear_cookies()
+
+    def localstorage(self, full: bool = False) -> Dict[str, Any]:
+        return self.primary().localstorage(full)
+
+    def update_config(self, **kw) -> Dict[str, Any]:
+        apply_now = kw.get("apply_now", True)
+        for b in self.bots:
+            b.update_config(**{**kw, "apply_now": apply_now and b.is_running()})
+        return self.get_config()
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.bots[0].get_config()
+
+
+# Глобальный инстанс — импортируется сервером и админ-роутами (BOT_POOL_SIZE=1 — одна сессия, как раньше)
+bot = BotPool(settings.BOT_POOL_SIZE)
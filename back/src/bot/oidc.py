@@ -0,0 +1,201 @@
+# src/bot/oidc.py
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import httpx
+
+from config import settings
+
+log = logging.getLogger("bot")
+
+
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _pkce() -> Tuple[str, str]:
+    verifier = _b64url(secrets.token_bytes(32))
+    return verifier, _b64url(hashlib.sha256(verifier.encode("ascii")).digest())
+
+
+def _loads(s: Optional[str]) -> Dict[str, Any]:
+    try:
+        js = json.loads(s or "")
+        return js if isinstance(js, dict) else {}
+    except Exception:
+        return {}
+
+
+def _pick(js: Dict[str, Any], *keys: str) -> Optional[str]:
+    """Значение из самого объекта или из body (формат кэша idaas-js в localStorage)."""
+    for src in (js, js.get("body") if isinstance(js.get("body"), dict) else {}):
+        for k in keys:
+            v = src.get(k)
+            if isinstance(v, str) and v:
+                return v
+    return None
+
+
+def with_refresh_token(access_token_json: Optional[str], rt: str) -> str:
+    """access_token_json с новым refresh_token — туда же, где был старый (корень или body)."""
+    js = _loads(access_token_json)
+    body = js.get("body") if isinstance(js.get("body"), dict) else None
+    dst = body if body is not None and not js.get("refresh_token") and not js.get("refreshToken") else js
+    dst["refreshToken" if "refreshToken" in dst and "refresh_token" not in dst else "refresh_token"] = rt
+    return json.dumps(js, ensure_ascii=False, separators=(",", ":"))
+
+
+def _fp(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def client_id_from_key(access_token_key: str) -> str:
+    """@@idaasjs@@::<client_id>::access_token → client_id."""
+    parts = (access_token_key or "").split("::")
+    return parts[1] if len(parts) == 3 else ""
+
+
+class DirectRefresher:
+    """
+    Обновление bearer у IdP одним HTTP-запросом, без загрузки SPA в Chromium:
+      1) grant_type=refresh_token — если в access_token_json (BotConfig/LS) есть refresh_token;
+         ротированный refresh_token держим в памяти и используем дальше (сессия бота сохраняет его
+         в bot_config); израсходованный или отвергнутый IdP токен второй раз не предъявляем;
+      2) silent authorize (prompt=none + PKCE) с cookie sso_token и id_token_hint из id_token_json,
+         code из Location меняем на токен (или берём access_token из фрагмента, если IdP отдаёт implicit).
+    Ошибка/отказ IdP → None, вызывающий откатывается на reload страницы.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # один refresh за раз на все сессии пула: ротированный refresh_token одноразовый,
+        # повторное предъявление IdP с reuse detection считает кражей и отзывает всё семейство
+        self._serial = threading.Lock()
+        self._refresh_token: Optional[str] = None
+        # отпечатки refresh_token, которые предъявлять нельзя: обменяны на новый или отвергнуты (400/401).
+        # Начальный из access_token_json после этого пропускаем — сразу silent authorize
+        self._spent: set = set()
+        self._stats = {"attempts": 0, "ok": 0, "failed": 0, "refresh_grant": 0, "silent_authorize": 0}
+        self._last_error: str = ""
+        self._last_ms: float = 0.0
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(settings.BOT_OIDC_ENABLED and settings.BOT_OIDC_TOKEN_URL)
+
+    async def refresh(self, cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        cfg — конфиг сессии бота (access_token_key, access_token_json, id_token_json, sso_token).
+        Возвращает ответ token endpoint ({access_token, expires_in, ...}) или None.
+        """
+        if not self.enabled():
+            return None
+        # сессии BotPool живут в разных event loop — asyncio.Lock общим не будет;
+        # ждём threading-лок опросом, чтобы отмена задачи не оставила его захваченным
+        while not self._serial.acquire(blocking=False):
+            await asyncio.sleep(0.05)
+        try:
+            return await self._refresh(cfg)
+        finally:
+            self._serial.release()
+
+    async def _refresh(self, cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        acc = _loads(cfg.get("access_token_json"))
+        with self._lock:
+            rt = next((t for t in (self._refresh_token, _pick(acc, "refresh_token", "refreshToken"))
+                       if t and _fp(t) not in self._spent), None)
+            self._stats["attempts"] += 1
+            self._last_error = ""
+        client_id = settings.BOT_OIDC_CLIENT_ID or client_id_from_key(cfg.get("access_token_key") or "")
+
+        t0 = time.monotonic()
+        try:
+            async with httpx.AsyncClient(timeout=settings.BOT_OIDC_TIMEOUT_SEC, follow_redirects=False) as cl:
+                tok = None
+                if rt:
+                    tok = await self._refresh_grant(cl, client_id, rt)
+                if tok is None and cfg.get("sso_token") and settings.BOT_OIDC_AUTHORIZE_URL:
+                    tok = await self._silent_authorize(cl, client_id, cfg["sso_token"],
+                                                       _pick(_loads(cfg.get("id_token_json")), "raw", "id_token"))
+        except Exception as e:
+            tok = None
+            self._last_error = repr(e)
+        self._last_ms = (time.monotonic() - t0) * 1000.0
+
+        with self._lock:
+            if tok and tok.get("access_token"):
+                self._stats["ok"] += 1
+                if tok.get("refresh_token"):
+                    if rt and tok["refresh_token"] != rt:
+                        self._spent.add(_fp(rt))
+                    self._refresh_token = tok["refresh_token"]
+                return tok
+            self._stats["failed"] += 1
+        log.info("direct refresh failed (%s) → fallback to browser", self._last_error or "no grant available")
+        return None
+
+    async def _refresh_grant(self, cl: httpx.AsyncClient, client_id: str, rt: str) -> Optional[Dict[str, Any]]:
+        self._stats["refresh_grant"] += 1
+        r = await cl.post(settings.BOT_OIDC_TOKEN_URL, data={
+            "grant_type": "refresh_token", "refresh_token": rt, "client_id": client_id})
+        if r.status_code != 200:
+            self._last_error = f"refresh_token grant: HTTP {r.status_code}"
+            if r.status_code in (400, 401):
+                # refresh_token отозван/протух — больше его не пробуем (ни из памяти, ни из конфига)
+                with self._lock:
+                    self._spent.add(_fp(rt))
+                    self._refresh_token = None
+            return None
+        return r.json()
+
+    async def _silent_authorize(self, cl: httpx.AsyncClient, client_id: str, sso: str,
+                                id_token: Optional[str]) -> Optional[Dict[str, Any]]:
+        self._stats["silent_authorize"] += 1
+        verifier, challenge = _pkce()
+        redirect_uri = settings.BOT_OIDC_REDIRECT_URI or settings.BOT_START_URL
+        q = {"response_type": "code", "client_id": client_id, "redirect_uri": redirect_uri,
+             "scope": settings.BOT_OIDC_SCOPE, "prompt": "none", "state": secrets.token_urlsafe(12),
+             "nonce": secrets.token_urlsafe(12), "code_challenge": challenge, "code_challenge_method": "S256"}
+        if id_token:
+            q["id_token_hint"] = id_token
+        r = await cl.get(f"{settings.BOT_OIDC_AUTHORIZE_URL}?{urlencode(q)}", headers={"Cookie": f"sso_token={sso}"})
+        loc = r.headers.get("location") or ""
+        if r.status_code not in (301, 302, 303, 307) or not loc:
+            self._last_error = f"authorize: HTTP {r.status_code}, no redirect"
+            return None
+        u = urlsplit(loc)
+        params = {k: v[0] for k, v in {**parse_qs(u.query), **parse_qs(u.fragment)}.items()}
+        if params.get("error"):
+            self._last_error = f"authorize: {params['error']}"  # login_required → сессия sso истекла
+            return None
+        if params.get("access_token"):
+            return params
+        if not params.get("code"):
+            self._last_error = "authorize: no code in redirect"
+            return None
+        r = await cl.post(settings.BOT_OIDC_TOKEN_URL, data={
+            "grant_type": "authorization_code", "code": params["code"], "redirect_uri": redirect_uri,
+            "client_id": client_id, "code_verifier": verifier})
+        if r.status_code != 200:
+            self._last_error = f"authorization_code grant: HTTP {r.status_code}"
+            return None
+        return r.json()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "enabled": self.enabled(), "has_refresh_token": bool(self._refresh_token),
+                    "spent_refresh_tokens": len(self._spent),
+                    "last_ms": round(self._last_ms, 1), "last_error": self._last_error}
+
+
+refresher = DirectRefresher()
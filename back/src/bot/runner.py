@@ -2,8 +2,13 @@
 from __future__ import annotations
 import time
 from .chehejia_bot import bot, START_URL
+from .api import acquire_leader
 
 def main():
+    # отдельный процесс бота (gunicorn с BOT_AUTOSTART=0): токен воркерам — через брокер
+    if not acquire_leader():
+        print("[runner] bot is already running in another process (out/bot.lock)")
+        return
     print("[runner] starting bot…")
     bot.start()
     print("[runner] goto START_URL…")
@@ -0,0 +1,17 @@
+# src/jobs/__init__.py
+"""
+Фоновые задачи rq. Воркер: rq worker --with-scheduler <очереди> (см. server.sh worker).
+"""
+from __future__ import annotations
+from typing import Optional
+
+from redis_client import get_redis
+
+
+def get_queue(name: str):
+    """rq-очередь поверх общего Redis или None, если Redis не настроен/недоступен."""
+    r = get_redis()
+    if r is None:
+        return None
+    from rq import Queue
+    return Queue(name, connection=r)
@@ -0,0 +1,133 @@
+# src/jobs/catalog.py
+from __future__ import annotations
+import datetime
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+
+from config import settings
+from db import get_session
+from src.jobs import get_queue
+from src.models import CatalogTree
+from src.routers.dms.catalog import index
+from src.routers.dms.routes import _fetch
+from src.routers.dms.services import is_ok_json
+
+log = logging.getLogger("api")
+
+QUEUE_NAME = "catalog"
+
+
+def _sub_series_list() -> List[str]:
+    """Все subSeries из structure_catalog (как их разбирает Viewer)."""
+    res = _fetch("catalog", use_cache=False, timeout=20.0)
+    if res.status != 200:
+        log.warning("catalog crawl: models status=%s source=%s", res.status, res.source)
+        return []
+    try:
+        js = json.loads(res.body)
+    except Exception:
+        return []
+    d = js.get("data") if isinstance(js, dict) else None
+    rows = d if isinstance(d, list) else (d or {}).get("data") if isinstance(d, dict) else None
+    subs = []
+    for row in rows or []:
+        sub = str((row or {}).get("subSeries") or "").strip()
+        if sub and sub not in subs:
+            subs.append(sub)
+    return subs
+
+
+def refresh_tree(sub: str, vin: str = "") -> str:
+    """Сверить одно дерево с апстримом: changed | unchanged | error."""
+    res = _fetch("children", "POST", json={"vin": vin, "subSeries": sub}, timeout=40.0, use_cache=False)
+    if res.source != "upstream" or res.resp is None or not is_ok_json(res.resp):
+        log.warning("catalog crawl: sub=%s vin=%s status=%s source=%s", sub, vin, res.status, res.source)
+        return "error"
+    return "changed" if index.put(sub, vin, res.body) else "unchanged"
+
+
+def crawl_catalog(reschedule: bool = True) -> Dict[str, Any]:
+    """
+    Обход каталога: все subSeries из /api/models + уже известные пары subSeries/VIN.
+    Деревья, сверенные менее DMS_CATALOG_REFRESH_SEC назад, пропускаются;
+    на диск переписываются только изменившиеся. Следующий запуск ставится и при ошибке
+    (в т.ч. JobTimeoutException от rq) — иначе цепочка обходов обрывается.
+    """
+    try:
+        return _crawl()
+    finally:
+        if reschedule:
+            try:
+                schedule_crawl(settings.DMS_CATALOG_CRAWL_EVERY_SEC)
+            except Exception as e:
+                log.warning("catalog crawl: reschedule error: %r", e)
+
+
+def _crawl() -> Dict[str, Any]:
+    t0 = time.time()
+    pairs = {(sub, "") for sub in _sub_series_list()}
+    try:
+        pairs |= set(index.known())
+    except Exception as e:
+        log.warning("catalog crawl: index read error: %r", e)
+
+    fresh = _recently_checked()
+    summary = {"total": len(pairs), "changed": 0, "unchanged": 0, "error": 0, "skipped": 0}
+    for sub, vin in sorted(pairs):
+        if (sub, vin) in fresh:
+            summary["skipped"] += 1
+            continue
+        summary[refresh_tree(sub, vin)] += 1
+        time.sleep(settings.DMS_CATALOG_CRAWL_PAUSE_SEC)
+
+    summary["sec"] = round(time.time() - t0, 1)
+    log.info("catalog crawl done: %s", summary)
+    return summary
+
+
+def _recently_checked() -> set:
+    border = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=settings.DMS_CATALOG_REFRESH_SEC)
+    with get_session() as s:
+        rows = s.execute(select(CatalogTree.sub_series, CatalogTree.vin)
+                         .where(CatalogTree.checked_at >= border)).all()
+    return {(r[0], r[1]) for r in rows}
+
+
+def schedule_crawl(delay_sec: int = 0) -> bool:
+    """
+    Поставить обход в очередь (через delay_sec — нужен воркер с --with-scheduler).
+    У каждого запуска свой job_id: если бы следующий запуск получил id текущего, rq по завершении
+    текущего пометил бы хэш задачи FINISHED с result_ttl — и запланированный запуск потерялся бы.
+    """
+    q = get_queue(QUEUE_NAME)
+    if q is None:
+        return False
+    job_id = f"catalog-crawl-{int(time.time() * 1000)}"
+    if delay_sec > 0:
+        # цепочка перепланирования одна: ручной запуск не плодит вторую
+        if any(j.startswith("catalog-crawl-") for j in q.scheduled_job_registry.get_job_ids()):
+            return True
+        q.enqueue_in(datetime.timedelta(seconds=delay_sec), crawl_catalog,
+                     job_id=job_id, job_timeout=6 * 3600)
+    else:
+        q.enqueue(crawl_catalog, job_id=job_id, job_timeout=6 * 3600)
+    return True
+
+
+def init_catalog_crawl() -> None:
+    """
+    При старте приложения: если цепочки обходов нет (очищен Redis, потерян запуск) — запланировать.
+    Проверка scheduled_job_registry в schedule_crawl не даёт завести вторую цепочку.
+    """
+    if not settings.DMS_CATALOG_ENABLED:
+        return
+    try:
+        if schedule_crawl(settings.DMS_CATALOG_CRAWL_EVERY_SEC):
+            log.info("catalog crawl chain: next run in ≤%ss", settings.DMS_CATALOG_CRAWL_EVERY_SEC)
+    except Exception as e:
+        log.warning("catalog crawl chain: schedule error: %r", e)
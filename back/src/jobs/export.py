@@ -0,0 +1,203 @@
+# src/jobs/export.py
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import settings
+from src.jobs import get_queue
+
+log = logging.getLogger("api")
+
+QUEUE_NAME = "export"
+EXPORT_DIR = Path(settings.OUT_DIR) / "exports"
+
+# без Redis задачи идут в потоке этого процесса; их состояние — здесь
+_local: Dict[str, Dict[str, Any]] = {}
+_local_lock = threading.Lock()
+
+
+def result_path(job_id: str) -> Path:
+    return EXPORT_DIR / f"{job_id}.docx"
+
+
+def _cleanup() -> None:
+    """Готовые файлы старше EXPORT_RESULT_TTL_SEC удаляем (ссылки на них уже протухли)."""
+    cutoff = time.time() - settings.EXPORT_RESULT_TTL_SEC
+    for p in EXPORT_DIR.glob("*.docx"):
+        try:
+            if p.stat().st_mtime < cutoff:
+                p.unlink()
+        except OSError:
+            pass
+
+
+def _progress_fn(job_id: str):
+    """progress(stage, done, total) → job.meta["progress"] (rq) или локальный реестр."""
+    job = None
+    try:
+        from rq import get_current_job
+        job = get_current_job()
+    except Exception:
+        pass
+
+    def progress(stage: str, done: int, total: int) -> None:
+        st = {"stage": stage, "done": done, "total": total}
+        if job is not None:
+            job.meta["progress"] = st
+            job.save_meta()
+        else:
+            with _local_lock:
+                _local[job_id]["progress"] = st
+    return progress
+
+
+def _tmp_path(job_id: str) -> Path:
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = result_path(job_id)
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+
+def run_export(job_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Сборка DOCX (в воркере rq или в фоновом потоке). Прогресс — в job.meta["progress"]
+    (rq) или в локальном реестре; результат — файл OUT_DIR/exports/<job_id>.docx.
+    """
+    from src.routers.export.routes import _build_docx, export_filename
+
+    progress = _progress_fn(job_id)
+    t0 = time.time()
+    buf = _build_docx(payload, progress)
+    progress("saving", 0, 1)
+    path, tmp = result_path(job_id), _tmp_path(job_id)
+    tmp.write_bytes(buf.getbuffer())
+    os.replace(tmp, path)
+    progress("done", 1, 1)
+    res = {"filename": export_filename(payload), "size": path.stat().st_size, "sec": round(time.time() - t0, 2)}
+    log.info("export job %s done: %s", job_id, res)
+    return res
+
+
+def run_bulk_export(job_id: str, codes: List[str], model: Dict[str, Any]) -> Dict[str, Any]:
+    """Один DOCX на несколько узлов (секции — из DMS на сервере), см. bulk.save_combined."""
+    from src.routers.export.bulk import save_combined
+
+    progress = _progress_fn(job_id)
+    t0 = time.time()
+    path, tmp = result_path(job_id), _tmp_path(job_id)
+    try:
+        parts = save_combined(codes, model, tmp, progress)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    progress("done", 1, 1)
+    stamp = datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S")
+    res = {"filename": f"bulk_{len(codes)}_{stamp}.docx", "size": path.stat().st_size,
+           "sec": round(time.time() - t0, 2), **parts}
+    log.info("bulk export job %s done: %s", job_id, res)
+    return res
+
+
+def _run_local(job_id: str, fn: Callable[..., Dict[str, Any]], args: tuple) -> None:
+    with _local_lock:
+        _local[job_id]["status"] = "started"
+    try:
+        res = fn(job_id, *args)
+        upd = {"status": "finished", "result": res}
+    except Exception as e:
+        log.exception("export job %s failed: %r", job_id, e)
+        upd = {"status": "failed", "error": repr(e)}
+    with _local_lock:
+        if _local[job_id]["status"] == "canceled":
+            # отменили, пока собиралось: поток не прервать, но результат никому не нужен
+            result_path(job_id).unlink(missing_ok=True)
+            return
+        _local[job_id].update(upd)
+
+
+def _submit(fn: Callable[..., Dict[str, Any]], *args: Any) -> Dict[str, Any]:
+    """Поставить fn(job_id, *args) в очередь rq «export»; без Redis — поток этого процесса."""
+    _cleanup()
+    job_id = uuid.uuid4().hex
+    q = get_queue(QUEUE_NAME)
+    if q is not None:
+        q.enqueue(fn, job_id, *args, job_id=job_id,
+                  job_timeout=settings.EXPORT_JOB_TIMEOUT_SEC,
+                  result_ttl=settings.EXPORT_RESULT_TTL_SEC,
+                  failure_ttl=settings.EXPORT_RESULT_TTL_SEC)
+        return {"job_id": job_id, "queued": True}
+    with _local_lock:
+        # реестр без Redis живёт только в этом процессе — старое выкидываем
+        cutoff = time.time() - settings.EXPORT_RESULT_TTL_SEC
+        for k in [k for k, v in _local.items() if v["ts"] < cutoff]:
+            _local.pop(k, None)
+        _local[job_id] = {"status": "queued", "progress": None, "ts": time.time()}
+    threading.Thread(target=_run_local, args=(job_id, fn, args), daemon=True, name=f"export-{job_id[:8]}").start()
+    return {"job_id": job_id, "queued": False}
+
+
+def submit_export(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return _submit(run_export, payload)
+
+
+def submit_bulk_export(codes: List[str], model: Dict[str, Any]) -> Dict[str, Any]:
+    return _submit(run_bulk_export, codes, model)
+
+
+def job_status(job_id: str) -> Optional[Dict[str, Any]]:
+    """{"status": queued|started|finished|failed|…, "progress", "result", "error"} или None."""
+    with _local_lock:
+        st = _local.get(job_id)
+        if st is not None:
+            return {k: st.get(k) for k in ("status", "progress", "result", "error")}
+    q = get_queue(QUEUE_NAME)
+    if q is None:
+        return None
+    job = q.fetch_job(job_id)
+    if job is None:
+        return None
+    status = job.get_status(refresh=False)
+    out = {"status": str(getattr(status, "value", status)), "progress": job.meta.get("progress"),
+           "result": None, "error": None}
+    if out["status"] == "finished":
+        out["result"] = job.return_value()
+    elif out["status"] == "failed":
+        lines = (job.exc_info or "").strip().splitlines()
+        out["error"] = lines[-1] if lines else "failed"
+    return out
+
+
+def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Отмена задачи: в очереди — снимается (rq job.cancel()), уже собирается — останавливается
+    (rq stop-job; локальный поток доработает, но результат выбросим). None — задачи нет.
+    {"canceled": False} — уже завершилась.
+    """
+    with _local_lock:
+        st = _local.get(job_id)
+        if st is not None:
+            if st["status"] not in ("queued", "started"):
+                return {"canceled": False, "status": st["status"]}
+            st["status"] = "canceled"
+            return {"canceled": True, "status": "canceled"}
+    q = get_queue(QUEUE_NAME)
+    if q is None:
+        return None
+    job = q.fetch_job(job_id)
+    if job is None:
+        return None
+    status = job.get_status()
+    status = str(getattr(status, "value", status))
+    if status in ("finished", "failed", "canceled", "stopped"):
+        return {"canceled": False, "status": status}
+    if status == "started":
+        from rq.command import send_stop_job_command
+        send_stop_job_command(q.connection, job_id)
+        return {"canceled": True, "status": "stopped"}
+    job.cancel()
+    return {"canceled": True, "status": "canceled"}
@@ -0,0 +1,76 @@
+# src/jobs/search.py
+from __future__ import annotations
+import json
+import logging
+import time
+from typing import Any, Dict, Set
+
+from src.jobs import get_queue
+from src.routers.dms.catalog import index as catalog
+from src.routers.dms.search import SEARCH_KINDS, index
+from src.routers.dms.services import cache_key
+from src.routers.dms.snapshots import store as snapshots
+
+log = logging.getLogger("api")
+
+QUEUE_NAME = "catalog"
+
+
+def _tree_codes(body: bytes) -> Set[str]:
+    """Все structureCode из дерева каталога."""
+    codes: Set[str] = set()
+    stack = [json.loads(body)]
+    while stack:
+        v = stack.pop()
+        if isinstance(v, dict):
+            c = v.get("structureCode")
+            if isinstance(c, (str, int)) and str(c).strip():
+                codes.add(str(c).strip())
+            stack.extend(v.values())
+        elif isinstance(v, list):
+            stack.extend(v)
+    return codes
+
+
+def rebuild_search_index() -> Dict[str, Any]:
+    """
+    Переиндексация из снимков на диске: узлы берём из индекса каталога,
+    для каждого — последний снимок structure_get/part_detail/technical/function_desc.
+    Апстрим не вызывается; неизменившиеся документы в БД не перезаписываются.
+    """
+    t0 = time.time()
+    codes: Set[str] = set()
+    for sub, vin in catalog.known():
+        hit = catalog.get(sub, vin)
+        if hit:
+            try:
+                codes |= _tree_codes(hit.body)
+            except Exception as e:
+                log.warning("search rebuild: bad tree sub=%s vin=%s: %r", sub, vin, e)
+
+    summary = {"codes": len(codes), "indexed": 0, "missing": 0, "error": 0}
+    kinds = [k for k, arg in SEARCH_KINDS.items() if arg == "structureCode"]
+    for code in sorted(codes):
+        for kind in kinds:
+            snap = snapshots.latest(cache_key(kind, {"structureCode": code}, None))
+            if not snap:
+                summary["missing"] += 1
+                continue
+            try:
+                index.upsert(kind, code, snap[0].body)
+                summary["indexed"] += 1
+            except Exception as e:
+                summary["error"] += 1
+                log.warning("search rebuild %s:%s: %r", kind, code, e)
+
+    summary["sec"] = round(time.time() - t0, 1)
+    log.info("search rebuild done: %s", summary)
+    return summary
+
+
+def schedule_rebuild() -> bool:
+    q = get_queue(QUEUE_NAME)
+    if q is None:
+        return False
+    q.enqueue(rebuild_search_index, job_id="search-rebuild", job_timeout=6 * 3600)
+    return True
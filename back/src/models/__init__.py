@@ -7,4 +7,6 @@ class Base(DeclarativeBase):
 from .user import User
 from .snapshot import Snapshot
 from .bot_status import BotStatus
-from .bot_config import BotConfig
\ No newline at end of file
+from .bot_config import BotConfig
+from .catalog_tree import CatalogTree
+from .search_doc import SearchDoc
\ No newline at end of file
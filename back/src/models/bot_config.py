@@ -1,5 +1,5 @@
 # src/models/bot_config.py
-from sqlalchemy import Integer, Text, DateTime, func, CheckConstraint
+from sqlalchemy import Integer, Text, Boolean, DateTime, func, text, CheckConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from . import Base  # та же Base, что и у BotStatus
 
@@ -15,6 +15,12 @@ class BotConfig(Base):
     id_token_json:     Mapped[str | None] = mapped_column(Text, nullable=True)
     sso_token:         Mapped[str | None] = mapped_column(Text, nullable=True)
 
+    # Политика перехвата запросов Chromium бота: что резать при reload/goto
+    # (списки через запятую; NULL → умолчания из chehejia_bot)
+    block_enabled:        Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text("true"))
+    block_resource_types: Mapped[str | None] = mapped_column(Text, nullable=True)
+    allow_hosts:          Mapped[str | None] = mapped_column(Text, nullable=True)
+
     updated_at: Mapped["DateTime"] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
@@ -0,0 +1,22 @@
+# src/models/catalog_tree.py
+from sqlalchemy import String, Integer, DateTime, func, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+from . import Base
+
+class CatalogTree(Base):
+    """Локальная копия дерева structure_list_children для пары subSeries/VIN."""
+    __tablename__ = "catalog_trees"
+    __table_args__ = (
+        UniqueConstraint("sub_series", "vin", name="uq_catalog_trees_sub_vin"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    sub_series: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    vin: Mapped[str] = mapped_column(String(32), nullable=False, default="")
+    body_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    file_rel: Mapped[str] = mapped_column(String(512), nullable=False)
+    size_bytes: Mapped[int] = mapped_column(Integer, default=0)
+    nodes: Mapped[int] = mapped_column(Integer, default=0)
+    # fetched_at — когда содержимое последний раз изменилось; checked_at — когда сверяли с апстримом
+    fetched_at: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    checked_at: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,28 @@
+# src/models/search_doc.py
+from sqlalchemy import String, Integer, Text, DateTime, Computed, Index, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Mapped, mapped_column
+from . import Base
+
+# title весит больше тела (A > B); 'simple' — без стемминга: контент смешанный ru/en/zh + коды деталей
+SEARCH_TSV_EXPR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')"
+)
+
+class SearchDoc(Base):
+    """Документ полнотекстового поиска: текст одной секции (part_detail/technical/…) узла."""
+    __tablename__ = "search_docs"
+    __table_args__ = (
+        Index("ix_search_docs_tsv", "tsv", postgresql_using="gin"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    doc_key: Mapped[str] = mapped_column(String(200), nullable=False, unique=True)  # "<kind>:<code>"
+    kind: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
+    code: Mapped[str] = mapped_column(String(128), nullable=False, index=True)
+    title: Mapped[str] = mapped_column(Text, default="")
+    body: Mapped[str] = mapped_column(Text, default="")
+    src_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    tsv = mapped_column(TSVECTOR, Computed(SEARCH_TSV_EXPR, persisted=True))
+    updated_at: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
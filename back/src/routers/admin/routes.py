@@ -1,11 +1,20 @@
 # src/routers/admin/routes.py
 from flask import Blueprint, request, jsonify, current_app
 from src.bot.chehejia_bot import bot
+from src.bot.broker import broker
+from src.bot.api import is_leader, acquire_leader
 from flask import send_file
-from src.routers.auth.deps import admin_required
-from sqlalchemy import select
+from src.routers.auth.deps import admin_required, principals
+from src.routers.auth.security import hash_password, hasher, PasswordPoolBusy
+import os
+import threading
+from sqlalchemy import select, func
 from db import get_session
-from src.models import User
+from src.models import User, CatalogTree
+from src.jobs.catalog import crawl_catalog, schedule_crawl
+from src.jobs.search import rebuild_search_index, schedule_rebuild
+from src.routers.dms.catalog import index as catalog_index
+from src.routers.export.image_cache import image_cache
 
 # NEW: модель конфига
 from src.models.bot_config import BotConfig
@@ -41,15 +50,23 @@ def _ensure_bot_config(session) -> BotConfig:
 @bp.get("/bot/status")
 @admin_required
 def bot_status():
+    token = {"leader": is_leader(), "pid": os.getpid(), "broker": broker.stats()}
+    if not is_leader():
+        # Chromium живёт в воркере-лидере; отсюда его состояние не видно
+        return jsonify({"ok": True, "running": None, "have_bearer": bool(broker.get()), **token})
     if not bot.is_running():
-        return jsonify({"ok": True, "running": False, "have_bearer": False})
-    return jsonify(bot.status())
+        return jsonify({"ok": True, "running": False, "have_bearer": bool(broker.get()), **token})
+    return jsonify({**bot.status(), **token})
 
 @bp.post("/bot/start")
 @admin_required
 def bot_start():
     if bot.is_running():
         return jsonify({"ok": True, "note": "already running"})
+    if not acquire_leader():
+        # один бот на хост: второй Chromium на том же профиле запускать нельзя
+        return jsonify({"ok": False, "leader": False, "pid": os.getpid(),
+                        "error": "bot is owned by another worker"}), 409
     bot.start()
     return jsonify({"ok": True})
 
@@ -125,6 +142,9 @@ def bot_config_get():
             "has_id_token_json": bool(cfg.id_token_json),
             "has_sso_token": bool(cfg.sso_token),
             "sso_token_masked": _mask(cfg.sso_token) if cfg.sso_token else "",
+            "block_enabled": cfg.block_enabled,
+            "block_resource_types": cfg.block_resource_types or "",
+            "allow_hosts": cfg.allow_hosts or "",
         })
 
 @bp.post("/bot/config")
@@ -137,6 +157,8 @@ def bot_config_set():
           * None (отсутствует в JSON) → не менять
           * "" (пустая строка)       → очистить в БД
           * "...."                   → записать в БД
+      - block_enabled (bool) / block_resource_types / allow_hosts (через запятую, "" → умолчание) —
+        политика перехвата запросов Chromium бота
       - apply_now (bool, default True) — применить к текущей сессии бота (localStorage/cookies)
       - reload_after (bool, default False) — перезагрузить страницу бота
     """
@@ -162,6 +184,14 @@ def bot_config_set():
             v = js.get("sso_token")
             cfg.sso_token = (None if v == "" else v)
 
+        # политика перехвата запросов
+        if "block_enabled" in js:
+            cfg.block_enabled = bool(js.get("block_enabled"))
+        if "block_resource_types" in js:
+            cfg.block_resource_types = (js.get("block_resource_types") or "").strip() or None
+        if "allow_hosts" in js:
+            cfg.allow_hosts = (js.get("allow_hosts") or "").strip() or None
+
         s.commit()
 
         # Применяем «на лету» к боту (если он запущен/страница есть)
@@ -172,6 +202,9 @@ def bot_config_set():
                 access_token_json=js.get("access_token_json"),
                 id_token_json=js.get("id_token_json"),
                 sso_token=js.get("sso_token"),
+                block_enabled=js.get("block_enabled"),
+                block_resource_types=js.get("block_resource_types"),
+                allow_hosts=js.get("allow_hosts"),
                 apply_now=bool(js.get("apply_now", True)),
                 reload_after=bool(js.get("reload_after", False)),
                 persist=False,  # истина в БД
@@ -188,8 +221,61 @@ def bot_config_set():
             "has_id_token_json": bool(cfg.id_token_json),
             "has_sso_token": bool(cfg.sso_token),
             "sso_token_masked": _mask(cfg.sso_token) if cfg.sso_token else "",
+            "block_enabled": cfg.block_enabled,
+            "block_resource_types": cfg.block_resource_types or "",
+            "allow_hosts": cfg.allow_hosts or "",
         })
 
+# ---------- Catalog crawl (admin only) ----------
+@bp.post("/catalog/crawl")
+@admin_required
+def catalog_crawl():
+    """
+    Запустить обход каталога. С Redis — задача в очередь rq «catalog»,
+    без него — в фоновом потоке этого процесса (без перепланирования).
+    """
+    if schedule_crawl():
+        return jsonify({"ok": True, "queued": True})
+    threading.Thread(target=crawl_catalog, kwargs={"reschedule": False},
+                     daemon=True, name="catalog-crawl").start()
+    return jsonify({"ok": True, "queued": False, "note": "redis not configured — running in-process"})
+
+@bp.get("/catalog/status")
+@admin_required
+def catalog_status():
+    with get_session() as s:
+        trees = s.scalar(select(func.count()).select_from(CatalogTree)) or 0
+        nodes = s.scalar(select(func.coalesce(func.sum(CatalogTree.nodes), 0))) or 0
+        last = s.scalar(select(func.max(CatalogTree.checked_at)))
+    return jsonify({
+        "ok": True,
+        "trees": trees,
+        "nodes": int(nodes),
+        "last_checked_at": last.isoformat() if last else None,
+        "index": catalog_index.stats(),
+    })
+
+# ---------- Search index (admin only) ----------
+@bp.post("/search/reindex")
+@admin_required
+def search_reindex():
+    """Пересобрать поисковый индекс из снимков (rq или фоновый поток, как обход каталога)."""
+    if schedule_rebuild():
+        return jsonify({"ok": True, "queued": True})
+    threading.Thread(target=rebuild_search_index, daemon=True, name="search-rebuild").start()
+    return jsonify({"ok": True, "queued": False, "note": "redis not configured — running in-process"})
+
+# ---------- Auth metrics (admin only) ----------
+@bp.get("/auth/status")
+@admin_required
+def auth_status():
+    return jsonify({"ok": True, "bcrypt": hasher.stats(), "principals": principals.stats()})
+
+@bp.get("/export/status")
+@admin_required
+def export_status():
+    return jsonify({"ok": True, "image_cache": image_cache.stats()})
+
 # ---------- Registration toggle ----------
 @bp.get("/config/registration")
 @admin_required
@@ -241,6 +327,7 @@ def ban_user(user_id: int):
             return jsonify({"ok": False, "error": "user not found"}), 404
         u.is_active = False
         s.commit()
+        principals.invalidate(u.id)
         return jsonify({"ok": True, "user_id": u.id, "is_active": u.is_active})
 
 @bp.post("/users/<int:user_id>/unban")
@@ -252,6 +339,7 @@ def unban_user(user_id: int):
             return jsonify({"ok": False, "error": "user not found"}), 404
         u.is_active = True
         s.commit()
+        principals.invalidate(u.id)
         return jsonify({"ok": True, "user_id": u.id, "is_active": u.is_active})
 
 @bp.post("/users/<int:user_id>/promote")
@@ -263,6 +351,7 @@ def promote_admin(user_id: int):
             return jsonify({"ok": False, "error": "user not found"}), 404
         u.is_admin = True
         s.commit()
+        principals.invalidate(u.id)
         return jsonify({"ok": True, "user_id": u.id, "is_admin": u.is_admin})
 
 @bp.post("/users/<int:user_id>/demote")
@@ -274,6 +363,7 @@ def demote_admin(user_id: int):
             return jsonify({"ok": False, "error": "user not found"}), 404
         u.is_admin = False
         s.commit()
+        principals.invalidate(u.id)
         return jsonify({"ok": True, "user_id": u.id, "is_admin": u.is_admin})
 
 @bp.post("/users/create")
@@ -289,8 +379,10 @@ def create_user_admin():
         return jsonify({"ok": False, "error": "username, email, password required"}), 400
 
     # TODO: проверь дубликаты email/username
-    from werkzeug.security import generate_password_hash
-    pwd_hash = generate_password_hash(password)
+    try:
+        pwd_hash = hash_password(password)
+    except PasswordPoolBusy:
+        return jsonify({"ok": False, "error": "password hashing busy, retry shortly"}), 429
 
     with get_session() as s:
         u = User(username=username, email=email, password_hash=pwd_hash, is_admin=is_admin, is_active=True)
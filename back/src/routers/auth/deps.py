@@ -1,11 +1,131 @@
 # src/routers/auth/deps.py
+import logging
+import threading
+import time
+from dataclasses import dataclass
 from functools import wraps
+from typing import Dict, Optional, Tuple
 from flask import request, jsonify
 from sqlalchemy import select
+from config import settings
 from db import get_session
+from redis_client import get_redis, redis_failed
 from src.models import User
 from src.routers.auth.security import decode_jwt
 
+log = logging.getLogger("api")
+
+
+@dataclass(frozen=True)
+class Principal:
+    """То, что нужно проверкам доступа и /auth/me, без ORM-объекта и сессии."""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_admin: bool
+
+
+class PrincipalCache:
+    """
+    Кэш пользователей по sub с коротким TTL: в установившемся режиме
+    авторизованные запросы не ходят в Postgres.
+    Бан/разбан/повышение/понижение сбрасывают запись явно (invalidate), а через
+    Redis pub/sub — и в остальных воркерах. Без Redis устаревание ограничено TTL.
+    """
+    CHANNEL = "auth:user:invalidate"
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._items: Dict[int, Tuple[float, Principal]] = {}
+        # версии сбросов: чтение из БД, начатое до invalidate(), не должно вернуть запись в кэш
+        self._versions: Dict[int, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._sub_th: Optional[threading.Thread] = None
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        self._ensure_subscriber()
+        now = time.monotonic()
+        with self._lock:
+            hit = self._items.get(user_id)
+            if hit and hit[0] > now:
+                self._stats["hits"] += 1
+                return hit[1]
+            self._stats["misses"] += 1
+            seen = (self._generation, self._versions.get(user_id, 0))
+
+        with get_session() as s:
+            u = s.scalar(select(User).where(User.id == user_id))
+            if not u:
+                return None
+            p = Principal(u.id, u.username, u.email, bool(u.is_active), bool(u.is_admin))
+        if self.ttl > 0:
+            with self._lock:
+                if seen == (self._generation, self._versions.get(user_id, 0)):
+                    self._items[user_id] = (now + self.ttl, p)
+        return p
+
+    def invalidate(self, user_id: int) -> None:
+        """Сбросить запись здесь и разослать сброс остальным воркерам."""
+        self._drop(user_id)
+        r = get_redis()
+        if r is not None:
+            try:
+                r.publish(self.CHANNEL, str(user_id))
+            except Exception as e:
+                redis_failed(e)
+
+    def _drop(self, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._items.clear()
+                self._versions.clear()
+                self._generation += 1
+            else:
+                self._items.pop(user_id, None)
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._stats["invalidations"] += 1
+
+    # ---------- подписка на сбросы из других воркеров ----------
+    def _ensure_subscriber(self) -> None:
+        if self._sub_th is not None or get_redis() is None:
+            return
+        with self._lock:
+            if self._sub_th is None:
+                self._sub_th = threading.Thread(target=self._listen, daemon=True, name="auth-user-invalidate")
+                self._sub_th.start()
+
+    def _listen(self) -> None:
+        while True:
+            r = get_redis()
+            if r is None:
+                time.sleep(settings.REDIS_RETRY_SEC)
+                continue
+            try:
+                ps = r.pubsub(ignore_subscribe_messages=True)
+                ps.subscribe(self.CHANNEL)
+                # пока не были подписаны, сбросы могли пройти мимо
+                self._drop()
+                while True:
+                    msg = ps.get_message(timeout=1.0)
+                    if msg and msg.get("type") == "message":
+                        try:
+                            self._drop(int(msg["data"]))
+                        except (TypeError, ValueError):
+                            self._drop()
+            except Exception as e:
+                log.warning("auth invalidate subscriber error: %r", e)
+                time.sleep(1.0)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "items": len(self._items)}
+
+
+principals = PrincipalCache(settings.AUTH_USER_CACHE_TTL_SEC)
+
 
 def _extract_token() -> str | None:
     auth = request.headers.get("authorization") or ""
@@ -24,14 +144,15 @@ def current_user_or_401():
         return None, (jsonify({"ok": False, "error": "invalid token"}), 401)
 
     sub = (data or {}).get("sub")
-    if not sub:
+    try:
+        user_id = int(sub)
+    except (TypeError, ValueError):
         return None, (jsonify({"ok": False, "error": "invalid token payload"}), 401)
 
-    with get_session() as s:
-        u = s.scalar(select(User).where(User.id == int(sub)))
-        if not u:
-            return None, (jsonify({"ok": False, "error": "user not found"}), 401)
-        return u, None
+    u = principals.get(user_id)
+    if not u:
+        return None, (jsonify({"ok": False, "error": "user not found"}), 401)
+    return u, None
 
 
 def login_required(fn):
@@ -55,4 +176,4 @@ def admin_required(fn):
             return jsonify({"ok": False, "error": "admin only"}), 403
         request.user = u
         return fn(*args, **kwargs)
-    return wrapper
\ No newline at end of file
+    return wrapper
@@ -1,11 +1,12 @@
 # src/routers/auth/routes.py
 from flask import Blueprint, request, jsonify
-from sqlalchemy import select
+from sqlalchemy import select, update
 from db import get_session
 from src.models import User 
 from src.routers.auth.security import (
-    hash_password, verify_password, make_jwt, decode_jwt
+    hash_password, verify_password, make_jwt, hasher, PasswordPoolBusy
 )
+from src.routers.auth.deps import current_user_or_401
 from flask import current_app
 
 import re
@@ -16,6 +17,9 @@ bp = Blueprint("auth", __name__, url_prefix="/auth")
 def _valid_email(e: str) -> bool:
     return bool(re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", e))
 
+def _busy():
+    return jsonify({"ok": False, "error": "too many login attempts, retry shortly"}), 429, {"Retry-After": "1"}
+
 @bp.post("/register")
 def register():
     js = request.get_json(silent=True) or {}
@@ -36,6 +40,12 @@ def register():
     if not _valid_email(email):
         return jsonify({"ok": False, "error": "email invalid"}), 400
 
+    # хэш до открытия сессии: bcrypt не держит соединение из пула БД
+    try:
+        pwd_hash = hash_password(password)
+    except PasswordPoolBusy:
+        return _busy()
+
     with get_session() as s:
         exists = s.scalar(
             select(User).where((User.username == username) | (User.email == email))
@@ -43,7 +53,7 @@ def register():
         if exists:
             return jsonify({"ok": False, "error": "user already exists"}), 409
 
-        u = User(username=username, email=email, password_hash=hash_password(password))
+        u = User(username=username, email=email, password_hash=pwd_hash)
         s.add(u); s.commit(); s.refresh(u)
 
         token = make_jwt(str(u.id))
@@ -59,39 +69,38 @@ def login():
     if not login or not password:
         return jsonify({"ok": False, "error": "missing creds"}), 400
 
+    # сессию БД не держим, пока считается bcrypt
     with get_session() as s:
         q = select(User).where((User.username == login) | (User.email == login.lower()))
         user = s.scalar(q)
+    try:
         if not user or not verify_password(password, user.password_hash):
             return jsonify({"ok": False, "error": "bad creds"}), 401
         if not user.is_active:
             return jsonify({"ok": False, "error": "user banned"}), 403
-        token = make_jwt(str(user.id))
-        return jsonify({"ok": True, "token": token, "user": {"id": user.id, "username": user.username, "email": user.email}})
+        if hasher.needs_rehash(user.password_hash):
+            # cost поменялся (или хэш старого формата) — тихо обновляем хэш
+            new_hash = hasher.rehash(password)
+            with get_session() as s:
+                s.execute(update(User).where(User.id == user.id).values(password_hash=new_hash))
+    except PasswordPoolBusy:
+        return _busy()
+    token = make_jwt(str(user.id))
+    return jsonify({"ok": True, "token": token, "user": {"id": user.id, "username": user.username, "email": user.email}})
 
 @bp.get("/me")
 def me():
-    auth = request.headers.get("authorization") or ""
-    if not auth.lower().startswith("bearer "):
-        return jsonify({"ok": False, "error": "no token"}), 401
-    token = auth.split(" ",1)[1]
-    try:
-        data = decode_jwt(token)
-    except Exception:
-        return jsonify({"ok": False, "error": "invalid token"}), 401
-    with get_session() as s:
-        from sqlalchemy import select
-        from src.models import User
-        u = s.scalar(select(User).where(User.id == int(data.get("sub"))))
-        if not u:
-            return jsonify({"ok": False, "error": "user not found"}), 401
-        return jsonify({
-            "ok": True,
-            "user": {
-                "id": u.id,
-                "username": u.username,
-                "email": u.email,
-                "is_admin": u.is_admin,
-                "is_active": u.is_active,
-            }
-        })
\ No newline at end of file
+    # тот же путь, что и у login_required: кэш пользователя, без похода в БД
+    u, err = current_user_or_401()
+    if err:
+        return err
+    return jsonify({
+        "ok": True,
+        "user": {
+            "id": u.id,
+            "username": u.username,
+            "email": u.email,
+            "is_admin": u.is_admin,
+            "is_active": u.is_active,
+        }
+    })
@@ -1,13 +1,134 @@
 # src/routers/auth/security.py
 import os, datetime, jwt, bcrypt
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Union
+from config import settings
+
 JWT_SECRET = os.getenv("JWT_SECRET", "dev_secret")
 JWT_ALG = "HS256"
 
+# хэши, созданные werkzeug (старый create_user/create_admin.py): проверяем и перехэшируем в bcrypt
+_LEGACY_PREFIXES = ("pbkdf2:", "scrypt:")
+
+
+class PasswordPoolBusy(Exception):
+    """Очередь bcrypt заполнена — запрос нужно отклонить (429), а не ждать."""
+
+
+class PasswordHasher:
+    """
+    bcrypt в отдельном ограниченном пуле: одновременно хэшируется не больше
+    AUTH_BCRYPT_WORKERS паролей, ещё AUTH_BCRYPT_QUEUE ждут; всё сверх — PasswordPoolBusy.
+    Каждый ждущий держит поток gthread, поэтому слотов не больше половины потоков (cap):
+    всплеск /auth/login получает 429, а не занимает все потоки и не тормозит прокси /api/*.
+    """
+
+    def __init__(self, workers: int, queue: int, rounds: int, cap: int = 0):
+        self.rounds = rounds
+        workers = max(1, workers)
+        slots = workers + max(0, queue)
+        if cap > 0:
+            slots = max(1, min(slots, cap))
+            workers = min(workers, slots)
+        self.workers, self.queue = workers, slots - workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self._stats = {"hashed": 0, "verified_ok": 0, "verified_fail": 0, "rehashed": 0,
+                       "rejected": 0, "in_flight": 0, "wait_ms_total": 0.0, "work_ms_total": 0.0}
+
+    def _count(self, **kw: Any) -> None:
+        with self._lock:
+            for k, v in kw.items():
+                self._stats[k] += v
+
+    def _run(self, fn: Callable[[], Any]) -> Any:
+        if not self._slots.acquire(blocking=False):
+            self._count(rejected=1)
+            raise PasswordPoolBusy()
+        self._count(in_flight=1)
+        queued = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                self._count(wait_ms_total=(started - queued) * 1000.0,
+                            work_ms_total=(time.perf_counter() - started) * 1000.0)
+
+        def done(_f) -> None:
+            # слот занят, пока задача не завершилась или не отменена: брошенная по таймауту
+            # задача иначе выполнилась бы позже сверх лимита и задержала новые входы
+            self._count(in_flight=-1)
+            self._slots.release()
+
+        try:
+            fut = self._pool.submit(job)
+        except Exception:
+            done(None)
+            raise
+        fut.add_done_callback(done)
+        try:
+            return fut.result(timeout=settings.AUTH_BCRYPT_WAIT_SEC)
+        except FutureTimeout:
+            fut.cancel()  # ещё в очереди — не выполнится; уже идёт — слот освободится по завершении
+            self._count(rejected=1)
+            raise PasswordPoolBusy()
+
+    def hash(self, plain: str) -> bytes:
+        h = self._run(lambda: bcrypt.hashpw(plain.encode("utf-8"), bcrypt.gensalt(rounds=self.rounds)))
+        self._count(hashed=1)
+        return h
+
+    def rehash(self, plain: str) -> bytes:
+        """Новый хэш с текущим cost при входе (см. needs_rehash)."""
+        h = self.hash(plain)
+        self._count(rehashed=1)
+        return h
+
+    def verify(self, plain: str, hashed: Union[bytes, str]) -> bool:
+        hb = hashed.encode("utf-8") if isinstance(hashed, str) else bytes(hashed)
+        if hb.startswith(tuple(p.encode() for p in _LEGACY_PREFIXES)):
+            from werkzeug.security import check_password_hash
+            ok = self._run(lambda: check_password_hash(hb.decode("utf-8"), plain))
+        else:
+            ok = self._run(lambda: bcrypt.checkpw(plain.encode("utf-8"), hb))
+        self._count(**{"verified_ok" if ok else "verified_fail": 1})
+        return ok
+
+    def needs_rehash(self, hashed: Union[bytes, str]) -> bool:
+        """Хэш не bcrypt или с другим cost, чем AUTH_BCRYPT_ROUNDS ($2b$<cost>$...)."""
+        hb = hashed.encode("utf-8") if isinstance(hashed, str) else bytes(hashed)
+        parts = hb.split(b"$")
+        if len(parts) < 4 or not parts[1].startswith(b"2"):
+            return True
+        try:
+            return int(parts[2]) != self.rounds
+        except ValueError:
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._stats)
+        done = st["verified_ok"] + st["verified_fail"] + st["hashed"]
+        st["avg_wait_ms"] = round(st.pop("wait_ms_total") / done, 1) if done else None
+        st["avg_work_ms"] = round(st.pop("work_ms_total") / done, 1) if done else None
+        st.update({"rounds": self.rounds, "workers": self.workers, "queue": self.queue})
+        return st
+
+
+hasher = PasswordHasher(settings.AUTH_BCRYPT_WORKERS, settings.AUTH_BCRYPT_QUEUE, settings.AUTH_BCRYPT_ROUNDS,
+                        cap=settings.GUNICORN_THREADS // 2)
+
+
 def hash_password(plain: str) -> bytes:
-    return bcrypt.hashpw(plain.encode("utf-8"), bcrypt.gensalt())
+    return hasher.hash(plain)
 
 def verify_password(plain: str, hashed: bytes) -> bool:
-    return bcrypt.checkpw(plain.encode("utf-8"), hashed)
+    return hasher.verify(plain, hashed)
 
 def make_jwt(sub: str, ttl_minutes=720):
     now = datetime.datetime.now(datetime.timezone.utc)
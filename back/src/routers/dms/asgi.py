@@ -0,0 +1,305 @@
+# src/routers/dms/asgi.py
+from __future__ import annotations
+import asyncio
+import json as _json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+
+from config import settings
+from redis_client import get_redis
+
+from .services import (
+    ENDPOINTS, CACHE_TTLS, Fetched, cache, cache_key, error_fetched,
+    _auth_headers, _http2_available
+)
+from .routes import (
+    BUNDLE_SECTIONS, BUNDLE_TIMEOUTS, bundle_body, children_tree,
+    _from_snapshot, _log_request, _log_response, _remember, coalescable
+)
+from .singleflight import flights
+
+log = logging.getLogger("api")
+
+
+class Route(NamedTuple):
+    endpoint: str              # ключ в ENDPOINTS
+    method: str                # метод апстрима
+    aliases: Tuple[str, ...]   # имена query-параметра у нас (первый — основной)
+    upstream_param: str        # имя параметра у апстрима
+    timeout: float
+    how: str = "params"        # params|json
+
+
+# Простые прокси-маршруты: те же, что и во Flask-blueprint (routes.py)
+ROUTES: Dict[str, Route] = {
+    "/api/ping_enums":       Route("ping_enums", "GET", (), "", 15.0),
+    "/api/models":           Route("catalog", "GET", (), "", 20.0),
+    "/api/structure_get":    Route("structure_get", "GET", ("code",), "structureCode", 20.0),
+    "/api/explosive":        Route("explosive", "GET", ("code",), "structureCode", 20.0),
+    "/api/technical":        Route("technical", "GET", ("code",), "structureCode", 20.0),
+    "/api/function_desc":    Route("function_desc", "GET", ("code",), "structureCode", 20.0),
+    "/api/part_detail":      Route("part_detail", "GET", ("code",), "structureCode", 20.0),
+    "/api/destuffing":       Route("destuffing", "GET", ("code",), "structureCode", 30.0),
+    "/api/circuit":          Route("circuit", "POST", ("code",), "structureCode", 30.0, "json"),
+    "/api/circuit_hot":      Route("circuit_hot", "GET", ("circuitId", "id", "code"), "circuitId", 30.0),
+    "/api/procedure":        Route("procedure", "GET", ("procedureId", "id", "code"), "procedureId", 30.0),
+    "/api/destuffing_by_id": Route("destuffing_by_id", "GET", ("destuffingId", "id", "code"), "destuffingId", 30.0),
+}
+
+Reply = Tuple[int, bytes, List[Tuple[bytes, bytes]]]
+
+
+def _json_reply(status: int, obj: Any) -> Reply:
+    return status, _json.dumps(obj, ensure_ascii=False).encode("utf-8"), [(b"content-type", b"application/json")]
+
+
+def _pack(res: Fetched) -> Reply:
+    """Тело апстрима/кэша отдаём байтами как есть."""
+    headers = [(b"content-type", res.ctype.encode("latin-1"))]
+    if res.source not in ("upstream", "error"):
+        headers.append((b"x-dms-cache", res.source.encode()))
+    if res.snapshot_at:
+        headers.append((b"x-dms-snapshot-at", res.snapshot_at.encode()))
+    return res.status, res.body, headers
+
+
+class AsyncDmsProxy:
+    """
+    ASGI-приложение для прокси-маршрутов /api/*: ожидание апстрима — это корутина
+    на event loop, а не занятый поток gthread, поэтому одновременных вызовов
+    может быть тысячи. Всё, что здесь не описано (auth/admin/export/bot,
+    /api/material_list, preflight), уходит в fallback — обычное Flask-приложение.
+    """
+
+    def __init__(self, fallback: Callable[..., Awaitable[None]]):
+        self.fallback = fallback
+        self._client: Optional[httpx.AsyncClient] = None
+
+    # ---------- жизненный цикл ----------
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            http2 = bool(settings.DMS_HTTP2) and _http2_available()
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings.DMS_ASGI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DMS_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.DMS_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(20.0, connect=settings.DMS_HTTP_CONNECT_TIMEOUT),
+            )
+            log.info("async upstream client created (http2=%s, max_conn=%s)",
+                     http2, settings.DMS_ASGI_MAX_CONNECTIONS)
+        return self._client
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                _ = self.client
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                if self._client is not None:
+                    await self._client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ---------- ASGI ----------
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            await self.fallback(scope, receive, send)
+            return
+
+        handler = self._route(scope["method"], scope["path"])
+        if handler is None:
+            await self.fallback(scope, receive, send)
+            return
+
+        t0 = time.perf_counter()
+        try:
+            status, body, headers = await handler(scope, receive)
+        except Exception as e:
+            log.exception("asgi handler error: %r", e)
+            status, body, headers = _json_reply(500, {"ok": False, "error": "internal error"})
+        headers = headers + self._cors(scope) + [(b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+        client = scope.get("client") or ("-", 0)
+        log.info("%s %s %s %s %.1fms UA=%s (asgi)",
+                 client[0], scope["method"], scope["path"], status,
+                 (time.perf_counter() - t0) * 1000.0, self._header(scope, b"user-agent")[:150] or "-")
+
+    def _route(self, method: str, path: str):
+        if method == "GET" and path in ROUTES:
+            return lambda scope, receive: self._simple(ROUTES[path], scope)
+        if method == "GET" and path == "/api/node_bundle":
+            return self._node_bundle
+        if method == "POST" and path == "/api/children":
+            return self._children
+        if method == "POST" and path == "/api/circuit_click":
+            return self._circuit_click
+        return None
+
+    @staticmethod
+    def _header(scope, name: bytes) -> str:
+        for k, v in scope.get("headers") or []:
+            if k == name:
+                return v.decode("latin-1")
+        return ""
+
+    def _cors(self, scope) -> List[Tuple[bytes, bytes]]:
+        origin = self._header(scope, b"origin")
+        allowed = settings.CORS_ALLOW_ORIGINS
+        if not origin or not (origin in allowed or "*" in allowed):
+            return []
+        out = [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+        if settings.CORS_ALLOW_CREDENTIALS:
+            out.append((b"access-control-allow-credentials", b"true"))
+        return out
+
+    @staticmethod
+    def _query(scope) -> Dict[str, str]:
+        qs = parse_qs((scope.get("query_string") or b"").decode("latin-1"))
+        return {k: v[0] for k, v in qs.items() if v}
+
+    @staticmethod
+    async def _json_body(receive) -> Dict[str, Any]:
+        chunks = []
+        while True:
+            msg = await receive()
+            chunks.append(msg.get("body", b""))
+            if not msg.get("more_body"):
+                break
+        try:
+            js = _json.loads(b"".join(chunks) or b"{}")
+        except Exception:
+            return {}
+        return js if isinstance(js, dict) else {}
+
+    # ---------- маршруты ----------
+    async def _simple(self, route: Route, scope) -> Reply:
+        arg = None
+        if route.aliases:
+            q = self._query(scope)
+            val = next((q[a].strip() for a in route.aliases if (q.get(a) or "").strip()), "")
+            if not val:
+                return _json_reply(400, {"ok": False, "error": f"{route.aliases[0]} is required"})
+            arg = {route.upstream_param: val}
+        res = await self.fetch(
+            route.endpoint, route.method,
+            params=arg if route.how == "params" else None,
+            json=arg if route.how == "json" else None,
+            timeout=route.timeout,
+        )
+        return _pack(res)
+
+    async def _children(self, scope, receive) -> Reply:
+        js = await self._json_body(receive)
+        sub = (js.get("subSeries") or "").strip()
+        vin = (js.get("vin") or "").strip()
+        if not sub:
+            return _json_reply(400, {"ok": False, "error": "subSeries is required"})
+        # индекс каталога — БД + файл, поэтому в отдельном потоке (как и в Flask-режиме)
+        return _pack(await asyncio.to_thread(children_tree, sub, vin))
+
+    async def _circuit_click(self, scope, receive) -> Reply:
+        payload = await self._json_body(receive)
+        if not (payload.get("structureCode") or payload.get("circuitResourceCode") or payload.get("hotspotCode")):
+            return _json_reply(400, {"ok": False, "error": "payload is missing required fields"})
+        return _pack(await self.fetch("circuit", "POST", json=payload, timeout=30.0))
+
+    async def _node_bundle(self, scope, receive) -> Reply:
+        q = self._query(scope)
+        code = (q.get("code") or "").strip()
+        if not code:
+            return _json_reply(400, {"ok": False, "error": "code is required"})
+        raw = (q.get("sections") or "").strip()
+        wanted = [x.strip() for x in raw.split(",") if x.strip()] if raw else list(BUNDLE_SECTIONS)
+        names = [n for n in wanted if n in BUNDLE_SECTIONS]
+
+        t0 = time.perf_counter()
+        coros = []
+        for n in names:
+            method, how = BUNDLE_SECTIONS[n]
+            arg = {"structureCode": code}
+            coros.append(self.fetch(n, method,
+                                    params=arg if how == "params" else None,
+                                    json=arg if how == "json" else None,
+                                    timeout=BUNDLE_TIMEOUTS.get(n, 20.0)))
+        results = dict(zip(names, await asyncio.gather(*coros)))
+        return 200, bundle_body(code, results, t0), [(b"content-type", b"application/json")]
+
+    # ---------- апстрим ----------
+    async def fetch(self, name: str, method: str = "GET", *,
+                    params: Optional[Dict[str, Any]] = None,
+                    json: Optional[Any] = None,
+                    timeout: float = 20.0) -> Fetched:
+        """Асинхронный аналог routes._fetch: кэш → апстрим → снимок."""
+        t0 = time.perf_counter()
+        res = await self._fetch_inner(name, method, params=params, json=json, timeout=timeout)
+        res.ms = (time.perf_counter() - t0) * 1000.0
+        return res
+
+    async def _fetch_inner(self, name: str, method: str, *,
+                           params: Optional[Dict[str, Any]],
+                           json: Optional[Any],
+                           timeout: float) -> Fetched:
+        key = cache_key(name, params, json)
+        cacheable = settings.DMS_CACHE_ENABLED and name in CACHE_TTLS
+        if cacheable:
+            # без Redis кэш — чистая память, в отдельный поток уводить незачем
+            hit = cache.get(key) if get_redis() is None else await asyncio.to_thread(cache.get, key)
+            if hit:
+                item, level = hit
+                return Fetched(200, item.ctype, item.body, level)
+
+        headers, err = _auth_headers()
+        if err:
+            return await self._snapshot(key) or error_fetched(err[1], err[0]["error"])
+        if json is not None:
+            headers = {**headers, "content-type": "application/json"}
+
+        url = ENDPOINTS[name]
+        sampled = _log_request(method, url, headers, params, json)
+
+        async def call() -> httpx.Response:
+            t0 = time.perf_counter()
+            resp = await self.client.request(
+                method, url, headers=headers, params=params, json=json,
+                timeout=httpx.Timeout(timeout, connect=min(timeout, settings.DMS_HTTP_CONNECT_TIMEOUT)),
+            )
+            _log_response(url, t0, resp, sampled)
+            return resp
+
+        try:
+            if coalescable(name, method):
+                r, shared = await flights.ado(key, call)
+            else:
+                r, shared = await call(), False
+        except httpx.HTTPError as e:
+            log.warning("upstream %s error: %r", name, e)
+            status = 504 if isinstance(e, httpx.TimeoutException) else 502
+            return await self._snapshot(key) or error_fetched(status, f"upstream error: {type(e).__name__}")
+
+        if r.status_code >= 500:
+            snap = await self._snapshot(key)
+            if snap:
+                return snap
+        elif not shared:
+            # разбор JSON, SET в Redis, очереди снимков/поиска — не на event loop
+            await asyncio.to_thread(_remember, name, key, cacheable, r, params=params, json=json)
+        return Fetched(r.status_code, r.headers.get("content-type", "application/json"), r.content, "upstream")
+
+    @staticmethod
+    async def _snapshot(key: str) -> Optional[Fetched]:
+        # чтение снимка — запрос в БД + файл, уводим с event loop
+        return await asyncio.to_thread(_from_snapshot, key)
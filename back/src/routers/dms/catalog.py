@@ -0,0 +1,148 @@
+# src/routers/dms/catalog.py
+from __future__ import annotations
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import settings
+from db import get_session
+from src.models import CatalogTree
+
+from .services import CachedResponse
+
+log = logging.getLogger("api")
+
+_SAFE_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _count_nodes(body: bytes) -> int:
+    try:
+        js = json.loads(body)
+    except Exception:
+        return 0
+    d = js.get("data") if isinstance(js, dict) else None
+    if isinstance(d, dict) and isinstance(d.get("data"), dict):
+        d = d["data"]
+    smap = (d or {}).get("structureMap") if isinstance(d, dict) else None
+    if not isinstance(smap, dict):
+        return 0
+    return sum(len(v) for v in smap.values() if isinstance(v, list))
+
+
+class CatalogIndex:
+    """
+    Локальный индекс деревьев каталога (ответы structure_list_children) по subSeries/VIN:
+    файл <OUT_DIR>/catalog/<sub>__<vin>.json.gz + строка в catalog_trees.
+    Горячие деревья держим в памяти; сверку с БД делаем не чаще раза в MEM_RECHECK_SEC,
+    чтобы подхватывать обновления, записанные краулером в другом процессе.
+    """
+    MEM_RECHECK_SEC = 60.0
+
+    def __init__(self, root: Path, mem_items: int = 64):
+        self.root = root
+        self._mem: "OrderedDict[Tuple[str, str], Tuple[float, str, bytes]]" = OrderedDict()
+        self._mem_items = max(1, mem_items)
+        self._lock = threading.Lock()
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "stale": 0,
+                       "changed": 0, "unchanged": 0}
+
+    @staticmethod
+    def _file_rel(sub: str, vin: str) -> str:
+        return f"{_SAFE_RE.sub('_', sub)}__{_SAFE_RE.sub('_', vin) or '-'}.json.gz"
+
+    def _remember(self, k: Tuple[str, str], h: str, body: bytes) -> None:
+        with self._lock:
+            self._mem[k] = (time.monotonic(), h, body)
+            self._mem.move_to_end(k)
+            while len(self._mem) > self._mem_items:
+                self._mem.popitem(last=False)
+
+    # ---------- чтение ----------
+    def get(self, sub: str, vin: str = "") -> Optional[CachedResponse]:
+        """Дерево из индекса или None (нет / старше DMS_CATALOG_MAX_AGE_SEC)."""
+        k = (sub, vin)
+        with self._lock:
+            m = self._mem.get(k)
+        if m and time.monotonic() - m[0] < self.MEM_RECHECK_SEC:
+            with self._lock:
+                self._stats["hits_memory"] += 1
+            return CachedResponse("application/json", m[2])
+
+        try:
+            with get_session() as s:
+                row = s.scalar(select(CatalogTree).where(CatalogTree.sub_series == sub, CatalogTree.vin == vin))
+                if not row:
+                    self._stats["misses"] += 1
+                    return None
+                h, file_rel, checked = row.body_hash, row.file_rel, row.checked_at
+            age = time.time() - checked.timestamp() if checked else float("inf")
+            if age > settings.DMS_CATALOG_MAX_AGE_SEC:
+                self._stats["stale"] += 1
+                return None
+            if m and m[1] == h:
+                body = m[2]
+            else:
+                body = gzip.decompress((self.root / file_rel).read_bytes())
+        except Exception as e:
+            log.warning("catalog index read error sub=%s vin=%s: %r", sub, vin, e)
+            return None
+        self._remember(k, h, body)
+        self._stats["hits_disk"] += 1
+        return CachedResponse("application/json", body)
+
+    def known(self) -> List[Tuple[str, str]]:
+        with get_session() as s:
+            return [(r.sub_series, r.vin) for r in s.scalars(select(CatalogTree)).all()]
+
+    # ---------- запись ----------
+    def put(self, sub: str, vin: str, body: bytes) -> bool:
+        """
+        Сохранить свежий ответ апстрима. Файл перезаписывается, только если
+        содержимое изменилось; иначе обновляется лишь checked_at. Возвращает «изменилось?».
+        """
+        h = hashlib.sha256(body).hexdigest()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with get_session() as s:
+            row = s.scalar(select(CatalogTree).where(CatalogTree.sub_series == sub, CatalogTree.vin == vin))
+            if row and row.body_hash == h:
+                row.checked_at = now
+                self._stats["unchanged"] += 1
+                changed = False
+            else:
+                file_rel = self._file_rel(sub, vin)
+                path = self.root / file_rel
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".tmp")
+                tmp.write_bytes(gzip.compress(body, compresslevel=6))
+                os.replace(tmp, path)
+                if row is None:
+                    row = CatalogTree(sub_series=sub, vin=vin)
+                    s.add(row)
+                row.body_hash = h
+                row.file_rel = file_rel
+                row.size_bytes = path.stat().st_size
+                row.nodes = _count_nodes(body)
+                row.fetched_at = now
+                row.checked_at = now
+                self._stats["changed"] += 1
+                changed = True
+        self._remember((sub, vin), h, body)
+        return changed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_memory": len(self._mem)}
+
+
+index = CatalogIndex(Path(settings.OUT_DIR) / "catalog")
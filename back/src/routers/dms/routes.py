@@ -1,16 +1,27 @@
 # src/routers/dms/routes.py
 from __future__ import annotations
+import gzip
+import json as _json
 import logging
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Optional, Tuple
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 import httpx
 
+from config import settings
+
 from .services import (
-    COMMON_HEADERS, ENDPOINTS, pack_httpx, get_bearer,
+    COMMON_HEADERS, ENDPOINTS, IDEMPOTENT_POSTS, CACHE_TTLS, CachedResponse, Fetched, pack_httpx,
+    pack_cached, error_fetched, get_bearer, get_client, cache, cache_key, is_ok_json,
     _auth_headers, bearer_info
 )
+from .snapshots import store as snapshots
+from .catalog import index as catalog
+from .search import SEARCH_KINDS, index as search_index
+from .singleflight import flights
 
 # если нужны прямые вызовы бота (не обязательно)
 try:
@@ -50,35 +61,63 @@ def _shrink(obj: Any, limit: int = 800) -> Any:
         return obj
 
 
+def _sampled() -> bool:
+    """
+    Логировать ли этот вызов апстрима: только при включённом DEBUG у логгера api
+    и с вероятностью DMS_LOG_SAMPLE_RATE. На INFO всё остальное не выполняется вовсе.
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return False
+    rate = settings.DMS_LOG_SAMPLE_RATE
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
 def _log_request(method: str, url: str,
                  headers: Optional[Dict[str, str]] = None,
                  params: Optional[Dict[str, Any]] = None,
-                 json_body: Optional[Any] = None) -> Dict[str, Any]:
+                 json_body: Optional[Any] = None) -> bool:
+    """Лог исходящего запроса (если вызов попал в выборку). Возвращает «в выборке?» для _log_response."""
+    if not _sampled():
+        return False
     h = dict(headers or {})
     # маскируем токен
     if "authorization" in h:
         h["authorization"] = _mask_token(h.get("authorization"))
     if "Authorization" in h:
         h["Authorization"] = _mask_token(h.get("Authorization"))
-    log.debug("→ %s %s params=%s json=%s headers=%s",
-              method.upper(), url, _shrink(params), _shrink(json_body), _shrink(h))
-    return h
+    ep = httpx.URL(url).path
+    log.debug("→ %s %s endpoint=%s params=%s json=%s headers=%s",
+              method.upper(), url, ep, _shrink(params), _shrink(json_body), _shrink(h),
+              extra={"endpoint": ep, "direction": "request"})
+    return True
 
 
-def _log_response(url: str, started: float, resp: httpx.Response) -> None:
+def _log_response(url: str, started: float, resp: httpx.Response, sampled: bool = True) -> None:
+    """
+    Лог ответа апстрима со структурными полями (endpoint, status, latency_ms, bytes): в тексте
+    как key=value — их видно при любом форматтере, — и в extra для структурных обработчиков.
+    Превью тела режется по байтам до декодирования (DMS_LOG_BODY_BYTES), а не через resp.text.
+    """
+    if not sampled or not log.isEnabledFor(logging.DEBUG):
+        return
     dt = (time.perf_counter() - started) * 1000.0
     ctype = (resp.headers.get("content-type") or "").lower()
-    # стараемся не логировать огромные тела — только первые 1.5К
-    body_preview = ""
     try:
-        if "application/json" in ctype:
-            body_preview = _shrink(resp.text, 1500)
-        else:
-            body_preview = _shrink(resp.text, 500)
+        raw = resp.content
+        size = len(raw)
+        cap = settings.DMS_LOG_BODY_BYTES
+        preview = raw[:cap].decode(resp.encoding or "utf-8", "replace")
+        if size > cap:
+            preview += f"... <+{size - cap}b>"
+    except httpx.ResponseNotRead:
+        size, preview = int(resp.headers.get("content-length") or 0), "<stream>"
     except Exception:
-        body_preview = "<body read error>"
-    log.debug("← %s %s %d %.1fms ctype=%s body=%s",
-              resp.request.method, url, resp.status_code, dt, ctype, body_preview)
+        size, preview = 0, "<body read error>"
+    ep = httpx.URL(url).path
+    log.debug("← %s %s endpoint=%s status=%d latency_ms=%.1f bytes=%d ctype=%s body=%s",
+              resp.request.method, url, ep, resp.status_code, dt, size, ctype, preview,
+              extra={"endpoint": ep, "direction": "response", "status": resp.status_code,
+                     "latency_ms": round(dt, 1), "bytes": size})
 
 
 def _req(method: str, url: str, *,
@@ -89,19 +128,244 @@ def _req(method: str, url: str, *,
     """
     Единая точка исходящих вызовов с логами запроса/ответа.
     """
-    safe_headers = _log_request(method, url, headers, params, json)
+    sampled = _log_request(method, url, headers, params, json)
     t0 = time.perf_counter()
-    with httpx.Client(timeout=timeout) as cl:
-        if method.upper() == "GET":
-            r = cl.get(url, headers=headers, params=params)
-        elif method.upper() == "POST":
-            r = cl.post(url, headers=headers, params=params, json=json)
-        else:
-            r = cl.request(method.upper(), url, headers=headers, params=params, json=json)
-    _log_response(url, t0, r)
+    # общий пул соединений (keep-alive) вместо нового клиента на каждый вызов
+    cl = get_client()
+    tmo = httpx.Timeout(timeout, connect=min(timeout, settings.DMS_HTTP_CONNECT_TIMEOUT))
+    if method.upper() == "GET":
+        r = cl.get(url, headers=headers, params=params, timeout=tmo)
+    elif method.upper() == "POST":
+        r = cl.post(url, headers=headers, params=params, json=json, timeout=tmo)
+    else:
+        r = cl.request(method.upper(), url, headers=headers, params=params, json=json, timeout=tmo)
+    _log_response(url, t0, r, sampled)
     return r
 
 
+def _from_snapshot(key: str) -> Optional[Fetched]:
+    """Новейший снимок на диске (если есть)."""
+    if not settings.DMS_SNAPSHOT_ENABLED:
+        return None
+    snap = snapshots.latest(key)
+    if not snap:
+        return None
+    item, created = snap
+    return Fetched(200, item.ctype, item.body, "snapshot", snapshot_at=created)
+
+
+def _fetch(name: str, method: str = "GET", *,
+           params: Optional[Dict[str, Any]] = None,
+           json: Optional[Any] = None,
+           timeout: float = 20.0,
+           use_cache: bool = True) -> Fetched:
+    """
+    Вызов ENDPOINTS[name]: кэш (для справочных эндпоинтов) → апстрим.
+    Успешные ответы сохраняются снимком; если bearer ещё нет или апстрим
+    не ответил (таймаут/сеть/5xx) — берём последний снимок.
+    Не требует контекста Flask и не бросает исключений (годится для пула потоков).
+    use_cache=False — не читать кэш (фоновые задачи, которым нужен свежий ответ).
+    """
+    t0 = time.perf_counter()
+    res = _fetch_inner(name, method, params=params, json=json, timeout=timeout, use_cache=use_cache)
+    res.ms = (time.perf_counter() - t0) * 1000.0
+    return res
+
+
+def _fetch_inner(name: str, method: str, *,
+                 params: Optional[Dict[str, Any]],
+                 json: Optional[Any],
+                 timeout: float,
+                 use_cache: bool = True) -> Fetched:
+    key = cache_key(name, params, json)
+    cacheable = settings.DMS_CACHE_ENABLED and name in CACHE_TTLS
+    if cacheable and use_cache:
+        hit = cache.get(key)
+        if hit:
+            item, level = hit
+            return Fetched(200, item.ctype, item.body, level)
+
+    headers, err = _auth_headers()
+    if err:
+        return _from_snapshot(key) or error_fetched(err[1], err[0]["error"])
+    if json is not None:
+        headers = {**headers, "content-type": "application/json"}
+    call = lambda: _req(method, ENDPOINTS[name], headers=headers, params=params, json=json, timeout=timeout)
+    try:
+        if coalescable(name, method):
+            # одинаковый запрос уже в полёте — ждём его ответ вместо второго вызова апстрима
+            r, shared = flights.do(key, call, timeout)
+        else:
+            r, shared = call(), False
+    except httpx.HTTPError as e:
+        log.warning("upstream %s error: %r", name, e)
+        status = 504 if isinstance(e, httpx.TimeoutException) else 502
+        return _from_snapshot(key) or error_fetched(status, f"upstream error: {type(e).__name__}")
+
+    if r.status_code >= 500:
+        snap = _from_snapshot(key)
+        if snap:
+            return snap
+    elif not shared:
+        # кэш/снимок/индекс уже обновил ведущий запрос
+        _remember(name, key, cacheable, r, params=params, json=json)
+    ctype = r.headers.get("content-type", "application/json")
+    return Fetched(r.status_code, ctype, r.content, "upstream", resp=r)
+
+
+def coalescable(name: str, method: str) -> bool:
+    return settings.DMS_SINGLEFLIGHT_ENABLED and (method.upper() == "GET" or name in IDEMPOTENT_POSTS)
+
+
+def _remember(name: str, key: str, cacheable: bool, r: httpx.Response, *,
+              params: Optional[Dict[str, Any]] = None,
+              json: Optional[Any] = None) -> None:
+    """Успешный ответ апстрима → кэш (если эндпоинт кэшируемый), снимок на диск и поисковый индекс."""
+    if not is_ok_json(r):
+        return
+    if cacheable:
+        cache.store(name, key, r)
+    if settings.DMS_SNAPSHOT_ENABLED:
+        snapshots.save(key, r.content)
+    if settings.DMS_SEARCH_ENABLED and name in SEARCH_KINDS:
+        arg = SEARCH_KINDS[name]
+        code = (params or {}).get(arg) or (json if isinstance(json, dict) else {}).get(arg)
+        search_index.submit(name, str(code or ""), r.content)
+
+
+def children_tree(sub: str, vin: str = "") -> Fetched:
+    """
+    Дерево structure_list_children: сначала локальный индекс каталога
+    (его держит в актуальном виде фоновый обход src/jobs/catalog.py), иначе апстрим
+    с записью результата в индекс.
+    """
+    if settings.DMS_CATALOG_ENABLED:
+        hit = catalog.get(sub, vin)
+        if hit:
+            return Fetched(200, hit.ctype, hit.body, "catalog")
+    res = _fetch("children", "POST", json={"vin": vin, "subSeries": sub}, timeout=40.0)
+    if settings.DMS_CATALOG_ENABLED and res.resp is not None and is_ok_json(res.resp):
+        try:
+            catalog.put(sub, vin, res.body)
+        except Exception as e:
+            log.warning("catalog index write error sub=%s: %r", sub, e)
+    return res
+
+
+def _pack(res: Fetched):
+    if res.resp is not None:
+        return pack_httpx(res.resp)
+    if res.source == "error":
+        return res.body, res.status, {"Content-Type": res.ctype}
+    body, status, hdrs = pack_cached(CachedResponse(res.ctype, res.body), res.source)
+    if res.snapshot_at:
+        hdrs["X-DMS-Snapshot-At"] = res.snapshot_at
+    return body, res.status, hdrs
+
+
+def _proxy(name: str, method: str = "GET", *,
+           params: Optional[Dict[str, Any]] = None,
+           json: Optional[Any] = None,
+           timeout: float = 20.0):
+    """Проксирование в ENDPOINTS[name] (см. _fetch, для тяжёлых ответов — _stream) → Flask-ответ."""
+    # такой же запрос уже в полёте (буферизованный) — дешевле присоединиться к нему, чем стримить второй
+    if settings.DMS_STREAM_ENABLED and name in settings.DMS_STREAM_ENDPOINTS \
+            and not flights.in_flight(cache_key(name, params, json)):
+        return _stream(name, method, params=params, json=json, timeout=timeout)
+    return _pack(_fetch(name, method, params=params, json=json, timeout=timeout))
+
+
+# заголовки ответа апстрима, которые отдаём клиенту при потоковой передаче
+_STREAM_HEADERS = ("content-type", "content-encoding", "content-length")
+
+
+def _stream(name: str, method: str, *,
+            params: Optional[Dict[str, Any]],
+            json: Optional[Any],
+            timeout: float):
+    """
+    Потоковый прокси: байты апстрима уходят клиенту кусками по мере чтения,
+    без буферизации и разбора JSON; content-type/content-encoding — оригинальные
+    (gzip апстрима не распаковывается, если клиент его принимает).
+    Тело до DMS_STREAM_TEE_MAX_MB параллельно копируется, чтобы после отдачи
+    сохранить снимок и обновить поисковый индекс.
+    """
+    key = cache_key(name, params, json)
+    headers, err = _auth_headers()
+    if err:
+        return _pack(_from_snapshot(key) or error_fetched(err[1], err[0]["error"]))
+    headers = {**headers, "accept-encoding": request.headers.get("Accept-Encoding") or "identity"}
+    if json is not None:
+        headers["content-type"] = "application/json"
+
+    url = ENDPOINTS[name]
+    sampled = _log_request(method, url, headers, params, json)
+    cl = get_client()
+    t0 = time.perf_counter()
+    try:
+        req = cl.build_request(method.upper(), url, headers=headers, params=params, json=json,
+                               timeout=httpx.Timeout(timeout, connect=min(timeout, settings.DMS_HTTP_CONNECT_TIMEOUT)))
+        r = cl.send(req, stream=True)
+    except httpx.HTTPError as e:
+        log.warning("upstream %s error: %r", name, e)
+        status = 504 if isinstance(e, httpx.TimeoutException) else 502
+        return _pack(_from_snapshot(key) or error_fetched(status, f"upstream error: {type(e).__name__}"))
+
+    if r.status_code >= 500:
+        try:
+            r.read()
+        except httpx.HTTPError:
+            pass
+        finally:
+            r.close()
+        _log_response(url, t0, r, sampled)
+        snap = _from_snapshot(key)
+        return _pack(snap) if snap else pack_httpx(r)
+
+    out_headers = {k: r.headers[k] for k in _STREAM_HEADERS if k in r.headers}
+    out_headers["X-DMS-Stream"] = "1"
+    tee_max = settings.DMS_STREAM_TEE_MAX_MB * 1024 * 1024
+
+    def generate():
+        tee, size, complete = [], 0, False
+        try:
+            for chunk in r.iter_raw(settings.DMS_STREAM_CHUNK_KB * 1024):
+                size += len(chunk)
+                if size <= tee_max:
+                    tee.append(chunk)
+                yield chunk
+            complete = True
+        except httpx.HTTPError as e:
+            log.warning("upstream %s stream error after %d bytes: %r", name, size, e)
+        finally:
+            r.close()
+            if sampled:
+                dt = (time.perf_counter() - t0) * 1000.0
+                ep = httpx.URL(url).path
+                log.debug("← %s %s endpoint=%s status=%d latency_ms=%.1f bytes=%d (stream)",
+                          method.upper(), url, ep, r.status_code, dt, size,
+                          extra={"endpoint": ep, "direction": "response",
+                                 "status": r.status_code, "latency_ms": round(dt, 1), "bytes": size})
+        if complete and r.status_code == 200 and size <= tee_max:
+            _remember_raw(name, key, r, b"".join(tee), params=params, json=json)
+
+    return Response(generate(), status=r.status_code, headers=out_headers, direct_passthrough=True)
+
+
+def _remember_raw(name: str, key: str, r: httpx.Response, raw: bytes, *,
+                  params: Optional[Dict[str, Any]], json: Optional[Any]) -> None:
+    """Снимок/индекс по сырому (возможно сжатому) телу потокового ответа."""
+    try:
+        enc = (r.headers.get("content-encoding") or "").lower()
+        body = gzip.decompress(raw) if enc == "gzip" else raw if enc in ("", "identity") else None
+        if body is None:
+            return
+        full = httpx.Response(r.status_code, headers={"content-type": r.headers.get("content-type", "")}, content=body)
+        _remember(name, key, False, full, params=params, json=json)
+    except Exception as e:
+        log.warning("stream snapshot error %s: %r", name, e)
+
+
 # --- CORS preflight для любого /api/* (защитно) ---
 @bp.route("/api/<path:_p>", methods=["OPTIONS"])
 def api_preflight(_p):
@@ -112,7 +376,9 @@ def api_preflight(_p):
 @bp.get("/health")
 def health():
     info = bearer_info()
-    return jsonify({"ok": True, **info})
+    return jsonify({"ok": True, **info, "cache": cache.stats(), "snapshots": snapshots.stats(),
+                    "catalog": catalog.stats(), "search": search_index.stats(),
+                    "singleflight": flights.stats()})
 
 @bp.get("/api/bearer")
 def api_bearer():
@@ -121,122 +387,72 @@ def api_bearer():
 # Тестовый «безопасный» пинг под токеном: словари/энумы
 @bp.get("/api/ping_enums")
 def api_ping_enums():
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["ping_enums"], headers=headers, timeout=15.0)
-    return pack_httpx(r)
+    return _proxy("ping_enums", timeout=15.0)
 
 
 # --------------- DMS API ---------------
 
 @bp.get("/api/models")
 def api_models():
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["catalog"], headers=headers, timeout=20.0)
-    return pack_httpx(r)
+    return _proxy("catalog", timeout=20.0)
 
 @bp.post("/api/children")
 def api_children():
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
     js = request.get_json(silent=True) or {}
     sub = (js.get("subSeries") or "").strip()
     vin = (js.get("vin") or "").strip()
     if not sub:
         return jsonify({"ok": False, "error": "subSeries is required"}), 400
-    hdrs = {**headers, "content-type": "application/json"}
-    payload = {"vin": vin, "subSeries": sub}
-    r = _req("POST", ENDPOINTS["children"], headers=hdrs, json=payload, timeout=40.0)
-    return pack_httpx(r)
+    return _pack(children_tree(sub, vin))
 
 @bp.get("/api/destuffing")
 def api_destuffing():
     code = (request.args.get("code") or "").strip()
     if not code:
         return jsonify({"ok": False, "error": "code is required"}), 400
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["destuffing"], headers=headers,
-             params={"structureCode": code}, timeout=30.0)
-    return pack_httpx(r)
+    return _proxy("destuffing", params={"structureCode": code}, timeout=30.0)
 
 @bp.get("/api/part_detail")
 def api_part_detail():
     code = (request.args.get("code") or "").strip()
     if not code:
         return jsonify({"ok": False, "error": "code is required"}), 400
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["part_detail"], headers=headers,
-             params={"structureCode": code}, timeout=20.0)
-    return pack_httpx(r)
+    return _proxy("part_detail", params={"structureCode": code}, timeout=20.0)
 
 @bp.get("/api/circuit")
 def api_circuit():
     code = (request.args.get("code") or "").strip()
     if not code:
         return jsonify({"ok": False, "error": "code is required"}), 400
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    hdrs = {**headers, "content-type": "application/json"}
-    r = _req("POST", ENDPOINTS["circuit"], headers=hdrs,
-             json={"structureCode": code}, timeout=30.0)
-    return pack_httpx(r)
+    return _proxy("circuit", "POST", json={"structureCode": code}, timeout=30.0)
 
 @bp.get("/api/structure_get")
 def api_structure_get():
     code = (request.args.get("code") or "").strip()
     if not code:
         return jsonify({"ok": False, "error": "code is required"}), 400
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["structure_get"], headers=headers,
-             params={"structureCode": code}, timeout=20.0)
-    return pack_httpx(r)
+    return _proxy("structure_get", params={"structureCode": code}, timeout=20.0)
 
 @bp.get("/api/explosive")
 def api_explosive():
     code = (request.args.get("code") or "").strip()
     if not code:
         return jsonify({"ok": False, "error": "code is required"}), 400
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["explosive"], headers=headers,
-             params={"structureCode": code}, timeout=20.0)
-    return pack_httpx(r)
+    return _proxy("explosive", params={"structureCode": code}, timeout=20.0)
 
 @bp.get("/api/technical")
 def api_technical():
     code = (request.args.get("code") or "").strip()
     if not code:
         return jsonify({"ok": False, "error": "code is required"}), 400
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["technical"], headers=headers,
-             params={"structureCode": code}, timeout=20.0)
-    return pack_httpx(r)
+    return _proxy("technical", params={"structureCode": code}, timeout=20.0)
 
 @bp.get("/api/function_desc")
 def api_function_desc():
     code = (request.args.get("code") or "").strip()
     if not code:
         return jsonify({"ok": False, "error": "code is required"}), 400
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-    r = _req("GET", ENDPOINTS["function_desc"], headers=headers,
-             params={"structureCode": code}, timeout=20.0)
-    return pack_httpx(r)
+    return _proxy("function_desc", params={"structureCode": code}, timeout=20.0)
 
 @bp.get("/api/circuit_hot")
 def api_circuit_hot():
@@ -250,18 +466,7 @@ def api_circuit_hot():
     if not circuit_id:
         return jsonify({"ok": False, "error": "circuitId is required"}), 400
 
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-
-    r = _req(
-        "GET",
-        ENDPOINTS["circuit_hot"],
-        headers=headers,
-        params={"circuitId": circuit_id},
-        timeout=30.0,
-    )
-    return pack_httpx(r)
+    return _proxy("circuit_hot", params={"circuitId": circuit_id}, timeout=30.0)
 
 
 @bp.post("/api/circuit_click")
@@ -278,24 +483,12 @@ def api_circuit_click():
         "wirHotspotCode": null
       }
     """
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-
     payload = request.get_json(silent=True) or {}
     # Лёгкая валидация, чтобы не стрелять совсем пустым
     if not (payload.get("structureCode") or payload.get("circuitResourceCode") or payload.get("hotspotCode")):
         return jsonify({"ok": False, "error": "payload is missing required fields"}), 400
 
-    hdrs = {**headers, "content-type": "application/json"}
-    r = _req(
-        "POST",
-        ENDPOINTS["circuit"],
-        headers=hdrs,
-        json=payload,
-        timeout=30.0,
-    )
-    return pack_httpx(r)
+    return _proxy("circuit", "POST", json=payload, timeout=30.0)
 
 @bp.get("/api/procedure")
 def api_procedure():
@@ -309,18 +502,7 @@ def api_procedure():
     if not pid:
         return jsonify({"ok": False, "error": "procedureId is required"}), 400
 
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-
-    r = _req(
-        "GET",
-        ENDPOINTS["procedure"],
-        headers=headers,
-        params={"procedureId": pid},
-        timeout=30.0,
-    )
-    return pack_httpx(r)
+    return _proxy("procedure", params={"procedureId": pid}, timeout=30.0)
 
 @bp.get("/api/destuffing_by_id")
 def api_destuffing_by_id():
@@ -334,18 +516,7 @@ def api_destuffing_by_id():
     if not destuffing_id:
         return jsonify({"ok": False, "error": "destuffingId is required"}), 400
 
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-
-    r = _req(
-        "GET",
-        ENDPOINTS["destuffing_by_id"],
-        headers=headers,
-        params={"destuffingId": destuffing_id},
-        timeout=30.0,
-    )
-    return pack_httpx(r)
+    return _proxy("destuffing_by_id", params={"destuffingId": destuffing_id}, timeout=30.0)
 
 @bp.route("/api/material_list", methods=["GET", "POST"])
 def api_material_list():
@@ -356,10 +527,6 @@ def api_material_list():
       - POST /api/material_list  с телом-оригиналом апи
         {"pageNo":1,"pageSize":10,"param":{"destuffingId":"...","bizCodeList":null,"materialType":10}}
     """
-    headers, err = _auth_headers()
-    if err:
-        return jsonify(err[0]), err[1]
-
     if request.method == "GET":
         destuffing_id = (request.args.get("destuffingId") or request.args.get("id") or "").strip()
         if not destuffing_id:
@@ -422,15 +589,106 @@ def api_material_list():
                 },
             }
 
-    hdrs = {**headers, "content-type": "application/json"}
-    r = _req(
-        "POST",
-        ENDPOINTS["material_list"],
-        headers=hdrs,
-        json=payload,
-        timeout=30.0,
-    )
-    return pack_httpx(r)
+    return _proxy("material_list", "POST", json=payload, timeout=30.0)
+
+# --------------- Поиск ---------------
+
+@bp.get("/api/search")
+def api_search():
+    """
+    Полнотекстовый поиск по уже полученным ответам (детали, процедуры, техданные, описания).
+    Пример: /api/search?q=стартер&limit=20&kind=part_detail,procedure
+    """
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"ok": False, "error": "q is required"}), 400
+    try:
+        limit = max(1, min(100, int(request.args.get("limit") or 20)))
+    except Exception:
+        limit = 20
+    kinds = [k for k in (request.args.get("kind") or "").split(",") if k.strip() in SEARCH_KINDS]
+    t0 = time.perf_counter()
+    try:
+        items = search_index.search(q, limit=limit, kinds=[k.strip() for k in kinds] or None)
+    except Exception as e:
+        log.warning("search error q=%r: %r", q, e)
+        return jsonify({"ok": False, "error": "search failed"}), 500
+    return jsonify({"ok": True, "q": q, "count": len(items), "items": items,
+                    "ms": round((time.perf_counter() - t0) * 1000.0, 1)})
+
+# --------------- Пакет данных узла ---------------
+
+# Секции, которые Viewer грузит при открытии узла: имя → (метод, как передать код)
+BUNDLE_SECTIONS: Dict[str, Tuple[str, str]] = {
+    "structure_get": ("GET", "params"),
+    "explosive":     ("GET", "params"),
+    "technical":     ("GET", "params"),
+    "function_desc": ("GET", "params"),
+    "circuit":       ("POST", "json"),
+    "destuffing":    ("GET", "params"),
+    "part_detail":   ("GET", "params"),
+}
+BUNDLE_TIMEOUTS: Dict[str, float] = {"circuit": 30.0, "destuffing": 30.0}
+
+_bundle_pool = ThreadPoolExecutor(max_workers=settings.DMS_BUNDLE_WORKERS,
+                                  thread_name_prefix="dms-bundle")
+
+
+def fetch_bundle(code: str, sections: Optional[list] = None) -> Dict[str, Fetched]:
+    """Параллельно запрашивает секции узла; результат — {секция: Fetched}."""
+    names = [n for n in (sections or BUNDLE_SECTIONS) if n in BUNDLE_SECTIONS]
+    futures = {}
+    for n in names:
+        method, how = BUNDLE_SECTIONS[n]
+        arg = {"structureCode": code}
+        futures[n] = _bundle_pool.submit(
+            _fetch, n, method,
+            params=arg if how == "params" else None,
+            json=arg if how == "json" else None,
+            timeout=BUNDLE_TIMEOUTS.get(n, 20.0),
+        )
+    return {n: f.result() for n, f in futures.items()}
+
+
+@bp.get("/api/node_bundle")
+def api_node_bundle():
+    """
+    Все секции узла одним запросом: вызовы в апстрим идут параллельно,
+    время ответа ≈ самый медленный вызов, а не их сумма.
+    /api/node_bundle?code=...[&sections=structure_get,explosive]
+    Ответ: {"ok", "code", "ms", "sections": {имя: {"status", "ok", "source", "ms", "data"}}}
+    """
+    code = (request.args.get("code") or "").strip()
+    if not code:
+        return jsonify({"ok": False, "error": "code is required"}), 400
+    raw = (request.args.get("sections") or "").strip()
+    wanted = [x.strip() for x in raw.split(",") if x.strip()] if raw else None
+
+    t0 = time.perf_counter()
+    results = fetch_bundle(code, wanted)
+    return Response(bundle_body(code, results, t0), status=200, mimetype="application/json")
+
+
+def bundle_body(code: str, results: Dict[str, Fetched], started: float) -> bytes:
+    """
+    Склейка ответа node_bundle. Валидные JSON-тела апстрима вклеиваем байтами, без
+    пересериализации; тело с JSON content-type, которое не разбирается (обрезанный ответ,
+    HTML ошибки прокси), — строкой, как и не-JSON: иначе сломался бы весь пакет.
+    """
+    parts = []
+    for n, res in results.items():
+        is_json = "json" in res.ctype.lower() and res.body.strip()
+        if is_json:
+            try:
+                _json.loads(res.body)
+            except ValueError:
+                is_json = False
+        data = res.body if is_json else _json.dumps(res.body.decode("utf-8", "replace")).encode("utf-8")
+        meta = _json.dumps({"status": res.status, "ok": res.status == 200,
+                            "source": res.source, "ms": round(res.ms, 1)})
+        parts.append(b'"' + n.encode() + b'":' + meta[:-1].encode() + b',"data":' + data + b"}")
+    head = _json.dumps({"ok": True, "code": code, "ms": round((time.perf_counter() - started) * 1000.0, 1)})
+    return head[:-1].encode() + b',"sections":{' + b",".join(parts) + b"}}"
 
 # --------------- БОТ (минимум) ---------------
 
@@ -0,0 +1,159 @@
+# src/routers/dms/search.py
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import re
+import threading
+from queue import Queue, Full
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from db import get_session
+from src.models import SearchDoc
+from src.routers.export.html_blocks import html_to_text
+
+log = logging.getLogger("api")
+
+# Какие ответы попадают в индекс: имя эндпоинта → имя параметра с кодом
+SEARCH_KINDS: Dict[str, str] = {
+    "structure_get": "structureCode",
+    "part_detail":   "structureCode",
+    "technical":     "structureCode",
+    "function_desc": "structureCode",
+    "procedure":     "procedureId",
+}
+
+_TITLE_KEYS = ("materialName", "structureName", "procedureName", "title", "name")
+# поля без полезного текста (урлы, svg, карты хотспотов)
+_SKIP_KEYS = {"svgContent", "fileUrl", "url", "imgUrl", "imageUrl", "hotspotToStructures", "hotspotHighlight"}
+_HTML_HINT = re.compile(r"<[a-zA-Z/!]")
+_WORD_RE = re.compile(r"\w+", re.U)
+MAX_BODY_CHARS = 100_000
+
+
+def extract_text(js: Any) -> Tuple[str, str]:
+    """(заголовок, текст) из JSON-ответа апстрима: все строки, HTML → текст."""
+    title = ""
+    out: List[str] = []
+    size = 0
+    stack: List[Tuple[str, Any]] = [("", js)]
+    while stack and size < MAX_BODY_CHARS:
+        key, v = stack.pop()
+        if isinstance(v, dict):
+            stack.extend(reversed([(k, x) for k, x in v.items() if k not in _SKIP_KEYS]))
+        elif isinstance(v, list):
+            stack.extend(reversed([(key, x) for x in v]))
+        elif isinstance(v, str):
+            s = v.strip()
+            if not s or s.startswith(("http://", "https://", "data:")):
+                continue
+            if not title and key in _TITLE_KEYS:
+                title = s[:300]
+            if _HTML_HINT.search(s):
+                s = html_to_text(s)
+            if s and (not out or out[-1] != s):
+                out.append(s)
+                size += len(s)
+    return title, "\n".join(out)[:MAX_BODY_CHARS]
+
+
+def _to_tsquery(q: str) -> str:
+    """Пользовательская строка → префиксный tsquery: «мотор кре» → 'мотор':* & 'кре':*."""
+    words = [w.lower() for w in _WORD_RE.findall(q or "")][:8]
+    return " & ".join("'" + w.replace("'", "") + "':*" for w in words if w.replace("'", ""))
+
+
+class SearchIndex:
+    """
+    Полнотекстовый индекс по закэшированным ответам (таблица search_docs, tsvector + GIN).
+    Пополняется в фоне при каждом успешном ответе апстрима; неизменившиеся
+    документы не перезаписываются (сравнение по src_hash).
+    """
+
+    def __init__(self, queue_size: int = 512):
+        self._q: "Queue[Tuple[str, str, bytes]]" = Queue(maxsize=queue_size)
+        self._th: Optional[threading.Thread] = None
+        self._th_lock = threading.Lock()
+        self._stats = {"indexed": 0, "dropped": 0, "errors": 0, "queries": 0}
+
+    def submit(self, kind: str, code: str, body: bytes) -> None:
+        if kind not in SEARCH_KINDS or not code or not body:
+            return
+        self._ensure_worker()
+        try:
+            self._q.put_nowait((kind, code, body))
+        except Full:
+            self._stats["dropped"] += 1
+
+    def _ensure_worker(self) -> None:
+        if self._th and self._th.is_alive():
+            return
+        with self._th_lock:
+            if not (self._th and self._th.is_alive()):
+                self._th = threading.Thread(target=self._loop, daemon=True, name="dms-search-index")
+                self._th.start()
+
+    def _loop(self) -> None:
+        while True:
+            kind, code, body = self._q.get()
+            try:
+                self.upsert(kind, code, body)
+            except Exception as e:
+                self._stats["errors"] += 1
+                log.warning("search index error %s:%s: %r", kind, code, e)
+
+    def upsert(self, kind: str, code: str, body: bytes) -> None:
+        h = hashlib.sha256(body).hexdigest()
+        title, txt = extract_text(json.loads(body))
+        if not (title or txt):
+            return
+        stmt = insert(SearchDoc).values(
+            doc_key=f"{kind}:{code}", kind=kind, code=code, title=title, body=txt, src_hash=h,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SearchDoc.doc_key],
+            set_={"title": stmt.excluded.title, "body": stmt.excluded.body,
+                  "src_hash": stmt.excluded.src_hash, "updated_at": text("now()")},
+            where=SearchDoc.src_hash != stmt.excluded.src_hash,
+        )
+        with get_session() as s:
+            s.execute(stmt)
+        self._stats["indexed"] += 1
+
+    def search(self, q: str, limit: int = 20, kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Ранжированный поиск. Сначала отбираем top-N по индексу (GIN, ts_rank_cd),
+        и только для них считаем ts_headline — он дорогой на длинных телах.
+        """
+        tsq = _to_tsquery(q)
+        if not tsq:
+            return []
+        self._stats["queries"] += 1
+        sql = text("""
+            WITH q AS (SELECT to_tsquery('simple', :tsq) AS q),
+            top AS (
+                SELECT d.id, ts_rank_cd(d.tsv, q.q) AS rank
+                FROM search_docs d, q
+                WHERE d.tsv @@ q.q AND (CAST(:kinds AS text[]) IS NULL OR d.kind = ANY(CAST(:kinds AS text[])))
+                ORDER BY rank DESC
+                LIMIT :limit
+            )
+            SELECT d.kind, d.code, d.title, top.rank,
+                   ts_headline('simple', left(d.body, 20000), q.q,
+                               'MaxFragments=1, MaxWords=25, MinWords=8, StartSel=<b>, StopSel=</b>') AS snippet
+            FROM top JOIN search_docs d ON d.id = top.id, q
+            ORDER BY top.rank DESC
+        """)
+        with get_session() as s:
+            rows = s.execute(sql, {"tsq": tsq, "limit": limit, "kinds": kinds or None}).mappings().all()
+        return [{"kind": r["kind"], "code": r["code"], "title": r["title"],
+                 "rank": round(float(r["rank"]), 4), "snippet": r["snippet"]} for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "queue": self._q.qsize()}
+
+
+index = SearchIndex()
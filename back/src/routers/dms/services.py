@@ -1,21 +1,24 @@
 # src/routers/dms/services.py
 from __future__ import annotations
-from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Any, Dict, Optional, Tuple
+import atexit
 import base64
+import hashlib
 import json
+import logging
+import threading
 import time
 
 import httpx
-from flask import jsonify
 from config import settings
+from redis_client import get_redis, redis_failed
 
-try:
-    from src.bot.chehejia_bot import bot
-except Exception:
-    bot = None
+from src.bot.broker import broker
 
-TOKEN_FILE = Path(settings.OUT_DIR) / "token.json"
+
+log = logging.getLogger("api")
 
 def _mask(tok: str, left: int = 6, right: int = 6) -> str:
     if not tok:
@@ -71,42 +74,248 @@ ENDPOINTS = {
     "destuffing_by_id": f"{BASE}/destuffing/by_destuffing_id",
     "material_list": f"{BASE}/destuffing/material_list",
 }
+# POST-эндпоинты, которые только читают: одинаковые вызовы можно склеивать, как GET
+IDEMPOTENT_POSTS = {"children", "circuit", "material_list"}
 
-def pack_httpx(resp: httpx.Response):
+# === Кэш ответов справочных эндпоинтов ===
+# TTL (сек) по имени эндпоинта; чего нет в словаре — не кэшируется
+CACHE_TTLS: Dict[str, int] = {
+    "catalog":       settings.DMS_CACHE_TTL_MODELS_SEC,
+    "structure_get": settings.DMS_CACHE_TTL_SEC,
+    "explosive":     settings.DMS_CACHE_TTL_SEC,
+    "technical":     settings.DMS_CACHE_TTL_SEC,
+    "function_desc": settings.DMS_CACHE_TTL_SEC,
+    "part_detail":   settings.DMS_CACHE_TTL_SEC,
+}
+
+@dataclass
+class CachedResponse:
+    ctype: str
+    body: bytes
+
+def _norm(v: Any) -> Any:
+    if isinstance(v, str):
+        return v.strip()
+    if isinstance(v, dict):
+        return {str(k): _norm(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_norm(x) for x in v]
+    return v
+
+def cache_key(name: str, params: Optional[Dict[str, Any]] = None, json_body: Optional[Any] = None) -> str:
+    """Ключ = имя эндпоинта + хэш нормализованных параметров (порядок ключей не важен)."""
+    raw = json.dumps({"p": _norm(params or {}), "j": _norm(json_body)},
+                     sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return f"{name}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+def is_ok_json(resp: httpx.Response) -> bool:
+    """Успешный ответ: 200 + JSON без признаков ошибки в теле (code/success). Только такие кэшируем."""
+    if resp.status_code != 200:
+        return False
+    if "application/json" not in (resp.headers.get("content-type") or "").lower():
+        return False
+    try:
+        js = resp.json()
+    except Exception:
+        return False
+    if isinstance(js, dict):
+        if js.get("success") is False:
+            return False
+        code = js.get("code")
+        if code is not None and str(code) not in {"0", "200"}:
+            return False
+    return True
+
+class ResponseCache:
     """
-    Пробрасываем status_code и тело как есть (json если возможно).
+    Двухуровневый кэш: LRU в памяти процесса (ограничен по числу записей и байтам)
+    + общий Redis, чтобы попадания разделялись между воркерами gunicorn.
     """
+    PREFIX = "dms:cache:"
+
+    def __init__(self, max_items: int, max_bytes: int):
+        self._max_items = max(1, max_items)
+        self._max_bytes = max(1, max_bytes)
+        self._lru: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits_memory": 0, "hits_redis": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _put_local(self, key: str, item: CachedResponse, expires: float) -> None:
+        size = len(item.body)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old:
+                self._bytes -= len(old[1].body)
+            self._lru[key] = (expires, item)
+            self._bytes += size
+            while len(self._lru) > self._max_items or self._bytes > self._max_bytes:
+                _k, (_e, ev) = self._lru.popitem(last=False)
+                self._bytes -= len(ev.body)
+                self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[Tuple[CachedResponse, str]]:
+        """Возвращает (ответ, уровень: memory|redis) или None."""
+        now = time.time()
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit:
+                if hit[0] > now:
+                    self._lru.move_to_end(key)
+                    self._stats["hits_memory"] += 1
+                    return hit[1], "memory"
+                self._lru.pop(key, None)
+                self._bytes -= len(hit[1].body)
+
+        r = get_redis()
+        if r is not None:
+            try:
+                pipe = r.pipeline()
+                pipe.get(self.PREFIX + key)
+                pipe.pttl(self.PREFIX + key)
+                raw, pttl = pipe.execute()
+            except Exception as e:
+                redis_failed(e)
+                raw, pttl = None, None
+            if raw:
+                ctype, _, body = raw.partition(b"\n")
+                item = CachedResponse(ctype.decode("latin-1"), body)
+                ttl = (pttl / 1000.0) if pttl and pttl > 0 else 1.0
+                self._put_local(key, item, now + ttl)
+                self._count("hits_redis")
+                return item, "redis"
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, item: CachedResponse, ttl: int) -> None:
+        if ttl <= 0:
+            return
+        self._put_local(key, item, time.time() + ttl)
+        self._count("stores")
+        r = get_redis()
+        if r is not None:
+            try:
+                r.set(self.PREFIX + key, item.ctype.encode("latin-1") + b"\n" + item.body, ex=ttl)
+            except Exception as e:
+                redis_failed(e)
+
+    def store(self, name: str, key: str, resp: httpx.Response) -> None:
+        """Положить успешный (см. is_ok_json) ответ апстрима в кэш, если эндпоинт кэшируемый."""
+        ttl = CACHE_TTLS.get(name)
+        if not ttl:
+            return
+        self.set(key, CachedResponse(resp.headers.get("content-type", "application/json"), resp.content), ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._stats)
+            st.update({"items": len(self._lru), "bytes": self._bytes})
+        hits = st["hits_memory"] + st["hits_redis"]
+        total = hits + st["misses"]
+        st["hit_ratio"] = round(hits / total, 3) if total else None
+        st["redis"] = get_redis() is not None
+        return st
+
+cache = ResponseCache(settings.DMS_CACHE_MAX_ITEMS, settings.DMS_CACHE_MAX_MB * 1024 * 1024)
+
+@dataclass
+class Fetched:
+    """Результат одного вызова апстрима (или его замены из кэша/снимка)."""
+    status: int
+    ctype: str
+    body: bytes
+    source: str                              # upstream|memory|redis|snapshot|error
+    resp: Optional[httpx.Response] = None    # для source=upstream
+    snapshot_at: str = ""
+    ms: float = 0.0
+
+def error_fetched(status: int, error: str) -> Fetched:
+    body = json.dumps({"ok": False, "error": error}, ensure_ascii=False).encode("utf-8")
+    return Fetched(status, "application/json", body, "error")
+
+def pack_cached(item: CachedResponse, level: str):
+    """Отдаём закэшированное тело как есть, без повторного парсинга JSON."""
+    return item.body, 200, {"Content-Type": item.ctype, "X-DMS-Cache": level}
+
+# === Пул соединений к апстриму ===
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+def _http2_available() -> bool:
     try:
-        data = resp.json()
-        return jsonify(data), resp.status_code
+        import h2  # noqa: F401
+        return True
     except Exception:
-        txt = resp.text
-        return txt, resp.status_code, {"Content-Type": resp.headers.get("content-type", "text/plain")}
+        return False
 
-def get_bearer() -> Optional[str]:
+def get_client() -> httpx.Client:
     """
-    1) спрашиваем у бота, если он есть и запущен
-    2) читаем из out/token.json (если бот писал туда)
-    Возвращаем строку вида 'Bearer <JWT>'.
+    Общий на процесс httpx.Client с keep-alive.
+    TCP/TLS-рукопожатие с апстримом делается один раз на соединение,
+    а не на каждый /api/* запрос. httpx.Client потокобезопасен (gthread).
     """
-    # бот
-    if bot is not None:
+    global _client
+    cl = _client
+    if cl is not None and not cl.is_closed:
+        return cl
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            http2 = bool(settings.DMS_HTTP2)
+            if http2 and not _http2_available():
+                log.warning("DMS_HTTP2=1, но пакет h2 не установлен — работаем по HTTP/1.1")
+                http2 = False
+            _client = httpx.Client(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings.DMS_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.DMS_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.DMS_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(20.0, connect=settings.DMS_HTTP_CONNECT_TIMEOUT),
+            )
+            log.info("upstream http client created (http2=%s, max_conn=%s, keepalive=%s)",
+                     http2, settings.DMS_HTTP_MAX_CONNECTIONS, settings.DMS_HTTP_MAX_KEEPALIVE)
+        return _client
+
+def close_client() -> None:
+    global _client
+    with _client_lock:
+        cl, _client = _client, None
+    if cl is not None:
         try:
-            b = bot.get_bearer()
-            if b:
-                return b
+            cl.close()
         except Exception:
             pass
 
-    # файл
-    try:
-        if TOKEN_FILE.exists():
-            js = json.loads(TOKEN_FILE.read_text("utf-8"))
-            b = js.get("bearer") or js.get("token") or ""
-            return b or None
-    except Exception:
-        pass
-    return None
+def init_http_client(app) -> None:
+    """
+    Подключение пула к жизненному циклу приложения:
+    соединения закрываются при завершении процесса (как и бот — через atexit).
+    """
+    get_client()
+    atexit.register(close_client)
+
+def pack_httpx(resp: httpx.Response):
+    """
+    Пробрасываем status_code и тело как есть: байты апстрима с его content-type,
+    без json() → jsonify() (разбор и повторная сериализация больших ответов).
+    """
+    return resp.content, resp.status_code, {"Content-Type": resp.headers.get("content-type", "application/json")}
+
+def get_bearer() -> Optional[str]:
+    """
+    Bearer ('Bearer <JWT>') из брокера токенов: значение в памяти процесса,
+    которое публикует бот (Redis pub/sub или out/token.json по смене mtime).
+    Ни бот, ни файл на каждый запрос не опрашиваются.
+    """
+    return broker.get()
 
 def bearer_info() -> Dict[str, Any]:
     b = get_bearer()
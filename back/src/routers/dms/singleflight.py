@@ -0,0 +1,177 @@
+# src/routers/dms/singleflight.py
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from config import settings
+from redis_client import get_redis, redis_failed
+
+log = logging.getLogger("api")
+
+
+class _Call:
+    __slots__ = ("done", "result", "exc")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.exc: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых одновременных вызовов апстрима (single-flight):
+    первый запрос по ключу идёт в апстрим, остальные ждут его результат.
+
+    - внутри воркера — словарь «ключ → вызов в полёте» (потоки gthread / корутины ASGI);
+    - между воркерами (DMS_SINGLEFLIGHT_REDIS=1) — лок SET NX PX в Redis: ведущий
+      публикует ответ в короткоживущий ключ, остальные воркеры забирают его оттуда.
+    Ошибки ведущего получают все ожидающие; если ведущий в другом воркере
+    ничего не опубликовал (ошибка/5xx/упал), ожидающий идёт в апстрим сам.
+    """
+    LOCK_PREFIX = "dms:flight:lock:"
+    RES_PREFIX = "dms:flight:res:"
+    POLL_SEC = 0.05
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._acalls: Dict[str, "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "coalesced_redis": 0, "lock_timeouts": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def in_flight(self, key: str) -> bool:
+        """Вызов по ключу уже идёт в этом воркере (поток или корутина)."""
+        with self._lock:
+            return key in self._calls or key in self._acalls
+
+    # ---------- потоки (Flask/gthread) ----------
+    def do(self, key: str, fn: Callable[[], httpx.Response], timeout: float) -> Tuple[httpx.Response, bool]:
+        """(ответ, shared): shared=True — результат чужого вызова (ведущий уже его обработал)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            # ждём чуть дольше таймаута апстрима: ведущий точно завершится раньше
+            if not call.done.wait(timeout + 5.0):
+                raise httpx.ReadTimeout("single-flight wait timeout")
+            if call.exc is not None:
+                raise call.exc
+            return call.result, True
+
+        try:
+            call.result, shared = self._do_cluster(key, fn, timeout)
+            return call.result, shared
+        except BaseException as e:
+            call.exc = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_cluster(self, key: str, fn: Callable[[], httpx.Response], timeout: float) -> Tuple[httpx.Response, bool]:
+        r = get_redis() if settings.DMS_SINGLEFLIGHT_REDIS else None
+        if r is None:
+            return fn(), False
+        token = uuid.uuid4().hex
+        lock_key = self.LOCK_PREFIX + key
+        try:
+            got = r.set(lock_key, token, nx=True, px=int((timeout + 5.0) * 1000))
+        except Exception as e:
+            redis_failed(e)
+            return fn(), False
+
+        if not got:
+            resp = self._wait_remote(r, key, lock_key, timeout)
+            if resp is not None:
+                self._count("coalesced_redis")
+                return resp, True
+            return fn(), False
+
+        try:
+            resp = fn()
+            if resp.status_code < 500:
+                self._publish(r, key, resp)
+            return resp, False
+        finally:
+            try:
+                # снимаем только свой лок (мог истечь и достаться другому)
+                if r.get(lock_key) == token.encode():
+                    r.delete(lock_key)
+            except Exception as e:
+                redis_failed(e)
+
+    def _publish(self, r, key: str, resp: httpx.Response) -> None:
+        ctype = resp.headers.get("content-type", "application/json")
+        raw = f"{resp.status_code}\n{ctype}\n".encode("latin-1") + resp.content
+        try:
+            r.set(self.RES_PREFIX + key, raw, px=int(settings.DMS_SINGLEFLIGHT_RESULT_TTL_SEC * 1000))
+        except Exception as e:
+            redis_failed(e)
+
+    def _wait_remote(self, r, key: str, lock_key: str, timeout: float) -> Optional[httpx.Response]:
+        """Ждём ответ ведущего из другого воркера; None — идти в апстрим самим."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                pipe = r.pipeline()
+                pipe.get(self.RES_PREFIX + key)
+                pipe.exists(lock_key)
+                raw, locked = pipe.execute()
+            except Exception as e:
+                redis_failed(e)
+                return None
+            if raw:
+                status, ctype, body = raw.split(b"\n", 2)
+                return httpx.Response(int(status), headers={"content-type": ctype.decode("latin-1")},
+                                      content=body)
+            if not locked:
+                return None
+            time.sleep(self.POLL_SEC)
+        self._count("lock_timeouts")
+        return None
+
+    # ---------- asyncio (ASGI) ----------
+    async def ado(self, key: str, fn: Callable[[], Awaitable[httpx.Response]]) -> Tuple[httpx.Response, bool]:
+        """Склейка внутри event loop воркера (межпроцессная — только в потоковом режиме)."""
+        fut = self._acalls.get(key)
+        if fut is not None:
+            self._count("coalesced")
+            return await asyncio.shield(fut), True
+        fut = asyncio.get_running_loop().create_future()
+        self._acalls[key] = fut
+        self._count("leaders")
+        try:
+            resp = await fn()
+            fut.set_result(resp)
+            return resp, False
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # без ожидающих — не ругаться «exception was never retrieved»
+            raise
+        finally:
+            self._acalls.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls) + len(self._acalls),
+                    "redis": bool(settings.DMS_SINGLEFLIGHT_REDIS) and get_redis() is not None}
+
+
+flights = SingleFlight()
@@ -0,0 +1,164 @@
+# src/routers/dms/snapshots.py
+from __future__ import annotations
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from queue import Queue, Full
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import settings
+from db import get_session
+from src.models import Snapshot
+
+from .services import CachedResponse
+
+log = logging.getLogger("api")
+
+
+class SnapshotStore:
+    """
+    Персистентные снимки успешных ответов апстрима:
+    файл <SNAPSHOT_DIR>/<endpoint>/<xx>/<key>-<hash>.json.gz + строка в таблице snapshots.
+    Запись идёт в фоне (один поток), чтобы не задерживать ответ клиенту;
+    одинаковое содержимое повторно не пишется.
+    """
+
+    def __init__(self, root: str, keep: int = 3, queue_size: int = 256):
+        self.root = Path(root)
+        self.keep = max(1, keep)
+        self._q: "Queue[Tuple[str, bytes]]" = Queue(maxsize=queue_size)
+        self._th: Optional[threading.Thread] = None
+        self._th_lock = threading.Lock()
+        # structure_key → хэш последнего записанного тела (ограниченный LRU)
+        self._last: "OrderedDict[str, str]" = OrderedDict()
+        self._last_max = 20000
+        self._stats = {"saved": 0, "skipped_same": 0, "dropped": 0, "served": 0, "errors": 0}
+
+    # ---------- запись ----------
+    def save(self, structure_key: str, body: bytes) -> None:
+        """Поставить снимок в очередь на запись. Если очередь переполнена — пропускаем."""
+        if not body:
+            return
+        self._ensure_worker()
+        try:
+            self._q.put_nowait((structure_key, body))
+        except Full:
+            self._stats["dropped"] += 1
+
+    def _ensure_worker(self) -> None:
+        if self._th and self._th.is_alive():
+            return
+        with self._th_lock:
+            if not (self._th and self._th.is_alive()):
+                self._th = threading.Thread(target=self._loop, daemon=True, name="dms-snapshots")
+                self._th.start()
+
+    def _loop(self) -> None:
+        while True:
+            key, body = self._q.get()
+            try:
+                self._write(key, body)
+            except Exception as e:
+                self._stats["errors"] += 1
+                log.warning("snapshot write error key=%s: %r", key, e)
+
+    @staticmethod
+    def _hash_from_rel(file_rel: str) -> str:
+        stem = Path(file_rel).name.split(".", 1)[0]
+        return stem.rsplit("-", 1)[-1]
+
+    def _write(self, key: str, body: bytes) -> None:
+        h = hashlib.sha256(body).hexdigest()[:16]
+
+        last = self._last.get(key)
+        if last is None:
+            with get_session() as s:
+                row = s.scalar(
+                    select(Snapshot).where(Snapshot.structure_key == key)
+                    .order_by(Snapshot.created_at.desc(), Snapshot.id.desc()).limit(1)
+                )
+                last = self._hash_from_rel(row.file_rel) if row else ""
+        if last == h:
+            self._remember(key, h)
+            self._stats["skipped_same"] += 1
+            return
+
+        name, _, khash = key.partition(":")
+        file_rel = f"{name}/{khash[:2]}/{khash}-{h}.json.gz"
+        path = self.root / file_rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # своё имя у каждого писателя: тот же снимок могут писать несколько воркеров/потоков
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(gzip.compress(body, compresslevel=6))
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+        with get_session() as s:
+            s.add(Snapshot(file_rel=file_rel, size_bytes=path.stat().st_size, structure_key=key))
+            s.flush()
+            self._prune(s, key)
+
+        self._remember(key, h)
+        self._stats["saved"] += 1
+
+    def _prune(self, s, key: str) -> None:
+        """Оставляем только self.keep последних снимков ключа."""
+        old = s.scalars(
+            select(Snapshot).where(Snapshot.structure_key == key)
+            .order_by(Snapshot.created_at.desc(), Snapshot.id.desc()).offset(self.keep)
+        ).all()
+        if not old:
+            return
+        alive = set(s.scalars(
+            select(Snapshot.file_rel).where(Snapshot.structure_key == key)
+            .order_by(Snapshot.created_at.desc(), Snapshot.id.desc()).limit(self.keep)
+        ).all())
+        for row in old:
+            if row.file_rel not in alive:
+                try:
+                    (self.root / row.file_rel).unlink(missing_ok=True)
+                except Exception:
+                    pass
+            s.delete(row)
+
+    def _remember(self, key: str, h: str) -> None:
+        self._last[key] = h
+        self._last.move_to_end(key)
+        while len(self._last) > self._last_max:
+            self._last.popitem(last=False)
+
+    # ---------- чтение ----------
+    def latest(self, structure_key: str) -> Optional[Tuple[CachedResponse, str]]:
+        """Новейший снимок по ключу: (ответ, created_at ISO) или None."""
+        try:
+            with get_session() as s:
+                row = s.scalar(
+                    select(Snapshot).where(Snapshot.structure_key == structure_key)
+                    .order_by(Snapshot.created_at.desc(), Snapshot.id.desc()).limit(1)
+                )
+                if not row:
+                    return None
+                file_rel, created = row.file_rel, row.created_at
+            body = gzip.decompress((self.root / file_rel).read_bytes())
+        except Exception as e:
+            log.warning("snapshot read error key=%s: %r", structure_key, e)
+            return None
+        self._stats["served"] += 1
+        return CachedResponse("application/json", body), (created.isoformat() if created else "")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "queue": self._q.qsize()}
+
+
+store = SnapshotStore(settings.SNAPSHOT_DIR, keep=settings.DMS_SNAPSHOT_KEEP)
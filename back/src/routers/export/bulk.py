@@ -0,0 +1,325 @@
+# src/routers/export/bulk.py
+from __future__ import annotations
+import html
+import json
+import logging
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from src.routers.dms.services import Fetched
+
+log = logging.getLogger("api")
+
+# сборка узлов массового экспорта; fetch_bundle внутри раздаёт секции в свой пул dms-bundle,
+# поэтому здесь отдельный пул — иначе задачи ждали бы сами себя
+_bulk_pool = ThreadPoolExecutor(max_workers=settings.EXPORT_BULK_WORKERS, thread_name_prefix="export-bulk")
+
+_IMG_EXT_RE = re.compile(r"\.(svg|png|jpe?g|gif|webp)(\?|$)", re.I)
+
+
+# -------- секции DMS → HTML (как во фронте: pages/Viewer/utils/htmlFormatters.js) --------
+def _body(res: Optional[Fetched]) -> Any:
+    """Полезная нагрузка ответа DMS: body.data ?? body; ошибка/не JSON → None."""
+    if res is None or res.status != 200:
+        return None
+    try:
+        js = json.loads(res.body)
+    except Exception:
+        return None
+    if isinstance(js, dict) and js.get("data") is not None:
+        return js["data"]
+    return js
+
+
+def _s(v: Any) -> str:
+    return "" if v is None else str(v)
+
+
+def _img(url: str) -> str:
+    return f'<img src="{html.escape(url, quote=True)}" alt=""/>'
+
+
+def _by_sort(items: list) -> list:
+    return sorted((x for x in items if isinstance(x, dict)), key=lambda x: x.get("sort") or 0)
+
+
+def _list(d: Any, key: str) -> list:
+    v = d.get(key) if isinstance(d, dict) else None
+    return v if isinstance(v, list) else []
+
+
+def _fmt_function_desc(d: Any) -> str:
+    parts = []
+    for it in _list(d, "innerDeatilDtoList"):
+        content = _s(it.get("content")).strip()
+        if content:
+            parts.append(content)
+        url = _s(it.get("fileUrl"))
+        if url and _IMG_EXT_RE.search(url):
+            parts.append(_img(url))
+    return "<hr/>".join(parts)
+
+
+def _fmt_technical(d: Any) -> str:
+    items = [x for x in _list(d, "details") if isinstance(x, dict)]
+    items.sort(key=lambda x: (_s(x.get("createTime")), x.get("id") or 0))
+    blocks = []
+    for i, it in enumerate(items, 1):
+        content = _s(it.get("content")).strip()
+        url = _s(it.get("fileUrl")).strip()
+        if url:
+            content += _img(url) if _IMG_EXT_RE.search(url) else f"<p>Вложение #{i}: {html.escape(url)}</p>"
+        if content:
+            blocks.append(content)
+    return "<hr/>".join(blocks)
+
+
+def _fmt_circuit(d: Any) -> str:
+    blocks = []
+    for i, it in enumerate(_list(d, "structureCircuitList"), 1):
+        if not isinstance(it, dict):
+            continue
+        name = _s(it.get("circuitResourceName") or it.get("resourceName")) or f"Схема #{i}"
+        url = _s(it.get("fileUrl"))
+        img = _img(url) if url and _IMG_EXT_RE.search(url) else "<p>(изображение недоступно)</p>"
+        blocks.append(f"<p>{html.escape(name)}</p>{img}")
+    return "<hr/>".join(blocks)
+
+
+def _fmt_destuffing(d: Any) -> str:
+    if not isinstance(d, dict):
+        return ""
+    parts = []
+    loc = _s((d.get("materialLocation") or {}).get("fileUrl")) if isinstance(d.get("materialLocation"), dict) else ""
+    if loc:
+        parts.append("<p>Схема расположения</p>" + (_img(loc) if _IMG_EXT_RE.search(loc) else f"<p>{html.escape(loc)}</p>"))
+
+    attention = _by_sort(_list(d, "attentionList"))
+    if attention:
+        lis = "".join(f"<li>{_s(a.get('content')).strip() or '(пусто)'}</li>" for a in attention)
+        parts.append(f"<p>Внимание</p><ul>{lis}</ul>")
+
+    for tab in _by_sort(_list(d, "tabDToList")):
+        steps = _by_sort(_list(tab, "stepToList"))
+        if not steps:
+            continue
+        blocks = []
+        for i, st in enumerate(steps, 1):
+            url = _s(st.get("fileUrl"))
+            file_html = (_img(url) if _IMG_EXT_RE.search(url) else f"<p>Файл шага: {html.escape(url)}</p>") if url else ""
+            blocks.append(f"<p>Шаг {st.get('sort') or i}</p>"
+                          f"<div>{_s(st.get('stepExplain')).strip() or '(нет описания)'}</div>{file_html}")
+        parts.append(f"<h3>{html.escape(_s(tab.get('labelName')) or 'Шаги')}</h3>" + "<hr/>".join(blocks))
+    return "\n".join(parts)
+
+
+def _fmt_part_detail(d: Any) -> str:
+    if not isinstance(d, dict):
+        return ""
+    e = lambda v: html.escape(_s(v))
+    warranty = {True: "Да", False: "Нет"}.get(d.get("warrantyPeriod"), "")
+    rows = [
+        ("Расход", d.get("usageValue") if d.get("usageValue") is not None else d.get("maintenanceDosage")),
+        ("Ед. изм.", d.get("measurementUnitName") or d.get("measurementUnit")),
+        ("Маркировка цветных деталей", d.get("ieIdentifyCode")),
+        ("Условия использования", d.get("zhDesc")),
+        ("Модель автомобиля", d.get("applicableModel")),
+        ("№ деталей поставщика", d.get("supplierReference")),
+        ("Миним. кол-во упаковки поставщика", d.get("supplyMinPack")),
+        ("Миним. кол-во упаковки PDC", d.get("pdcMinPack")),
+        ("Гарантийный срок", warranty),
+    ]
+    return (
+        "<p>Запасы и цены</p>"
+        f"<p>Текущий склад: {e(d.get('warehouseName')) or '--'}</p>"
+        "<table><tr><th>Наименование детали</th><th>Объём запасов</th><th>Цена</th></tr>"
+        f"<tr><td>{e(d.get('materialName'))}</td><td>{e(d.get('availableQty'))}</td><td>{e(d.get('retailPrice'))}</td></tr></table>"
+        "<p>Другие информации</p>"
+        "<table><tr><th>Свойства</th><th>Значение свойств</th></tr>"
+        + "".join(f"<tr><td>{k}</td><td>{e(v)}</td></tr>" for k, v in rows)
+        + "</table>"
+    )
+
+
+def _explosive_url(d: Any) -> str:
+    """Как getExplosivePayload во фронте: первый .svg, иначе первый файл."""
+    arr = d if isinstance(d, list) else _list(d, "data")
+    arr = [x for x in arr if isinstance(x, dict)]
+    if not arr:
+        return ""
+    f = next((x for x in arr if _s(x.get("fileUrl")).lower().endswith(".svg")), arr[0])
+    return _s(f.get("fileUrl"))
+
+
+def payload_from_bundle(code: str, results: Dict[str, Fetched], model: Optional[dict] = None) -> Dict[str, Any]:
+    """Секции узла (fetch_bundle) → вход _build_docx в том же виде, что собирает фронт для /export/part."""
+    st = _body(results.get("structure_get"))
+    st = st if isinstance(st, dict) else {}
+    return {
+        "code": code,
+        "model": model or {},
+        "header": {
+            "name": st.get("materialName") or st.get("structureName") or "",
+            "materialCode": st.get("materialCode") or "",
+            "manHour": st.get("manHour") or "",
+            "torque": st.get("torque") or "",
+            "torqueDegree": st.get("torqueDegree") or "",
+        },
+        "sections": {
+            "functionDesc": _fmt_function_desc(_body(results.get("function_desc"))),
+            "technical": _fmt_technical(_body(results.get("technical"))),
+            "circuit": _fmt_circuit(_body(results.get("circuit"))),
+            "steps": _fmt_destuffing(_body(results.get("destuffing"))),
+            "part": _fmt_part_detail(_body(results.get("part_detail"))),
+        },
+        "imageUrl": _explosive_url(_body(results.get("explosive"))),
+    }
+
+
+# -------- сборка --------
+def _load_part(code: str, model: dict) -> Dict[str, Any]:
+    from src.routers.dms.routes import fetch_bundle  # блюпринт DMS с каталогом/поиском — только по делу
+
+    results = fetch_bundle(code)
+    if all(r.status != 200 for r in results.values()):
+        bad = sorted({f"{n}:{r.status}" for n, r in results.items()})
+        raise RuntimeError(f"DMS недоступен для {code} ({', '.join(bad)})")
+    return payload_from_bundle(code, results, model)
+
+
+def _ordered(codes: List[str], task, *args) -> Iterator[Tuple[str, Optional[Any], Optional[Exception]]]:
+    """
+    task(code, *args) для всех кодов в пуле, не больше EXPORT_BULK_WORKERS + 1 одновременно
+    (в памяти — только эти результаты); выдача — в порядке codes: (code, результат, ошибка).
+    """
+    window = max(1, settings.EXPORT_BULK_WORKERS) + 1
+    todo = iter(codes)
+    pending: "deque[Tuple[str, Future]]" = deque()
+    try:
+        for code in todo:
+            pending.append((code, _bulk_pool.submit(task, code, *args)))
+            if len(pending) >= window:
+                break
+        while pending:
+            code, fut = pending.popleft()
+            nxt = next(todo, None)
+            if nxt is not None:
+                pending.append((nxt, _bulk_pool.submit(task, nxt, *args)))
+            try:
+                yield code, fut.result(), None
+            except Exception as e:
+                log.warning("bulk export %s failed: %r", code, e)
+                yield code, None, e
+    finally:
+        # клиент ушёл посреди выгрузки — не собираем то, что уже никто не прочитает
+        for _code, fut in pending:
+            fut.cancel()
+
+
+def _zip_part(code: str, model: dict) -> Tuple[str, bytes]:
+    from .routes import _build_docx, export_filename
+    payload = _load_part(code, model)
+    return export_filename(payload), _build_docx(payload).getvalue()
+
+
+def _prefetch_part(code: str, model: dict) -> Tuple[dict, Dict[str, bytes]]:
+    from .routes import _collect_image_urls, _fetch_images
+    payload = _load_part(code, model)
+    return payload, _fetch_images(_collect_image_urls(payload), settings.EXPORT_IMAGES_DEADLINE_SEC)
+
+
+class _Sink:
+    """Приёмник для zipfile без seek (ZIP пишется с data descriptor); накопленное забираем take()."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+def iter_zip(codes: List[str], model: dict) -> Iterator[bytes]:
+    """
+    ZIP из DOCX по каждому узлу. Части уходят клиенту по мере готовности: DOCX узла пишется в архив
+    и сразу отдаётся, в памяти — только окно из EXPORT_BULK_WORKERS + 1 собираемых узлов.
+    Узлы, которые не удалось собрать, — в errors.txt в конце архива.
+    """
+    t0 = time.monotonic()
+    sink = _Sink()
+    used, errors = set(), []
+    # docx — уже zip, повторно не сжимаем
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for code, res, err in _ordered(codes, _zip_part, model):
+            if err is not None:
+                errors.append(f"{code}\t{err}")
+                continue
+            name, data = res
+            base, n = name[:-5], 1
+            while name in used:
+                n += 1
+                name = f"{base}_{n}.docx"
+            used.add(name)
+            zf.writestr(name, data)
+            del res, data
+            yield sink.take()
+        if errors:
+            zf.writestr("errors.txt", "\n".join(errors) + "\n")
+    yield sink.take()
+    log.info("bulk export zip: %d parts, %d failed, %.1f s",
+             len(used), len(errors), time.monotonic() - t0)
+
+
+def save_combined(codes: List[str], model: dict, path, progress=None) -> Dict[str, int]:
+    """
+    Один DOCX на все узлы (разрыв страницы между деталями) — в фоновой задаче экспорта
+    (src/jobs/export.py): документ держится в памяти целиком до save(), поэтому не в потоке
+    gthread. Секции и картинки узлов качаются окном, как для ZIP. progress(stage, done, total).
+    """
+    from docx import Document
+    from .routes import _apply_base_styles, _fill_doc
+
+    t0 = time.monotonic()
+    doc = Document()
+    _apply_base_styles(doc)
+    done, errors = 0, []
+    for i, (code, res, err) in enumerate(_ordered(codes, _prefetch_part, model), 1):
+        if err is not None:
+            errors.append(f"{code}: {err}")
+        else:
+            if done:
+                doc.add_page_break()
+            payload, images = res
+            _fill_doc(doc, payload, images)
+            done += 1
+            del res, images
+        if progress:
+            progress("parts", i, len(codes))
+    if errors:
+        doc.add_page_break()
+        doc.add_paragraph("Не удалось выгрузить:")
+        for line in errors:
+            doc.add_paragraph(line)
+    if progress:
+        progress("saving", 0, 1)
+    doc.save(str(path))
+    log.info("bulk export docx: %d parts, %d failed, %.1f s", done, len(errors), time.monotonic() - t0)
+    return {"parts": done, "failed": len(errors)}
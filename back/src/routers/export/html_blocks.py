@@ -0,0 +1,184 @@
+# src/routers/export/html_blocks.py
+from __future__ import annotations
+import html
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional
+
+from lxml import etree
+
+# содержимое не текст — пропускаем целиком
+_SKIP = {"script", "style", "head", "title", "noscript", "template"}
+# блочные элементы: граница абзаца до и после
+_BLOCK = {"p", "div", "section", "article", "header", "footer", "blockquote", "pre", "hr",
+          "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "dl", "dt", "dd", "figure", "figcaption"}
+_CELL = {"td", "th"}
+# теги, на которые реагирует разбор; остальные (b, span, a, …) — только текст
+_EVENT_TAGS = _BLOCK | _CELL | {"li", "br", "img", "table", "tr", "tbody", "thead", "tfoot"}
+
+
+@dataclass
+class Block:
+    kind: str                                   # text | li | table | img
+    text: str = ""
+    rows: List[List[str]] = field(default_factory=list)   # для table
+    header: bool = False                        # первая строка таблицы из <th>
+    url: str = ""                               # для img
+
+
+class _Target:
+    """
+    Цель парсера lxml: libxml2 разбирает HTML и сразу зовёт start/end/data — дерево не строится,
+    весь разбор — один проход. Состояние: текущая строка, открытая таблица, картинки из ячеек.
+    """
+
+    def __init__(self):
+        self.blocks: List[Block] = []
+        self.line: List[str] = []
+        self.buf = self.line        # куда идёт текст: строка или ячейка таблицы
+        self.skip = 0               # глубина внутри script/style/…
+        self.li = 0                 # глубина <li>: строка уходит пунктом списка
+        self.table: Optional[Block] = None
+        self.nested = 0             # вложенные таблицы — плоским текстом в ячейку внешней
+        self.row: Optional[List[str]] = None
+        self.row_th = True
+        self.cell_imgs: List[str] = []
+
+    def data(self, s: str) -> None:
+        if not self.skip:
+            self.buf.append(s)
+
+    def flush(self) -> None:
+        if self.buf is not self.line:
+            self.buf.append("\n")
+            return
+        if not self.line:
+            return
+        s = " ".join("".join(self.line).split())
+        self.line.clear()
+        if s:
+            self.blocks.append(Block("li" if self.li else "text", s))
+
+    def start(self, tag: str, attrib) -> None:
+        if self.skip or tag in _SKIP:
+            self.skip += 1
+            return
+        if tag not in _EVENT_TAGS:
+            return
+        if self.table is not None:
+            if tag == "table":
+                self.nested += 1
+            elif tag == "img":
+                if attrib.get("src"):
+                    self.cell_imgs.append(attrib["src"])
+            elif self.nested:
+                if tag in _CELL:
+                    self.buf.append(" ")
+                elif tag == "br":
+                    self.flush()
+            elif tag == "tr":
+                self.row, self.row_th = [], True
+            elif tag in _CELL:
+                self.buf = []
+                self.row_th = self.row_th and tag == "th"
+            elif tag != "tbody" and tag != "thead" and tag != "tfoot":
+                self.flush()
+            return
+        if tag == "table":
+            self.flush()
+            self.table = Block("table")
+        elif tag == "img":
+            if attrib.get("src"):
+                self.flush()
+                self.blocks.append(Block("img", url=attrib["src"]))
+        else:
+            self.flush()
+            if tag == "li":
+                self.li += 1
+
+    def end(self, tag: str) -> None:
+        if self.skip:
+            self.skip -= 1
+            return
+        if tag not in _EVENT_TAGS:
+            return
+        if self.table is None:
+            if tag == "li":
+                self.flush()
+                self.li -= 1
+            elif tag in _BLOCK:
+                self.flush()
+            return
+        if tag == "table":
+            if self.nested:
+                self.nested -= 1
+                return
+            t, self.table = self.table, None
+            if t.rows:
+                self.blocks.append(t)
+            self.blocks.extend(Block("img", url=u) for u in self.cell_imgs)
+            self.cell_imgs = []
+        elif self.nested:
+            return
+        elif tag in _CELL and self.buf is not self.line:
+            if self.row is not None:
+                lines = (" ".join(ln.split()) for ln in "".join(self.buf).split("\n"))
+                self.row.append("\n".join(ln for ln in lines if ln))
+            self.buf = self.line
+        elif tag == "tr" and self.row is not None:
+            if any(self.row):
+                self.table.header = self.table.header or (not self.table.rows and self.row_th)
+                self.table.rows.append(self.row)
+            self.row = None
+
+    def close(self) -> List[Block]:
+        self.flush()
+        return self.blocks
+
+
+@lru_cache(maxsize=64)
+def parse_html(s: str) -> List[Block]:
+    """
+    HTML секции → блоки за один потоковый проход lxml (libxml2 → _Target, без дерева и регулярок):
+    абзацы текста, пункты списков, таблицы (строки ячеек) и картинки в порядке документа.
+    Результат кэшируется (одна и та же секция нужна и для списка картинок, и для DOCX) —
+    не изменять.
+    """
+    if not isinstance(s, str) or not s.strip():
+        return []
+    parser = etree.HTMLParser(target=_Target(), remove_comments=True, remove_pis=True, no_network=True)
+    parser.feed(s)
+    return parser.close()
+
+
+# плоский текст (поиск) — регулярками: в C, без вызова Python на каждый тег; в разы быстрее lxml
+_SCRIPT_STYLE_RE = re.compile(r"<\s*(script|style)\b[^>]*>.*?<\s*/\s*\1\s*>", re.I | re.S)
+_BREAK_RE        = re.compile(r"<\s*br\s*/?\s*>|</\s*(?:p|div|h[1-6]|tr|table|ul|ol|dd|dt|section|blockquote)\s*>", re.I)
+_LI_RE           = re.compile(r"<\s*li\b[^>]*>", re.I)
+_CELL_END_RE     = re.compile(r"</\s*t[dh]\s*>", re.I)
+_TAG_RE          = re.compile(r"<[^>]+>")
+
+
+def html_to_text(s: str) -> str:
+    """
+    Читаемый текст для индекса поиска: блок — строка, <li> — «• …», ячейки — через « | ».
+    Структура (таблицы, картинки) не нужна, поэтому без разбора — для DOCX см. parse_html.
+    """
+    if not isinstance(s, str) or not s.strip():
+        return ""
+    s = _SCRIPT_STYLE_RE.sub("", s)
+    s = _BREAK_RE.sub("\n", s)
+    s = _LI_RE.sub("\n• ", s)
+    s = _CELL_END_RE.sub(" | ", s)
+    s = html.unescape(_TAG_RE.sub("", s))
+    out = []
+    for ln in s.splitlines():
+        ln = " ".join(ln.split()).strip(" |")
+        if ln and ln != "•":
+            out.append(ln)
+    return "\n".join(out)
+
+
+def img_urls(s: str) -> List[str]:
+    return [b.url for b in parse_html(s) if b.kind == "img"]
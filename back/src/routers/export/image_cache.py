@@ -0,0 +1,191 @@
+# src/routers/export/image_cache.py
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+
+log = logging.getLogger("api")
+
+
+@dataclass
+class CachedImage:
+    body: bytes
+    meta: Dict[str, Any]   # ts, etag, last_modified (для url-записей)
+
+
+def url_key(url: str) -> str:
+    return "url:" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def svg_key(svg: bytes, width: int) -> str:
+    """Растр SVG адресуется содержимым: тот же SVG по другому URL — тот же PNG."""
+    return f"svg:{width}:" + hashlib.sha256(svg).hexdigest()
+
+
+class ImageCache:
+    """
+    Кэш картинок экспорта: LRU в памяти процесса + каталог на диске (общий для воркеров).
+      - url:<sha256(url)>         — готовые байты (PNG после растеризации) + ETag/Last-Modified;
+        моложе EXPORT_IMAGE_CACHE_TTL_SEC — без сети, старше — условный GET (304 → берём из кэша);
+      - svg:<width>:<sha256(svg)> — результат cairosvg, сеть тут ни при чём.
+    Оба уровня ограничены по байтам; на диске вытесняются файлы с самым старым mtime
+    (попадание обновляет mtime).
+    Формат файла: строка JSON-метаданных, \\n, тело.
+    """
+
+    def __init__(self, root: Path, mem_bytes: int, disk_bytes: int):
+        self.root = root
+        self._mem_max = max(1, mem_bytes)
+        self._disk_max = max(1, disk_bytes)
+        self._lru: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._mem = 0
+        self._disk: Optional[int] = None   # считаем лениво, при первой записи
+        self._lock = threading.Lock()
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "stores": 0,
+                       "evictions_memory": 0, "evictions_disk": 0, "disk_errors": 0,
+                       # что сэкономлено/сделано на стороне экспорта (см. routes._fetch_image)
+                       "downloads": 0, "revalidated": 0, "rasterized": 0, "raster_hits": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def note(self, name: str) -> None:
+        """Счётчики вызывающего: downloads / revalidated / rasterized / raster_hits."""
+        self._count(name)
+
+    def _path(self, key: str) -> Path:
+        h = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.root / h[:2] / h
+
+    # ---------- память ----------
+    def _put_local(self, key: str, item: CachedImage) -> None:
+        size = len(item.body)
+        if size > self._mem_max:
+            return
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old:
+                self._mem -= len(old.body)
+            self._lru[key] = item
+            self._mem += size
+            while self._mem > self._mem_max:
+                _k, ev = self._lru.popitem(last=False)
+                self._mem -= len(ev.body)
+                self._stats["evictions_memory"] += 1
+
+    # ---------- API ----------
+    def get(self, key: str) -> Optional[Tuple[CachedImage, str]]:
+        """(запись, уровень: memory|disk) или None."""
+        with self._lock:
+            item = self._lru.get(key)
+            if item is not None:
+                self._lru.move_to_end(key)
+                self._stats["hits_memory"] += 1
+                return item, "memory"
+
+        p = self._path(key)
+        try:
+            raw = p.read_bytes()
+            head, _, body = raw.partition(b"\n")
+            item = CachedImage(body, json.loads(head))
+            os.utime(p)  # LRU на диске — по mtime
+        except FileNotFoundError:
+            item = None
+        except Exception as e:
+            self._count("disk_errors")
+            log.debug("image cache read %s: %r", p, e)
+            item = None
+        if item is None:
+            self._count("misses")
+            return None
+        self._put_local(key, item)
+        self._count("hits_disk")
+        return item, "disk"
+
+    def set(self, key: str, body: bytes, **meta: Any) -> None:
+        item = CachedImage(body, {"ts": time.time(), **meta})
+        self._put_local(key, item)
+        self._count("stores")
+        p = self._path(key)
+        # свой временный файл на каждую запись: один ключ могут писать несколько потоков сразу
+        tmp = p.with_name(f".{p.name}.{uuid.uuid4().hex}.tmp")
+        data = json.dumps(item.meta, separators=(",", ":")).encode("utf-8") + b"\n" + body
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(data)
+            try:
+                old = p.stat().st_size  # перезапись (touch, повторная загрузка) — размер не растёт
+            except OSError:
+                old = 0
+            os.replace(tmp, p)
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            self._count("disk_errors")
+            log.debug("image cache write %s: %r", p, e)
+            return
+        with self._lock:
+            if self._disk is not None:
+                self._disk += len(data) - old
+            over = self._disk is None or self._disk > self._disk_max
+        if over:
+            self._evict_disk()
+
+    def touch(self, key: str, item: CachedImage) -> None:
+        """Повторная проверка (304) прошла — запись снова свежая."""
+        self.set(key, item.body, **{**item.meta, "ts": time.time()})
+
+    def fresh(self, item: CachedImage) -> bool:
+        return time.time() - float(item.meta.get("ts") or 0) < settings.EXPORT_IMAGE_CACHE_TTL_SEC
+
+    def _evict_disk(self) -> None:
+        """Пересчёт размера каталога; если больше лимита — удаляем старые файлы до 90% лимита."""
+        files = []
+        total = 0
+        for p in self.root.glob("*/*"):
+            if p.name.startswith("."):
+                continue  # .tmp другого потока — ещё пишется, удалит/переименует он сам
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        if total > self._disk_max:
+            files.sort()
+            target = self._disk_max * 0.9
+            for _mt, size, p in files:
+                if total <= target:
+                    break
+                try:
+                    p.unlink()
+                except OSError:
+                    continue
+                total -= size
+                self._count("evictions_disk")
+        with self._lock:
+            self._disk = total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._stats)
+            st.update({"items_memory": len(self._lru), "bytes_memory": self._mem, "bytes_disk": self._disk})
+        hits = st["hits_memory"] + st["hits_disk"]
+        total = hits + st["misses"]
+        st["hit_ratio"] = round(hits / total, 3) if total else None
+        return st
+
+
+image_cache = ImageCache(Path(settings.OUT_DIR) / "image_cache",
+                         settings.EXPORT_IMAGE_CACHE_MEM_MB * 1024 * 1024,
+                         settings.EXPORT_IMAGE_CACHE_DISK_MB * 1024 * 1024)
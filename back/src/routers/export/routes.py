@@ -1,11 +1,19 @@
 # src/routers/export/routes.py
 from __future__ import annotations
-from flask import Blueprint, request, send_file, jsonify
+from flask import Blueprint, Response, request, send_file, jsonify
 from io import BytesIO
 from datetime import datetime
-import re
-import html
-import httpx
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from typing import Callable, Optional
+import logging
+import time
+
+from config import settings
+from src.routers.dms.services import get_client
+from .image_cache import image_cache, url_key, svg_key
+from .html_blocks import Block, parse_html, img_urls
+from src.jobs.export import submit_export, submit_bulk_export, job_status, cancel_job, result_path
+from .bulk import iter_zip
 
 from docx import Document
 from docx.shared import Inches, Pt
@@ -13,6 +21,7 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
 
 bp = Blueprint("export", __name__, url_prefix="/export")
+log = logging.getLogger("api")
 
 # ---------- SVG support (optional via cairosvg) ----------
 try:
@@ -41,92 +50,120 @@ def _is_svg_by_url_or_ct(url: str, ctype: str | None) -> bool:
             return True
     return False
 
-def _svg_to_png_bytes(svg_bytes: bytes) -> bytes:
-    """SVG → PNG. Если cairosvg недоступен, вернём исходник (Word не вставит SVG)."""
+def _svg_to_png_bytes(svg_bytes: bytes, width: int = 1600) -> bytes:
+    """
+    SVG → PNG. Если cairosvg недоступен, вернём исходник (Word не вставит SVG).
+    Результат кэшируется по хэшу содержимого SVG и ширине.
+    """
     if not _HAVE_CAIROSVG:
         return svg_bytes
+    use_cache = settings.EXPORT_IMAGE_CACHE_ENABLED
+    key = svg_key(svg_bytes, width)
+    if use_cache:
+        hit = image_cache.get(key)
+        if hit:
+            image_cache.note("raster_hits")
+            return hit[0].body
     try:
         # Ширина PNG — чтобы влезало в страницу; при необходимости подстрой.
-        return cairosvg.svg2png(bytestring=svg_bytes, unsafe=True, output_width=1600)
+        png = cairosvg.svg2png(bytestring=svg_bytes, unsafe=True, output_width=width)
     except Exception:
         return svg_bytes
+    image_cache.note("rasterized")
+    if use_cache:
+        image_cache.set(key, png)
+    return png
 
-# -------- utils: sanitize / parse --------
-_SCRIPT_TAG_RE = re.compile(r"<\s*script\b[^>]*>(.*?)<\s*/\s*script\s*>", re.I | re.S)
-_STYLE_TAG_RE  = re.compile(r"<\s*style\b[^>]*>(.*?)<\s*/\s*style\s*>", re.I | re.S)
-_TAG_RE        = re.compile(r"<[^>]+>")
-_BR_RE         = re.compile(r"<\s*br\s*/?\s*>", re.I)
-_LI_RE         = re.compile(r"<\s*li\b[^>]*>", re.I)
-_ENDLI_RE      = re.compile(r"</\s*li\s*>", re.I)
-_P_RE          = re.compile(r"</\s*p\s*>", re.I)
-
-_IMG_RE        = re.compile(r"<img[^>]+src=['\"]([^'\" >]+)['\"][^>]*>", re.I)
-
-def _strip_html_to_text(s: str) -> str:
+# -------- utils: images --------
+def _fetch_image(url: str, timeout: float = 20.0) -> bytes | None:
     """
-    Очень простая конверсия HTML → читаемый текст:
-    <br> → \\n, </p> → \\n\\n, <li> → "• ", </li> → \\n, остальное удаляем.
+    Скачивает ресурс через общий пул соединений (services.get_client).
+    Если это SVG — конвертирует в PNG. Возвращает байты для docx.add_picture().
+    Готовый результат кэшируется по URL: свежий — без сети, устаревший — условный GET по ETag.
     """
-    if not isinstance(s, str) or not s.strip():
-        return ""
-
-    s = _SCRIPT_TAG_RE.sub("", s)
-    s = _STYLE_TAG_RE.sub("", s)
-
-    s = _BR_RE.sub("\n", s)
-    s = _P_RE.sub("\n\n", s)
-    s = _LI_RE.sub("• ", s)
-    s = _ENDLI_RE.sub("\n", s)
-
-    # убираем остальные теги
-    s = _TAG_RE.sub("", s)
-    # html entity → текст
-    s = html.unescape(s)
-    # прибираем чуть-чуть пустых строк
-    lines = [ln.rstrip() for ln in s.splitlines()]
-    out = []
-    last_empty = False
-    for ln in lines:
-        if ln.strip():
-            out.append(ln)
-            last_empty = False
-        else:
-            if not last_empty:
-                out.append("")
-            last_empty = True
-    return "\n".join(out).strip()
-
-def _extract_img_urls(s: str) -> list[str]:
-    if not isinstance(s, str):
-        return []
-    return _IMG_RE.findall(s) or []
-
-def _fetch_image(url: str, timeout: float = 20.0) -> BytesIO | None:
+    use_cache = settings.EXPORT_IMAGE_CACHE_ENABLED
+    key = url_key(url)
+    hit = image_cache.get(key) if use_cache else None
+    if hit and image_cache.fresh(hit[0]):
+        return hit[0].body
+    headers = {}
+    if hit:
+        if hit[0].meta.get("etag"):
+            headers["If-None-Match"] = hit[0].meta["etag"]
+        if hit[0].meta.get("last_modified"):
+            headers["If-Modified-Since"] = hit[0].meta["last_modified"]
+    try:
+        r = get_client().get(url, headers=headers, timeout=timeout, follow_redirects=True)
+        if r.status_code == 304 and hit:
+            image_cache.note("revalidated")
+            image_cache.touch(key, hit[0])
+            return hit[0].body
+        if r.status_code != 200:
+            # источник недоступен — лучше устаревшая картинка, чем никакой
+            return hit[0].body if hit else None
+        image_cache.note("downloads")
+        ctype = (r.headers.get("content-type") or "").lower()
+        content = r.content or b""
+
+        # SVG? Иначе — принимаем как есть (jpeg/png/gif/webp/…)
+        if _is_svg_by_url_or_ct(url, ctype) or _looks_like_svg_bytes(content):
+            content = _svg_to_png_bytes(content)
+        if use_cache and content:
+            image_cache.set(key, content, etag=r.headers.get("etag"),
+                            last_modified=r.headers.get("last-modified"))
+        return content
+    except Exception:
+        return hit[0].body if hit else None
+
+_image_pool = ThreadPoolExecutor(max_workers=settings.EXPORT_IMAGE_WORKERS,
+                                 thread_name_prefix="export-img")
+
+# прогресс сборки документа: (этап, сделано, всего)
+Progress = Optional[Callable[[str, int, int], None]]
+
+def _fetch_images(urls: list[str], deadline_sec: float, progress: Progress = None) -> dict[str, bytes]:
     """
-    Скачивает ресурс. Если это SVG — конвертирует в PNG.
-    Возвращает BytesIO, готовый для docx.add_picture().
+    Все картинки документа параллельно, с общим дедлайном: не успевшие — пропускаются
+    (и снимаются с очереди пула, если ещё не начались).
     """
+    if not urls:
+        return {}
+    t0 = time.monotonic()
+    end = t0 + deadline_sec
+
+    def one(u: str) -> bytes | None:
+        left = end - time.monotonic()
+        if left <= 0:
+            return None
+        return _fetch_image(u, timeout=min(settings.EXPORT_IMAGE_TIMEOUT_SEC, left))
+
+    futures = {_image_pool.submit(one, u): u for u in urls}
+    done = set()
     try:
-        with httpx.Client(timeout=timeout, follow_redirects=True) as cl:
-            r = cl.get(url)
-            if r.status_code != 200:
-                return None
-            ctype = (r.headers.get("content-type") or "").lower()
-            content = r.content or b""
-
-            # SVG?
-            if _is_svg_by_url_or_ct(url, ctype) or _looks_like_svg_bytes(content):
-                png = _svg_to_png_bytes(content)
-                bio = BytesIO(png)
-                bio.seek(0)
-                return bio
-
-            # Иначе — принимаем как есть (jpeg/png/gif/webp/…)
-            bio = BytesIO(content)
-            bio.seek(0)
-            return bio
-    except Exception:
-        return None
+        for f in as_completed(futures, timeout=deadline_sec):
+            done.add(f)
+            if progress:
+                progress("images", len(done), len(futures))
+    except FutureTimeout:
+        pass
+    pending = [f for f in futures if f not in done]
+    for f in pending:
+        f.cancel()
+    out = {futures[f]: f.result() for f in done if f.result()}
+    log.debug("export images: %s/%s in %.0f ms (late %s)",
+              len(out), len(urls), (time.monotonic() - t0) * 1000.0, len(pending))
+    return out
+
+def _collect_image_urls(payload: dict) -> list[str]:
+    """URL всех картинок документа (explosive + из HTML секций), без дублей, в порядке появления."""
+    urls = []
+    image_url = payload.get("imageUrl") or payload.get("image_url")
+    if image_url:
+        urls.append(image_url)
+    sections = payload.get("sections") or {}
+    for key, _title in SECTIONS:
+        urls.extend(img_urls(sections.get(key) or "")[:settings.EXPORT_IMAGES_PER_SECTION])
+    return list(dict.fromkeys(urls))
 
 # -------- DOCX builder --------
 def _apply_base_styles(doc: Document):
@@ -163,32 +200,80 @@ def _add_kv_table(doc: Document, data: list[tuple[str, str]]):
         row.cells[0].text = k
         row.cells[1].text = v or "—"
 
-def _add_section(doc: Document, title: str, body_html: str):
+def _add_picture(doc: Document, data: bytes, width) -> bool:
+    try:
+        doc.add_picture(BytesIO(data), width=width)
+        return True
+    except Exception:
+        # неподдерживаемый формат — пропустим
+        return False
+
+# стили по id: присваивание по имени python-docx каждый раз сверяет со стилем по умолчанию —
+# на сотнях таблиц/пунктов списка это дороже самого разбора HTML
+_TABLE_STYLE_ID = "TableGrid"    # «Table Grid»
+_BULLET_STYLE_ID = "ListBullet"  # «List Bullet»
+
+def _add_html_table(doc: Document, t: Block):
+    cols = max(len(r) for r in t.rows)
+    tbl = doc.add_table(rows=len(t.rows), cols=cols)
+    tbl._tbl.tblPr.style = _TABLE_STYLE_ID
+    cells = tbl._cells
+    for i, r in enumerate(t.rows):
+        for j, v in enumerate(r):
+            run = cells[i * cols + j].paragraphs[0].add_run(v)
+            if i == 0 and t.header:
+                run.bold = True
+
+def _add_section(doc: Document, title: str, body_html: str, images: dict[str, bytes]):
     doc.add_paragraph().add_run()  # небольшой отступ
     p = doc.add_paragraph()
     r = p.add_run(title)
     r.bold = True
     p.style = "Heading2Custom"
 
-    text = _strip_html_to_text(body_html or "")
-    if text:
-        for part in text.split("\n"):
-            doc.add_paragraph(part)
-    else:
+    blocks = parse_html(body_html or "")
+    if not any(b.kind != "img" for b in blocks):
         doc.add_paragraph("(нет данных)").italic = True
 
-    # Вставим картинки из HTML, если есть
-    urls = _extract_img_urls(body_html or "")
-    for u in urls[:6]:  # ограничимся, чтобы не раздуть документ
-        bio = _fetch_image(u)
-        if bio:
-            try:
-                doc.add_picture(bio, width=Inches(5.5))
-            except Exception:
-                # неподдерживаемый формат — пропустим
-                pass
-
-def _build_docx(payload: dict) -> BytesIO:
+    # блоки — в порядке HTML: картинки там, где стояли, таблицы — таблицами Word
+    n_img = 0
+    for b in blocks:
+        if b.kind == "text":
+            doc.add_paragraph(b.text)
+        elif b.kind == "li":
+            doc.add_paragraph(b.text)._p.get_or_add_pPr().style = _BULLET_STYLE_ID
+        elif b.kind == "table":
+            _add_html_table(doc, b)
+        elif n_img < settings.EXPORT_IMAGES_PER_SECTION:  # ограничимся, чтобы не раздуть документ
+            n_img += 1
+            if images.get(b.url):
+                _add_picture(doc, images[b.url], Inches(5.5))
+
+# секции документа: ключ в payload.sections → заголовок
+SECTIONS = (
+    ("functionDesc", "Описание функции"),
+    ("technical",    "Технические данные"),
+    ("circuit",      "Электрическая схема"),
+    ("steps",        "Шаги разборки и сборки"),
+    ("part",         "Информация о деталях"),
+)
+
+def _build_docx(payload: dict, progress: Progress = None) -> BytesIO:
+    # Все картинки — заранее и параллельно; документ собираем, когда скачано всё (или вышел дедлайн)
+    images = _fetch_images(_collect_image_urls(payload), settings.EXPORT_IMAGES_DEADLINE_SEC, progress)
+
+    # Создаём документ
+    doc = Document()
+    _apply_base_styles(doc)
+    _fill_doc(doc, payload, images, progress)
+
+    buf = BytesIO()
+    doc.save(buf)
+    buf.seek(0)
+    return buf
+
+def _fill_doc(doc: Document, payload: dict, images: dict[str, bytes], progress: Progress = None):
+    """Содержимое документа по одной детали; картинки уже скачаны (images: url → байты)."""
     code = (payload.get("code") or "").strip()
     model = payload.get("model") or {}
     header = payload.get("header") or {}
@@ -203,10 +288,6 @@ def _build_docx(payload: dict) -> BytesIO:
     torque     = str(header.get("torque") or "")
     torque_deg = str(header.get("torqueDegree") or "")
 
-    # Создаём документ
-    doc = Document()
-    _apply_base_styles(doc)
-
     _add_title(doc, "Документация по детали")
 
     # «чипы» — представим в одну строку
@@ -225,31 +306,29 @@ def _build_docx(payload: dict) -> BytesIO:
     ])
 
     # Общая картинка узла (explosive)
-    if image_url:
-        bio = _fetch_image(image_url)
-        if bio:
-            doc.add_paragraph()
-            doc.add_paragraph("Изображение")
-            try:
-                doc.add_picture(bio, width=Inches(6.2))
-            except Exception:
-                doc.add_paragraph("(не удалось вставить изображение)").italic = True
+    if image_url and images.get(image_url):
+        doc.add_paragraph()
+        doc.add_paragraph("Изображение")
+        if not _add_picture(doc, images[image_url], Inches(6.2)):
+            doc.add_paragraph("(не удалось вставить изображение)").italic = True
 
     # Секции
-    _add_section(doc, "Описание функции",      sections.get("functionDesc"))
-    _add_section(doc, "Технические данные",    sections.get("technical"))
-    _add_section(doc, "Электрическая схема",   sections.get("circuit"))
-    _add_section(doc, "Шаги разборки и сборки", sections.get("steps"))
-    _add_section(doc, "Информация о деталях",  sections.get("part"))
+    for i, (key, title) in enumerate(SECTIONS, 1):
+        _add_section(doc, title, sections.get(key), images)
+        if progress:
+            progress("sections", i, len(SECTIONS))
 
     # футер-пометка
     doc.add_paragraph()
     doc.add_paragraph(f"Сформировано автоматически · {datetime.now().strftime('%Y-%m-%d %H:%M')}")
 
-    buf = BytesIO()
-    doc.save(buf)
-    buf.seek(0)
-    return buf
+def export_filename(payload: dict) -> str:
+    code = (payload.get("code") or "").strip()
+    base = ((payload.get("header") or {}).get("materialCode") or code or "document").strip().replace("/", "-")
+    stamp = datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S")
+    return f"{base}_{stamp}.docx"
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
 # -------- route --------
 @bp.post("/part")
@@ -280,16 +359,95 @@ def export_part_docx():
     except Exception as e:
         return jsonify({"ok": False, "error": f"docx build error: {e}"}), 500
 
-    base = (js.get("header", {}).get("materialCode") or code or "document").strip().replace("/", "-")
-    stamp = datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S")
-    filename = f"{base}_{stamp}.docx"
-
     return send_file(
         buf,
-        mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        mimetype=DOCX_MIME,
         as_attachment=True,
-        download_name=filename,
+        download_name=export_filename(js),
         max_age=0,
         conditional=False,
         etag=False
     )
+
+# -------- фоновые задачи экспорта --------
+@bp.post("/jobs")
+def export_job_create():
+    """
+    Тот же вход, что у /export/part, но документ собирается в фоне (rq-очередь «export»,
+    без Redis — поток этого процесса). Ответ 202: {"ok", "job_id", "status_url"}.
+    """
+    js = request.get_json(silent=True) or {}
+    if not (js.get("code") or "").strip():
+        return jsonify({"ok": False, "error": "code is required"}), 400
+    job = submit_export(js)
+    return jsonify({"ok": True, **job, "status_url": f"/export/jobs/{job['job_id']}"}), 202
+
+@bp.get("/jobs/<job_id>")
+def export_job_get(job_id: str):
+    """Статус: queued|started|finished|failed, прогресс {"stage", "done", "total"}, ссылка на файл."""
+    st = job_status(job_id)
+    if st is None:
+        return jsonify({"ok": False, "error": "job not found"}), 404
+    out = {"ok": True, "job_id": job_id, **st}
+    if st["status"] == "finished":
+        out["download_url"] = f"/export/jobs/{job_id}/file"
+    return jsonify(out)
+
+@bp.delete("/jobs/<job_id>")
+def export_job_cancel(job_id: str):
+    """Отмена: из очереди снимается, собираемая — останавливается. {"ok", "canceled", "status"}."""
+    res = cancel_job(job_id)
+    if res is None:
+        return jsonify({"ok": False, "error": "job not found"}), 404
+    return jsonify({"ok": True, "job_id": job_id, **res})
+
+@bp.get("/jobs/<job_id>/file")
+def export_job_file(job_id: str):
+    st = job_status(job_id)
+    path = result_path(job_id)
+    if not st or st["status"] != "finished" or not path.is_file():
+        return jsonify({"ok": False, "error": "result not ready"}), 404
+    return send_file(
+        path,
+        mimetype=DOCX_MIME,
+        as_attachment=True,
+        download_name=(st.get("result") or {}).get("filename") or path.name,
+        max_age=0,
+    )
+
+# -------- массовый экспорт --------
+@bp.post("/bulk")
+def export_bulk():
+    """
+    Несколько узлов за раз; секции берутся из DMS на сервере (как /api/node_bundle).
+    Вход: {"codes": ["STRUCTURE_CODE", ...], "model": {"label": ...}, "format": "zip" | "docx"}
+      zip  — архив из DOCX по каждому узлу, отдаётся потоком по мере сборки узлов (по умолчанию);
+      docx — один документ на все узлы (не больше EXPORT_BULK_DOCX_MAX_CODES): фоновая задача,
+             ответ 202 как у /export/jobs, файл — /export/jobs/<id>/file.
+    """
+    js = request.get_json(silent=True) or {}
+    raw = js.get("codes")
+    if not isinstance(raw, list):
+        return jsonify({"ok": False, "error": "codes must be a list"}), 400
+    codes = list(dict.fromkeys(str(c).strip() for c in raw if str(c or "").strip()))
+    if not codes:
+        return jsonify({"ok": False, "error": "codes is required"}), 400
+    fmt = (js.get("format") or "zip").lower()
+    if fmt not in ("zip", "docx"):
+        return jsonify({"ok": False, "error": "format must be zip or docx"}), 400
+    limit = settings.EXPORT_BULK_MAX_CODES if fmt == "zip" else settings.EXPORT_BULK_DOCX_MAX_CODES
+    if len(codes) > limit:
+        return jsonify({"ok": False, "error": f"too many codes (max {limit} for {fmt})"}), 400
+    model = js.get("model") if isinstance(js.get("model"), dict) else {}
+
+    if fmt == "docx":
+        job = submit_bulk_export(codes, model)
+        return jsonify({"ok": True, **job, "status_url": f"/export/jobs/{job['job_id']}"}), 202
+
+    stamp = datetime.utcnow().strftime("%Y-%m-%d-%H-%M-%S")
+    headers = {
+        "Content-Disposition": f'attachment; filename="bulk_{len(codes)}_{stamp}.zip"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",  # nginx: не копить ответ, отдавать по мере готовности
+    }
+    return Response(iter_zip(codes, model), mimetype="application/zip", headers=headers, direct_passthrough=True)
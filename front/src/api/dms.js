@@ -9,6 +9,14 @@ const API = {
   explosive: (code) => apiFetch(`/api/explosive?code=${encodeURIComponent(code)}`),
   technical: (code) => apiFetch(`/api/technical?code=${encodeURIComponent(code)}`),
   functionDesc: (code) => apiFetch(`/api/function_desc?code=${encodeURIComponent(code)}`),
+  // все секции узла одним запросом (бэкенд запрашивает их параллельно)
+  nodeBundle: (code, sections = []) =>
+    apiFetch(
+      `/api/node_bundle?code=${encodeURIComponent(code)}` +
+        (sections.length ? `&sections=${encodeURIComponent(sections.join(","))}` : "")
+    ),
+  // полнотекстовый поиск по деталям/процедурам/техданным
+  search: (q, limit = 20) => apiFetch(`/api/search?q=${encodeURIComponent(q)}&limit=${limit}`),
 
   circuit: (code) => apiFetch(`/api/circuit?code=${encodeURIComponent(code)}`),
   circuitHot: (circuitId) => apiFetch(`/api/circuit_hot?circuitId=${encodeURIComponent(circuitId)}`),
@@ -1,35 +1,115 @@
 // src/api/export.js
 import { getBaseUrl, getAuthHeaders } from "./client.js";
 
-/**
- * Экспорт «Документа детали» (пример POST JSON -> Blob)
- * @param {object} payload - данные для экспорта
- * @returns {Promise<Blob>}
- */
-export async function exportPartDoc(payload) {
-  const url = `${getBaseUrl()}/export/part`;
+const POLL_MS = 1000;
+// общий предел ожидания (сервер убивает задачу через EXPORT_JOB_TIMEOUT_SEC = 900 с)
+const JOB_DEADLINE_MS = 16 * 60 * 1000;
+// задача так и стоит в очереди (воркер rq не запущен) — собираем синхронно через /export/part
+const QUEUED_FALLBACK_MS = 20 * 1000;
+// статусы rq, при которых задача ещё может завершиться; всё остальное — конец
+const ACTIVE = new Set(["queued", "started", "deferred", "scheduled"]);
 
+async function errorOf(res) {
+  let msg = `HTTP ${res.status}`;
+  try {
+    const j = await res.json();
+    if (j?.error) msg = j.error;
+  } catch {
+    // игнорируем parse error, оставляем msg как есть
+  }
+  return new Error(msg);
+}
+
+async function exportPartSync(base, payload) {
+  const res = await postJson(base, "/export/part", payload);
+  if (!res.ok) throw await errorOf(res);
+  return await res.blob();
+}
+
+async function postJson(base, path, body) {
   // ВАЖНО: передаём именно экземпляр Headers, а не распыляем его в объект
   const headers = getAuthHeaders();
   headers.set("content-type", "application/json");
-
-  const res = await fetch(url, {
+  return await fetch(`${base}${path}`, {
     method: "POST",
     headers,
-    body: JSON.stringify(payload),
+    body: JSON.stringify(body),
+    credentials: "include",
+  });
+}
+
+// снять задачу с очереди; true — снята (воркер её так и не взял)
+async function cancelJob(base, status_url) {
+  const res = await fetch(`${base}${status_url}`, {
+    method: "DELETE",
+    headers: getAuthHeaders(),
     credentials: "include",
   });
+  if (!res.ok) return false;
+  const j = await res.json();
+  return !!j.canceled;
+}
 
-  if (!res.ok) {
-    let msg = `HTTP ${res.status}`;
-    try {
-      const j = await res.json();
-      if (j?.error) msg = j.error;
-    } catch {
-      // игнорируем parse error, оставляем msg как есть
+/**
+ * Опрос задачи экспорта до готовности и скачивание файла.
+ * Если задачу никто не взял за QUEUED_FALLBACK_MS — снимаем её (DELETE) и вызываем onQueued
+ * (его результат и вернём); без onQueued — ошибка «нет воркера экспорта».
+ */
+async function waitJob(base, status_url, onProgress, onQueued) {
+  const started = Date.now();
+  while (Date.now() - started < JOB_DEADLINE_MS) {
+    await new Promise((r) => setTimeout(r, POLL_MS));
+    const st = await fetch(`${base}${status_url}`, { headers: getAuthHeaders(), credentials: "include" });
+    if (!st.ok) throw await errorOf(st);
+    const j = await st.json();
+    if (j.progress && onProgress) onProgress(j.progress);
+    if (j.status === "finished") {
+      const file = await fetch(`${base}${j.download_url}`, { headers: getAuthHeaders(), credentials: "include" });
+      if (!file.ok) throw await errorOf(file);
+      return await file.blob();
+    }
+    if (!ACTIVE.has(j.status)) throw new Error(j.error || `export ${j.status || "failed"}`);
+    if (j.status === "queued" && Date.now() - started > QUEUED_FALLBACK_MS) {
+      // не снялась — воркер взял её только что, продолжаем ждать
+      if (await cancelJob(base, status_url)) {
+        if (onQueued) return await onQueued();
+        throw new Error("no export worker is running");
+      }
     }
-    throw new Error(msg);
   }
+  throw new Error("export timed out");
+}
 
-  return await res.blob();
+/**
+ * Экспорт «Документа детали»: задача на сервере (POST /export/jobs),
+ * опрос статуса до готовности и скачивание файла. Если задачу никто не взял
+ * за QUEUED_FALLBACK_MS — она снимается с очереди и документ собирается синхронно (/export/part).
+ * @param {object} payload - данные для экспорта
+ * @param {(p: {stage: string, done: number, total: number}) => void} [onProgress]
+ * @returns {Promise<Blob>}
+ */
+export async function exportPartDoc(payload, onProgress) {
+  const base = getBaseUrl();
+  const res = await postJson(base, "/export/jobs", payload);
+  if (!res.ok) throw await errorOf(res);
+  const { status_url } = await res.json();
+  return await waitJob(base, status_url, onProgress, () => exportPartSync(base, payload));
+}
+
+/**
+ * Массовый экспорт: секции узлов сервер берёт из DMS сам (POST /export/bulk).
+ * ZIP приходит потоком в ответе; общий DOCX собирается фоновой задачей (202 + опрос, как у детали).
+ * @param {string[]} codes - коды структур
+ * @param {object} [model] - { label, ... }
+ * @param {"zip"|"docx"} [format] - ZIP из DOCX по узлам или один общий DOCX
+ * @param {(p: {stage: string, done: number, total: number}) => void} [onProgress] - только для docx
+ * @returns {Promise<Blob>}
+ */
+export async function exportBulk(codes, model = {}, format = "zip", onProgress) {
+  const base = getBaseUrl();
+  const res = await postJson(base, "/export/bulk", { codes, model, format });
+  if (!res.ok) throw await errorOf(res);
+  if (res.status !== 202) return await res.blob();
+  const { status_url } = await res.json();
+  return await waitJob(base, status_url, onProgress);
 }
@@ -68,6 +68,9 @@ export default function Viewer() {
   const [imageCache, setImageCache] = useState({});
   const imageBlockRef = useRef(null);
 
+  // секции открытого узла одним запросом /api/node_bundle: { code, sections }
+  const bundleRef = useRef(null);
+
   // интерактив по картинкам в правой HTML-панели (лайтбокс)
   const contentRef = useRef(null);
   const [lbOpen, setLbOpen] = useState(false);
@@ -111,6 +114,7 @@ export default function Viewer() {
     setInfoHtml(<div className="text-slate-500">{msg}</div>);
     setImageHtml(null);
     setImageCache({});
+    bundleRef.current = null;
     setAvail({ img: true, fdesc: false, tech: false, circuit: false, steps: false });
   }
 
@@ -290,8 +294,14 @@ export default function Viewer() {
 
     const code = it.structureCode;
 
+    // 0) секции узла одним запросом (бэкенд запрашивает их параллельно); вкладки берут данные отсюда
+    const wanted = ["structure_get", "function_desc", "technical", "part_detail"];
+    if (imageCache[code] === undefined) wanted.push("explosive");
+    const bundle = await API.nodeBundle(code, wanted).catch(() => null);
+    bundleRef.current = { code, sections: bundle?.sections || {} };
+
     // 1) шапка
-    const struct = await API.structureGet(code);
+    const struct = await sectionOf(code, "structure_get", API.structureGet);
     setHead(extractHeader(struct, it));
 
     // 2) флаги доступности
@@ -330,7 +340,7 @@ export default function Viewer() {
       );
     } else {
       try {
-        const expl = await API.explosive(code).catch(() => null);
+        const expl = await sectionOf(code, "explosive", (c) => API.explosive(c).catch(() => null));
         const payload = getExplosivePayload(expl || {});
         setImageCache((prev) => ({ ...prev, [code]: payload || null }));
         setImageHtml(
@@ -366,6 +376,14 @@ export default function Viewer() {
     );
   }
 
+  // секция из пакета открытого узла; нет в пакете (или ошибка) — отдельный запрос, как раньше
+  async function sectionOf(code, name, load) {
+    const b = bundleRef.current;
+    const s = b?.code === code ? b.sections[name] : undefined;
+    if (s?.ok) return s.data;
+    return await load(code);
+  }
+
   const selectedModelLabel = useMemo(() => {
     const m = models.find((x) => x.value === currentSub);
     return m ? m.label : "";
@@ -413,19 +431,20 @@ export default function Viewer() {
       );
 
       try {
-        const [struct, tech, steps, part, circuit, fdesc, imgUrl] = await Promise.all([
-          API.structureGet(code).catch(() => null),
-          API.technical(code).catch(() => null),
-          API.destuffing(code).catch(() => null),
-          API.partDetail(code).catch(() => null),
-          API.circuit(code).catch(() => null),
-          API.functionDesc(code).catch(() => null),
-          (async () => {
-            const e = await API.explosive(code).catch(() => null);
-            const p = getExplosivePayload(e || {});
-            return p?.url || "";
-          })(),
-        ]);
+        // уже загруженные при открытии узла секции не запрашиваем повторно
+        const have = bundleRef.current?.code === code ? bundleRef.current.sections : {};
+        const missing = ["structure_get", "explosive", "technical", "function_desc", "circuit", "destuffing", "part_detail"]
+          .filter((n) => !have[n]?.ok);
+        const bundle = missing.length ? await API.nodeBundle(code, missing).catch(() => null) : null;
+        const all = { ...have, ...(bundle?.sections || {}) };
+        const sec = (name) => (all[name]?.ok ? all[name].data : null);
+        const struct = sec("structure_get");
+        const tech = sec("technical");
+        const steps = sec("destuffing");
+        const part = sec("part_detail");
+        const circuit = sec("circuit");
+        const fdesc = sec("function_desc");
+        const imgUrl = getExplosivePayload(sec("explosive") || {})?.url || "";
 
         const header = extractHeader(struct || {}, selected?.item || {});
         const payload = {
@@ -480,13 +499,13 @@ export default function Viewer() {
     try {
       let resp, html = "";
       if (tab === "fdesc") {
-        resp = await API.functionDesc(code);
+        resp = await sectionOf(code, "function_desc", API.functionDesc);
         html = formatFunctionDesc(resp);
       } else if (tab === "tech") {
-        resp = await API.technical(code);
+        resp = await sectionOf(code, "technical", API.technical);
         html = formatTechnical(resp);
       } else if (tab === "part") {
-        resp = await API.partDetail(code);
+        resp = await sectionOf(code, "part_detail", API.partDetail);
         html = formatPartDetail(resp);
       }
 
@@ -139,7 +139,7 @@ export default function SystemTab(){
         </div>
 
         <div className="text-sm text-slate-600 mb-2">
-          Статус: {status ? (status.running ? "запущен" : "остановлен") : "…"} ·
+          Статус: {status ? (status.leader === false ? `в другом воркере (pid ${status.pid} — не лидер)` : status.running ? "запущен" : "остановлен") : "…"} ·
           <span className="ml-1">bearer: {bearer?.have ? (bearerMasked || "есть") : "нет"}</span>
           {status?.bearer_exp && (
             <span className="ml-1">· exp: {new Date(status.bearer_exp*1000).toLocaleString()}</span>